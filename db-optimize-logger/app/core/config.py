@@ -1,3 +1,5 @@
+import os
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -11,5 +13,52 @@ class Settings(BaseSettings):
 
     LOKI_CONFIG_HOST_PATH: str
 
+    # Max explain statements in flight for a run, in total and per database
+    EXECUTE_MAX_WORKERS: int = 4
+    EXECUTE_MAX_WORKERS_PER_DATABASE: int = 1
+
+    # Default statement_timeout and lock_timeout in ms of each statement, queries
+    # can set their own. 0 is no timeout
+    STATEMENT_TIMEOUT_MS: int = 0
+    LOCK_TIMEOUT_MS: int = 0
+
+    # Shell command run before each measured run of queries in the cold cache mode,
+    # e.g. to drop the OS page cache of the database host. The database name and
+    # id are in the DOL_DATABASE_NAME and DOL_DATABASE_ID env vars
+    COLD_CACHE_HOOK: str | None = None
+    COLD_CACHE_HOOK_TIMEOUT_SECONDS: float = 60
+
+    # Connection pool of each database engine
+    DB_POOL_SIZE: int = 5
+    DB_POOL_MAX_OVERFLOW: int = 5
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+
+    # Worker processes building records from plans (0 builds them in the app
+    # process, the default on a single core) and how many executed plans can wait
+    # for them
+    PLAN_PROCESS_WORKERS: int = min(4, (os.cpu_count() or 1) - 1)
+    PLAN_QUEUE_SIZE: int = 16
+
+    # Explain results kept in /app/saves/plan_cache.db, for runs using or replaying
+    # the cache
+    PLAN_CACHE_TTL_HOURS: float = 24 * 7
+    PLAN_CACHE_MAX_MB: int = 256
+
+    # Archive the plans of each run to /app/file/archive as Parquet, needs the
+    # `archive` extra (pyarrow), without it a warning is logged at startup and
+    # runs aren't archived
+    ARCHIVE_RUNS: bool = True
+
+    # Dump a cProfile of the thread starting each run to /app/file/profiles
+    PROFILE_RUNS: bool = False
+
+    # Push run records straight to Loki, e.g. http://loki:3100/loki/api/v1/push.
+    # Records are logged to stdout for Vector if unset
+    LOKI_PUSH_URL: str | None = None
+    LOKI_PUSH_BATCH_SIZE: int = 1000
+    LOKI_PUSH_MAX_RETRIES: int = 3
+    LOKI_PUSH_TIMEOUT_SECONDS: float = 10
+
 
 settings = Settings()  # type: ignore
@@ -11,6 +11,7 @@ class PlanEnum(StrEnum):
     PLANNING_TIME = "Planning Time"
     TRIGGERS = "Triggers"
     PLAN = "Plan"
+    SETTINGS = "Settings"
 
     # computed by dol
     NODES = "nodes"
@@ -62,6 +63,13 @@ class NodeEnum(StrEnum):
     LOCAL_WRITTEN_BLOCKS = "Local Written Blocks"
     IO_READ_TIME = "I/O Read Time"
     IO_WRITE_TIME = "I/O Write Time"
+    # I/O timings are split by buffer kind since PostgreSQL 17
+    SHARED_IO_READ_TIME = "Shared I/O Read Time"
+    SHARED_IO_WRITE_TIME = "Shared I/O Write Time"
+    LOCAL_IO_READ_TIME = "Local I/O Read Time"
+    LOCAL_IO_WRITE_TIME = "Local I/O Write Time"
+    TEMP_IO_READ_TIME = "Temp I/O Read Time"
+    TEMP_IO_WRITE_TIME = "Temp I/O Write Time"
     OUTPUT = "Output"
     HEAP_FETCHES = "Heap Fetches"
     WAL_RECORDS = "WAL Records"
@@ -82,10 +90,14 @@ class NodeEnum(StrEnum):
     NODE_ID = "node_id"
     PARENT_NODE = "parent_node"
 
-    TIMING = "timing"  # timing string with milliseconds and percent. Calculated with total actual time subtracted by startup time
-    TIMING_MS = "timing_ms"  #  timing in milliseconds
+    TIMING = "timing"  # timing string with exclusive milliseconds and percent
+    TIMING_MS = (
+        "timing_ms"  # exclusive time in milliseconds, without the children of the node
+    )
+    INCLUSIVE_MS = "inclusive_ms"  # time in milliseconds over all loops, with the children of the node
     TIMING_PROPORTION = "timing_proportion"  # node timing proportion of whole plan
     TIMING_COLOR = "timing_color"
+    CACHE_HIT_RATIO = "cache_hit_ratio"  # shared hit blocks of all shared blocks used by the node itself
 
     IS_LAST_CHILD = "is_last_child"
     IS_SUBPLAN = "is_subplan"
@@ -0,0 +1,119 @@
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from time import perf_counter
+from typing import Any, ParamSpec, TypeVar
+
+import numpy as np
+
+
+class StageTimer:
+    """
+    Collects the durations of the stages of a run, e.g. executing statements,
+    building plan tables and emitting records.
+
+    Usage:
+        timer = StageTimer()
+        with activate(timer):
+            with timed_stage("execute_explain"):
+                ...
+        timer.summary()
+    """
+
+    def __init__(self) -> None:
+        self._samples: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, duration_ms: float) -> None:
+        with self._lock:
+            self._samples.setdefault(stage, []).append(duration_ms)
+
+    def merge(self, samples: dict[str, list[float]]) -> None:
+        "Adds samples collected elsewhere, e.g. in a plan processing worker"
+        with self._lock:
+            for stage, durations in samples.items():
+                self._samples.setdefault(stage, []).extend(durations)
+
+    def samples(self) -> dict[str, list[float]]:
+        with self._lock:
+            return {
+                stage: list(durations) for stage, durations in self._samples.items()
+            }
+
+    def summary(self) -> list[dict[str, Any]]:
+        """
+        count, total, p50 and p95 in ms per stage, slowest stage in total first.
+
+        Example:
+            [{"stage": "execute_explain", "count": 3, "total_ms": 120.5, ...}, ...]
+        """
+        stage_summaries = []
+        for stage, durations in self.samples().items():
+            arr = np.asarray(durations, dtype=float)
+            stage_summaries.append(
+                {
+                    "stage": stage,
+                    "count": int(arr.size),
+                    "total_ms": round(float(arr.sum()), 2),
+                    "p50_ms": round(float(np.percentile(arr, 50)), 2),
+                    "p95_ms": round(float(np.percentile(arr, 95)), 2),
+                }
+            )
+        return sorted(stage_summaries, key=lambda s: s["total_ms"], reverse=True)
+
+
+Param = ParamSpec("Param")
+RetType = TypeVar("RetType")
+
+# Timer of the run executing in the current context, so concurrent runs each
+# collect their own stages
+_active_timer: ContextVar[StageTimer | None] = ContextVar("active_timer", default=None)
+
+
+def get_active_timer() -> StageTimer | None:
+    return _active_timer.get()
+
+
+@contextmanager
+def activate(timer: StageTimer) -> Iterator[StageTimer]:
+    """
+    Makes `timer` collect the stages timed within, in the current context. Calls
+    submitted to threads with `submit_in_context` collect into it too.
+    """
+    token = _active_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _active_timer.reset(token)
+
+
+def submit_in_context(
+    executor: Executor,
+    fn: Callable[Param, RetType],
+    *args: Param.args,
+    **kwargs: Param.kwargs,
+) -> Future[RetType]:
+    "Submits `fn` to run in a copy of the current context, with its active timer"
+    context = copy_context()
+
+    def run() -> RetType:
+        return context.run(fn, *args, **kwargs)
+
+    return executor.submit(run)
+
+
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    "Times the block as `stage` in the active timer, a no-op without one"
+    timer = get_active_timer()
+    if timer is None:
+        yield
+        return
+
+    start_time = perf_counter()
+    try:
+        yield
+    finally:
+        timer.record(stage, (perf_counter() - start_time) * 1000)
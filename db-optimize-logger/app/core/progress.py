@@ -1,24 +1,58 @@
-from collections.abc import Callable
 from dataclasses import dataclass
 
 from nicegui import ui
 
+from app.execute.run_job import RunJob
+
 
 @dataclass
 class Progress:
     loading: bool
-    on_change: Callable
+    job: RunJob | None = None  # Job of the running or last run
 
-    def set_loading(self, loading: bool) -> None:
+    def set_loading(self, loading: bool, job: RunJob | None = None) -> None:
         self.loading = loading
-        self.on_change()
+        if job is not None:
+            self.job = job
+
+
+def format_seconds(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def query_progress(queries_progress: Progress) -> None:
+    "Progress bar of the running START LOG with a cancel button, hidden otherwise"
+
+    def cancel() -> None:
+        if queries_progress.job is not None:
+            queries_progress.job.cancel()
+
+    with ui.column().classes("w-full items-center") as panel:
+        bar = ui.linear_progress(value=0, show_value=False).classes("w-96")
+        status = ui.label().classes("text-base")
+        running = ui.label().classes("text-sm text-gray-500")
+        cancel_button = ui.button("CANCEL", on_click=cancel).classes("bg-red")
+    panel.bind_visibility_from(queries_progress, "loading")
+
+    def update() -> None:
+        job = queries_progress.job
+        if not queries_progress.loading or job is None:
+            return
 
+        snapshot = job.snapshot()
+        bar.set_value(snapshot.fraction)
+        if snapshot.cancelled:
+            status.set_text("Cancelling, waiting for the running statements...")
+        else:
+            status.set_text(
+                f"{snapshot.done}/{snapshot.total} statements, "
+                f"elapsed {format_seconds(snapshot.elapsed_seconds)}, "
+                f"ETA {format_seconds(snapshot.eta_seconds)}"
+            )
+        running.set_text(", ".join(snapshot.running))
+        cancel_button.set_enabled(not snapshot.cancelled)
 
-@ui.refreshable
-async def query_progress(queries_progress: Progress):
-    if queries_progress.loading:
-        with ui.spinner(size="lg") as spinner:
-            spinner.set_visibility(True)
-    else:
-        with ui.spinner(size="lg") as spinner:
-            spinner.set_visibility(False)
+    ui.timer(0.5, update)
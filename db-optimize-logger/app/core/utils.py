@@ -1,31 +1,33 @@
 from collections.abc import Callable
 from functools import wraps
 from logging import Logger
-from time import perf_counter
 from typing import Any, ParamSpec, TypeVar
 
-from app.logs.logger import explain_logger
+from app.core.profiling import timed_stage
 
 Param = ParamSpec("Param")
 RetType = TypeVar("RetType")
 
 
-def sync_timing_tracker(func: Callable[Param, RetType]) -> Callable[Param, RetType]:
-    @wraps(func)
-    def wrap(*args: Param.args, **kwargs: Param.kwargs) -> RetType:
-        start_time = perf_counter()
-        result = func(*args, **kwargs)
-        end_time = perf_counter()
-        total_time = (end_time - start_time) * 1000  # Convert to milliseconds
+def sync_timing_tracker(
+    stage: str,
+) -> Callable[[Callable[Param, RetType]], Callable[Param, RetType]]:
+    "Times each call of the decorated function as `stage` of the active run timer"
 
-        explain_logger.info(f"'{list(kwargs.values())}:{total_time:.2f}ms")
+    def decorator(func: Callable[Param, RetType]) -> Callable[Param, RetType]:
+        @wraps(func)
+        def wrap(*args: Param.args, **kwargs: Param.kwargs) -> RetType:
+            with timed_stage(stage):
+                return func(*args, **kwargs)
 
-        return result
+        return wrap
 
-    return wrap
+    return decorator
 
 
-def log_key_value(logger: Logger, log_dict: dict[str, Any]) -> None:
+def log_key_value(
+    logger: Logger, log_dict: dict[str, Any], extra: dict[str, Any] | None = None
+) -> None:
     """
     Logs with keys and values for log_dict.
     Vector.dev config uses regex matches to produce an object with key and values
@@ -33,7 +35,10 @@ def log_key_value(logger: Logger, log_dict: dict[str, Any]) -> None:
 
 
     NB!: The keys and values in log_dict can't have '&' in them in conflict
-    of the regex matches. This is a temporary fault.
+    of the regex matches. This is a temporary fault, records pushed with
+    `LOKI_PUSH_URL` set don't have it.
+
+    `extra` is added as fields of the log record.
 
     Example:
 
@@ -43,4 +48,4 @@ def log_key_value(logger: Logger, log_dict: dict[str, Any]) -> None:
 
     """
     log_stmt = "".join([f"{key}={value}&" for key, value in log_dict.items()])
-    logger.info(log_stmt[:-1])  # -1 since there's one extra &
+    logger.info(log_stmt[:-1], extra=extra)  # -1 since there's one extra &
@@ -0,0 +1,97 @@
+from typing import Any
+
+import numpy as np
+
+from app.core.interface import (
+    NodeEnum as NE,
+)
+from app.core.interface import (
+    PlanEnum as PE,
+)
+from app.execute.node_process import flatten_plan
+
+
+def summarize_values(values: list[float]) -> dict[str, float]:
+    "min/median/p95/max/stddev of `values`, rounded to 3 decimals"
+    if not values:
+        return {}
+
+    arr = np.asarray(values, dtype=float)
+    summary = {
+        "min": arr.min(),
+        "median": np.median(arr),
+        "p95": np.percentile(arr, 95),
+        "max": arr.max(),
+        "stddev": arr.std(ddof=1) if arr.size > 1 else 0.0,
+    }
+    return {stat: round(float(value), 3) for stat, value in summary.items()}
+
+
+def _prefixed(prefix: str, summary: dict[str, float]) -> dict[str, float]:
+    return {f"{prefix}_{stat}": value for stat, value in summary.items()}
+
+
+def summarize_plan_times(explain_dumps: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Summary of `Execution Time` and `Planning Time` over the measured runs of a
+    (query, database) pair.
+
+    Example:
+        {"runs": 10, "execution_time_min": 1.2, ..., "planning_time_stddev": 0.01}
+    """
+    execution_times = [dump[PE.EXECUTION_TIME] for dump in explain_dumps]
+    planning_times = [
+        dump[PE.PLANNING_TIME] for dump in explain_dumps if PE.PLANNING_TIME in dump
+    ]
+
+    return {
+        "runs": len(explain_dumps),
+        **_prefixed("execution_time", summarize_values(execution_times)),
+        **_prefixed("planning_time", summarize_values(planning_times)),
+    }
+
+
+def summarize_prepared_planning(
+    first_planning_time: float | None, later_planning_times: list[float]
+) -> dict[str, Any]:
+    """
+    `Planning Time` of the first execution of a prepared statement in its session,
+    which plans it, and a summary of the later executions, which can reuse a
+    cached generic plan.
+
+    Example:
+        {"planning_time_first": 0.84, "planning_time_later_min": 0.02, ...}
+    """
+    summary: dict[str, Any] = {"planning_time_first": first_planning_time}
+    summary.update(
+        _prefixed("planning_time_later", summarize_values(later_planning_times))
+    )
+    return summary
+
+
+def summarize_node_timings(explain_dumps: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Per node `timing_ms` summary over the measured runs.
+
+    Nodes are matched across runs by their node id, so a node only gets samples
+    from the runs where the plan had the same node at the same place.
+    """
+    node_timings: dict[str, list[float]] = {}
+    node_lines: dict[str, tuple[str, str]] = {}  # Line index and type of each node
+    for dump in explain_dumps:
+        columns = flatten_plan(dump[PE.PLAN])
+        for i, timing_ms in enumerate(columns.timing_ms.tolist()):
+            node_id = columns.node_id[i]
+            node_timings.setdefault(node_id, []).append(timing_ms)
+            node_lines.setdefault(node_id, (columns.index[i], columns.node_type[i]))
+
+    return [
+        {
+            NE.NODE_ID.value: node_id,
+            NE.INDEX.value: node_lines[node_id][0],
+            NE.NODE_TYPE.value: node_lines[node_id][1],
+            "runs": len(timings),
+            **_prefixed(NE.TIMING_MS.value, summarize_values(timings)),
+        }
+        for node_id, timings in node_timings.items()
+    ]
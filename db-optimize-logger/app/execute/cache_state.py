@@ -0,0 +1,276 @@
+import os
+import subprocess
+from enum import StrEnum
+from typing import Any
+
+from sqlalchemy import Connection, text
+from sqlalchemy.exc import DBAPIError
+
+from app.core.config import settings
+from app.core.interface import NodeEnum as NE
+from app.core.interface import PlanEnum as PE
+from app.core.profiling import timed_stage
+from app.execute.database import DatabaseInstance
+from app.execute.run_job import RunJob
+from app.logs.logger import app_logger
+
+
+class CacheMode(StrEnum):
+    ANY = "any"  # Measures the caches in whatever state they are
+    # Loads the relations of the plan into shared buffers with `pg_prewarm` and
+    # runs at least one warm-up before the measured runs
+    WARM = "warm"
+    # Evicts the relations of the plan from shared buffers, resets the session and
+    # runs `COLD_CACHE_HOOK` before each measured run
+    COLD = "cold"
+
+
+class ColdCacheHookError(Exception):
+    def __init__(self, *args: object) -> None:
+        detail = "Cold cache hook failed"
+        self.reason = " ".join(str(arg) for arg in args if arg)  # Error and stderr
+        super().__init__(detail, args)
+
+
+def plan_relations(plan: dict[str, Any]) -> list[str]:
+    """Tables and indexes the nodes of `plan` read, in plan order without repeats.
+
+    Example:
+        ["public.users", "users_pkey", "orders"]
+    """
+    relations: dict[str, None] = {}
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        relation = node.get(NE.RELATION_NAME)
+        if relation is not None:
+            schema = node.get(NE.SCHEMA)  # Only with VERBOSE
+            relations[f"{schema}.{relation}" if schema else relation] = None
+        index = node.get(NE.INDEX_NAME)
+        if index is not None:
+            relations[index] = None
+        stack.extend(reversed(node.get(NE.PLANS, [])))
+    return list(relations)
+
+
+def read_plan_relations(
+    database_instance: DatabaseInstance,
+    statement_sql: str,
+    params: dict[str, Any] | None = None,
+) -> list[str]:
+    """Relations the plan of `statement_sql` (without EXPLAIN) reads with the bind
+    parameters `params`, from a plain `EXPLAIN`, which plans the statement without
+    executing it.
+    """
+    with (
+        timed_stage("plan_relations"),
+        database_instance.engine.connect() as conn,
+        conn.begin(),
+    ):
+        explain = conn.execute(
+            text(f"EXPLAIN (FORMAT JSON) {statement_sql}"), params or {}
+        )
+        explain_dump = explain.scalar_one()[0]
+    return plan_relations(explain_dump[PE.PLAN])
+
+
+def _has_function(conn: Connection, name: str) -> bool:
+    return bool(
+        conn.execute(
+            text("SELECT EXISTS (SELECT FROM pg_proc WHERE proname = :name)"),
+            {"name": name},
+        ).scalar_one()
+    )
+
+
+def prewarm_relations(
+    database_instance: DatabaseInstance, relations: list[str]
+) -> int | None:
+    """Loads `relations` into shared buffers, returns how many blocks were loaded.
+
+    Returns `None` if the `pg_prewarm` extension isn't installed in the database.
+    """
+    with (
+        timed_stage("prewarm"),
+        database_instance.engine.connect() as conn,
+        conn.begin(),
+    ):
+        if not _has_function(conn, "pg_prewarm"):
+            return None
+        blocks = 0
+        for relation in relations:
+            blocks += (
+                conn.execute(
+                    text(
+                        "SELECT coalesce(pg_prewarm(to_regclass(:relation)), 0) "
+                        "WHERE to_regclass(:relation) IS NOT NULL"
+                    ),
+                    {"relation": relation},
+                ).scalar()
+                or 0
+            )
+    return blocks
+
+
+def evict_relations(
+    database_instance: DatabaseInstance, relations: list[str]
+) -> int | None:
+    """Evicts the shared buffers of `relations`, returns how many buffers were.
+
+    Returns `None` if the database can't evict buffers, which needs the
+    `pg_buffercache` extension of PostgreSQL 17 or later. Dirty buffers are
+    written out first, and buffers pinned by other sessions stay.
+    """
+    with (
+        timed_stage("evict"),
+        database_instance.engine.connect() as conn,
+        conn.begin(),
+    ):
+        if not _has_function(conn, "pg_buffercache_evict"):
+            return None
+        buffers = 0
+        for relation in relations:
+            buffers += conn.execute(
+                text(
+                    "SELECT count(pg_buffercache_evict(b.bufferid)) "
+                    "FROM pg_buffercache b "
+                    "WHERE b.relfilenode = pg_relation_filenode(to_regclass(:relation)) "
+                    "AND b.reldatabase = "
+                    "(SELECT oid FROM pg_database WHERE datname = current_database())"
+                ),
+                {"relation": relation},
+            ).scalar_one()
+    return buffers
+
+
+def run_cold_cache_hook(database_instance: DatabaseInstance) -> None:
+    "Runs `COLD_CACHE_HOOK` if it's set, raises `ColdCacheHookError` if it fails"
+    if not settings.COLD_CACHE_HOOK:
+        return
+
+    env = {
+        **os.environ,
+        "DOL_DATABASE_NAME": database_instance.name,
+        "DOL_DATABASE_ID": database_instance.id,
+    }
+    with timed_stage("cold_cache_hook"):
+        try:
+            subprocess.run(
+                settings.COLD_CACHE_HOOK,
+                shell=True,
+                env=env,
+                check=True,
+                capture_output=True,
+                timeout=settings.COLD_CACHE_HOOK_TIMEOUT_SECONDS,
+            )
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            stderr = (e.stderr or b"").decode(errors="replace").strip()
+            raise ColdCacheHookError(str(e), stderr) from e
+
+
+class CacheControl:
+    """Brings the caches of a (query, database) pair to its `CacheMode`.
+
+    Cache control functions missing from the database (`pg_prewarm`,
+    `pg_buffercache_evict`) or failing in it, e.g. without the privileges to evict
+    buffers, and a failing `COLD_CACHE_HOOK`, are warned about once per database
+    of the `job` and skipped. The rest still applies, and `verified` turns false.
+
+    With `shared_session`, the statements share a session, which `DISCARD ALL`
+    can't reset between them.
+
+    Usage:
+        cache_control = CacheControl(query.cache_mode, db, statement_sql, job=job)
+        cache_control.warm()  # Before the warm-ups
+        for ...:
+            cache_control.cool()  # Before each measured run
+            ExplainRun(..., cache_verified=cache_control.verified)
+    """
+
+    def __init__(
+        self,
+        mode: CacheMode,
+        database_instance: DatabaseInstance,
+        statement_sql: str,
+        params: dict[str, Any] | None = None,
+        *,
+        job: RunJob | None = None,
+        shared_session: bool = False,
+    ):
+        self.mode = mode
+        self.database_instance = database_instance
+        self.statement_sql = statement_sql
+        self.params = params
+        self.job = job
+        self.shared_session = shared_session
+        # Whether the caches were brought to `mode` before every run so far
+        self.verified = True
+        self._relations: list[str] | None = None
+        self._warned: set[str] = set()
+
+    def _unverified(self, key: str, message: str) -> None:
+        "Warns about `message` once per database of the run, the mode isn't verified"
+        self.verified = False
+        key = f"{key}:{self.database_instance.id}"
+        if self.job is not None:
+            first = self.job.first_seen(key)
+        else:
+            first = key not in self._warned
+            self._warned.add(key)
+        if first:
+            app_logger.warning(
+                f"{message} in {self.database_instance.name}, its {self.mode} cache "
+                "runs are recorded as unverified"
+            )
+
+    def relations(self) -> list[str]:
+        if self._relations is None:
+            try:
+                self._relations = read_plan_relations(
+                    self.database_instance, self.statement_sql, self.params
+                )
+            except DBAPIError as e:
+                self._unverified("relations", f"Couldn't plan the statement: {e}")
+                self._relations = []
+        return self._relations
+
+    def warm(self) -> None:
+        if self.mode != CacheMode.WARM:
+            return
+        try:
+            prewarmed = prewarm_relations(self.database_instance, self.relations())
+        except DBAPIError as e:
+            self._unverified("pg_prewarm", f"pg_prewarm failed: {e.orig}")
+            return
+        if prewarmed is None:
+            self._unverified(
+                "pg_prewarm",
+                "pg_prewarm isn't installed, only the warm-up runs warm the cache",
+            )
+
+    def cool(self) -> None:
+        if self.mode != CacheMode.COLD:
+            return
+        if self.shared_session:
+            self._unverified(
+                "discard",
+                "DISCARD ALL is skipped, the statements share a session for "
+                "savepoint rollbacks or a prepared statement",
+            )
+        try:
+            evicted = evict_relations(self.database_instance, self.relations())
+        except DBAPIError as e:
+            self._unverified(
+                "pg_buffercache_evict", f"pg_buffercache_evict failed: {e.orig}"
+            )
+        else:
+            if evicted is None:
+                self._unverified(
+                    "pg_buffercache_evict",
+                    "pg_buffercache_evict (pg_buffercache, PostgreSQL 17+) isn't "
+                    "installed, shared buffers aren't evicted",
+                )
+        try:
+            run_cold_cache_hook(self.database_instance)
+        except ColdCacheHookError as e:
+            self._unverified("cold_cache_hook", f"COLD_CACHE_HOOK failed: {e.reason}")
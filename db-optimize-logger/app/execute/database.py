@@ -1,6 +1,8 @@
-import os
-from collections.abc import Callable
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager, nullcontext
 from dataclasses import field
+from enum import StrEnum
 from pathlib import Path
 from typing import Any
 
@@ -8,12 +10,42 @@ import numpy as np
 import pandas as pd
 from pydantic import BaseModel, Field, PostgresDsn, field_validator
 from pydantic_core import MultiHostHost
-from sqlalchemy import Engine, TextClause, create_engine, engine
-
-from app.core.utils import log_key_value
-from app.logs.logger import app_logger, db_logger, explain_logger
-
-DATABASES_SAVES_CSV = Path("/app/saves/databases.csv")
+from sqlalchemy import Connection, Engine, TextClause, create_engine, engine, text
+from sqlalchemy.exc import DBAPIError
+
+from app.core.config import settings
+from app.core.profiling import timed_stage
+from app.execute.run_job import RunJob
+from app.execute.saves import (
+    SAVES_DB,
+    SavesIndex,
+    delete_all_items,
+    delete_item,
+    load_items,
+    migrate_csv_once,
+    replace_all_items,
+    upsert_item,
+)
+from app.logs.logger import db_logger, explain_logger
+from app.logs.sink import RecordSink
+
+DATABASES_SAVES_CSV = Path("/app/saves/databases.csv")  # Legacy, migrated to SAVES_DB
+DATABASES_TABLE = "databases"
+
+# Process-wide engines keyed by database id, with the url they were created for
+_ENGINES: dict[str, tuple[str, Engine]] = {}
+_ENGINES_LOCK = threading.Lock()
+
+# query_canceled (statement timeout or pg_cancel_backend) and lock_not_available
+TIMEOUT_PGCODES = {"57014", "55P03"}
+
+
+class RollbackMode(StrEnum):
+    OFF = "off"  # Commits, data-modifying statements keep their writes
+    TRANSACTION = "transaction"  # Rolls back the transaction of each statement
+    # Runs the statements of a (query, database) pair in one transaction, rolled
+    # back to a savepoint after each statement and rolled back at the end
+    SAVEPOINT = "savepoint"
 
 
 class DatabaseInstance(BaseModel):
@@ -24,7 +56,47 @@ class DatabaseInstance(BaseModel):
 
     @property
     def engine(self) -> Engine:
-        return create_engine(self.url)
+        return get_engine(self)
+
+
+def get_engine(database_instance: DatabaseInstance) -> Engine:
+    """Returns the pooled engine of `database_instance`, creating it on first use.
+
+    The engine is replaced if the url of the database changed since it was created.
+    """
+    with _ENGINES_LOCK:
+        cached = _ENGINES.get(database_instance.id)
+        if cached is not None:
+            url, db_engine = cached
+            if url == database_instance.url:
+                return db_engine
+            db_engine.dispose()
+
+        db_engine = create_engine(
+            database_instance.url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_POOL_MAX_OVERFLOW,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        )
+        _ENGINES[database_instance.id] = (database_instance.url, db_engine)
+        return db_engine
+
+
+def dispose_engine(id: str) -> None:
+    "Closes the pooled connections of database `id`, if it has an engine"
+    with _ENGINES_LOCK:
+        cached = _ENGINES.pop(id, None)
+    if cached is not None:
+        cached[1].dispose()
+
+
+def dispose_all_engines() -> None:
+    with _ENGINES_LOCK:
+        cached_engines = list(_ENGINES.values())
+        _ENGINES.clear()
+    for _, db_engine in cached_engines:
+        db_engine.dispose()
 
 
 class ExplodedURLDBInstance(BaseModel):
@@ -82,91 +154,105 @@ def create_database_url(
 
 
 class NoDatabasesFoundError(Exception):
-    def __init__(self, *args):
+    def __init__(self, *args: object) -> None:
         detail = "Database not found in saves"
         super().__init__(detail, args)
 
 
-def read_database_saves_df() -> pd.DataFrame:
-    try:
-        saves_df = pd.read_csv(DATABASES_SAVES_CSV)
-    except FileNotFoundError:
-        raise NoDatabasesFoundError
+def _read_databases_csv() -> list[tuple[str, str]]:
+    "Reads the legacy csv saves, only used to migrate them to the saves database"
+    df = pd.read_csv(DATABASES_SAVES_CSV)
+    df = df.replace({np.nan: None, pd.NA: None, pd.NaT: None})
+
+    items = []
+    for row in df.to_dict(orient="records"):
+        database_instance = DatabaseInstance(
+            id=row["id"],
+            name=row["name"],
+            description=row["description"],
+            url=row["url"],
+        )
+        items.append((database_instance.id, database_instance.model_dump_json()))
+    return items
+
+
+def _load_database_instances() -> dict[str, DatabaseInstance]:
+    migrate_csv_once(
+        name="databases_csv",
+        table=DATABASES_TABLE,
+        csv_path=DATABASES_SAVES_CSV,
+        read_items=_read_databases_csv,
+    )
+    return {
+        id: DatabaseInstance.model_validate_json(data)
+        for id, data in load_items(DATABASES_TABLE)
+    }
 
-    if saves_df.empty:
+
+_databases_index = SavesIndex(DATABASES_TABLE, load=_load_database_instances)
+
+
+def read_database_instances() -> list[DatabaseInstance]:
+    "Returns copies of all saved databases, in the order they were saved"
+    return [db.model_copy() for db in _databases_index.items().values()]
+
+
+def read_database_saves_df() -> pd.DataFrame:
+    database_instances = read_database_instances()
+    if not database_instances:
         raise NoDatabasesFoundError
 
-    return saves_df
+    return pd.DataFrame([db.model_dump() for db in database_instances])
 
 
 def find_database_instance(id: str) -> DatabaseInstance:
     "Uses database instance `id` to find corresponding in saves and return the instance"
 
-    df = read_database_saves_df().replace({np.nan: None, pd.NA: None, pd.NaT: None})
-    mask = df["id"] == id
-    if not mask.any():
-        raise NoDatabasesFoundError(f"ID {id!r} isn’t in {DATABASES_SAVES_CSV!r}")
-
-    row = df.loc[mask].squeeze("rows")
+    database_instance = _databases_index.get(id)
+    if database_instance is None:
+        raise NoDatabasesFoundError(f"ID {id!r} isn’t in {SAVES_DB!r}")
 
-    return DatabaseInstance(
-        id=row["id"],
-        name=row["name"],
-        description=row["description"],
-        url=row["url"],
-    )
+    return database_instance.model_copy()
 
 
 def delete_database_instance(id: str) -> None:
-    find_database_instance(id)  # Check if database exist and handle it
-
-    saves_df = read_database_saves_df()
+    if not delete_item(DATABASES_TABLE, id):
+        raise NoDatabasesFoundError(f"ID {id!r} isn’t in {SAVES_DB!r}")
 
-    id_existing_index = saves_df.index[saves_df["id"] == id].to_list()
-    saves_df = saves_df.drop(id_existing_index)
-
-    saves_df.to_csv(DATABASES_SAVES_CSV, index=False)
+    _databases_index.invalidate()
+    dispose_engine(id)
 
 
 def delete_all_databases() -> None:
-    try:
-        os.remove(DATABASES_SAVES_CSV)
-    except FileNotFoundError:
-        app_logger.info("All databases already deleted")
+    dispose_all_engines()
+    delete_all_items(DATABASES_TABLE)
+    _databases_index.invalidate()
 
 
 def save_database_instance(database_instance: DatabaseInstance) -> None:
     """
-    Saves `database_instance` to a row in database saves csv file.
+    Saves `database_instance` to a row in the saves database.
 
     If `database_instance` has an existing `database_instance.id` in the saves, it replaces the row with
     the existing `database_instance.id`"""
-    try:
-        saves_df = read_database_saves_df()
-    except NoDatabasesFoundError:
-        cols = pd.Index(["id", "name", "description", "url"])
-        saves_df = pd.DataFrame(columns=cols)
-        saves_df.to_csv(DATABASES_SAVES_CSV, index=False)
-
-    db_instance_df = pd.DataFrame([database_instance.model_dump()])
-    db_instance_df = db_instance_df.reindex(columns=saves_df.columns, fill_value=None)
-
-    id_existing_index = saves_df.index[saves_df["id"] == database_instance.id].to_list()
-    if id_existing_index:
-        saves_df = saves_df.drop(id_existing_index)
+    upsert_item(
+        DATABASES_TABLE, database_instance.id, database_instance.model_dump_json()
+    )
+    _databases_index.invalidate()
+    dispose_engine(database_instance.id)  # Connections may use an outdated url
 
-    saves_df = pd.concat([saves_df, db_instance_df], ignore_index=True)
 
-    saves_df.to_csv(DATABASES_SAVES_CSV, index=False)
+def save_all_database_instances(database_instances: list[DatabaseInstance]) -> None:
+    "Replaces all saved databases with `database_instances` in one transaction"
+    replace_all_items(
+        DATABASES_TABLE, [(db.id, db.model_dump_json()) for db in database_instances]
+    )
+    _databases_index.invalidate()
+    dispose_all_engines()
 
 
 def read_database_ids_list() -> list[str]:
-    try:
-        database_instances = read_database_saves_df()
-    except NoDatabasesFoundError:
-        return []
-
-    return list(database_instances["id"])
+    return _databases_index.ids()
 
 
 def hide_password_url(database_url: str) -> str:
@@ -191,7 +277,82 @@ def mapped_database_url(database_url: str) -> tuple[MultiHostHost, str | None]:
     return url_dict, path
 
 
-def process_databases(databases: pd.DataFrame) -> None:
+class StatementTimeoutError(Exception):
+    def __init__(self, *args: object) -> None:
+        detail = "Statement was cancelled or timed out"
+        self.reason = " ".join(str(arg) for arg in args)  # Error from the server
+        super().__init__(detail, args)
+
+
+def apply_timeouts(
+    conn: Connection,
+    *,
+    statement_timeout_ms: int | None,
+    lock_timeout_ms: int | None,
+) -> None:
+    "Sets the timeouts for the current transaction of `conn` only"
+    for name, value in (
+        ("statement_timeout", statement_timeout_ms),
+        ("lock_timeout", lock_timeout_ms),
+    ):
+        if value:
+            conn.execute(
+                text("SELECT set_config(:name, :value, true)"),
+                {"name": name, "value": str(value)},
+            )
+
+
+def backend_pid(conn: Connection) -> int:
+    "Pid of the backend of `conn`, read once per pooled connection"
+    pid: int | None = conn.info.get("backend_pid")
+    if pid is None:
+        pid = int(conn.execute(text("SELECT pg_backend_pid()")).scalar_one())
+        conn.info["backend_pid"] = pid
+    return pid
+
+
+@contextmanager
+def track_backend(
+    conn: Connection, database_instance: DatabaseInstance, job: RunJob | None
+) -> Iterator[None]:
+    """Registers the backend of `conn` with `job` while the block executes, so
+    `cancel_running_statements` can cancel it.
+
+    Raises `StatementTimeoutError` if the statement was cancelled or timed out,
+    and `RunCancelledError` if `job` was cancelled before it started.
+    """
+    with (
+        job.running_backend(database_instance, backend_pid(conn))
+        if job is not None
+        else nullcontext()
+    ):
+        try:
+            yield
+        except DBAPIError as e:
+            if getattr(e.orig, "pgcode", None) in TIMEOUT_PGCODES:
+                raise StatementTimeoutError(str(e.orig).strip()) from e
+            raise
+
+
+def cancel_running_statements(job: RunJob) -> int:
+    "Cancels the running statements of `job`, returns how many were cancelled"
+    cancelled = 0
+    for database_instance, pid in job.running_backends():
+        try:
+            with database_instance.engine.connect() as conn:
+                cancelled += bool(
+                    conn.execute(
+                        text("SELECT pg_cancel_backend(:pid)"), {"pid": pid}
+                    ).scalar_one()
+                )
+        except Exception as e:
+            explain_logger.warning(
+                f"Couldn't cancel backend {pid} in db.id={database_instance.id}: {e}"
+            )
+    return cancelled
+
+
+def process_databases(databases: pd.DataFrame, sink: RecordSink) -> None:
     for _, row in databases.iterrows():
         db_name = row["name"]
         db_description = row["description"]
@@ -199,27 +360,143 @@ def process_databases(databases: pd.DataFrame) -> None:
 
         hided_url = hide_password_url(str(db_url))
 
-        log_key_value(
+        sink.emit(
             db_logger,
             {"db_name": db_name, "db_description": db_description, "db_url": hided_url},
+            record_type="database",
         )
 
 
+@contextmanager
+def rollback_transaction(
+    database_instance: DatabaseInstance, rollback: RollbackMode
+) -> Iterator[Connection | None]:
+    """Transaction shared by the statements of a (query, database) pair in
+    `RollbackMode.SAVEPOINT`, always rolled back at the end. Yields `None` in the
+    other modes, where each statement gets its own transaction.
+
+    Usage:
+        with rollback_transaction(db, query.rollback) as transaction:
+            execute_explain_stmt(..., transaction=transaction)
+    """
+    if rollback != RollbackMode.SAVEPOINT:
+        yield None
+        return
+
+    with timed_stage("connect"):
+        conn = database_instance.engine.connect()
+    with conn:
+        transaction = conn.begin()
+        try:
+            yield conn
+        finally:
+            transaction.rollback()
+
+
+def discard_session(conn: Connection) -> None:
+    """Resets the session of `conn` with `DISCARD ALL`, dropping its cached plans,
+    prepared statements and temporary tables. Can't run in a transaction.
+    """
+    isolation_level = conn.default_isolation_level
+    with timed_stage("discard"):
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.exec_driver_sql("DISCARD ALL")
+        conn.commit()
+        conn.execution_options(isolation_level=isolation_level)
+
+
+def _execute_explain(
+    conn: Connection,
+    database_instance: DatabaseInstance,
+    statement: TextClause,
+    statement_timeout_ms: int | None,
+    lock_timeout_ms: int | None,
+    job: RunJob | None,
+) -> dict[Any, Any]:
+    apply_timeouts(
+        conn,
+        statement_timeout_ms=statement_timeout_ms,
+        lock_timeout_ms=lock_timeout_ms,
+    )
+    with track_backend(conn, database_instance, job), timed_stage("execute_explain"):
+        explain = conn.execute(statement)
+
+    assert explain
+    explain_dump: dict[Any, Any] = explain.scalar_one()[0]
+    return explain_dump
+
+
 def execute_explain_stmt(
     database_instance: DatabaseInstance,
     statement: TextClause,
     query_name: str,
+    statement_timeout_ms: int | None = None,
+    lock_timeout_ms: int | None = None,
+    rollback: bool = False,
+    transaction: Connection | None = None,
+    session: Connection | None = None,
+    discard: bool = False,
+    job: RunJob | None = None,
 ) -> dict[Any, Any]:
-    # Returns JSON string representation of explain query
+    """Executes the explain `statement` and returns its JSON output.
+
+    With `rollback`, its transaction is rolled back instead of committed, so
+    data-modifying statements leave the database as it was. With a `transaction`
+    from `rollback_transaction`, it's executed in a savepoint of it that's rolled
+    back afterwards.
+
+    With a `session`, e.g. holding a prepared statement, it's executed on that
+    connection in a transaction of its own.
+
+    With `discard`, the session is reset before, unless it runs in a `transaction`
+    or `session`.
+
+    With a `job`, the statement is registered with it to be cancelled with the run.
+    """
     explain_logger.info(
         f"Performing explain query in db.id={database_instance.id} with query_name={query_name}"
     )
-    with database_instance.engine.begin() as conn:
-        explain = conn.execute(statement)
-
-    assert explain
+    if transaction is not None:
+        with transaction.begin_nested() as savepoint:
+            explain_dump = _execute_explain(
+                transaction,
+                database_instance,
+                statement,
+                statement_timeout_ms,
+                lock_timeout_ms,
+                job,
+            )
+            savepoint.rollback()
+    elif session is not None:
+        with session.begin() as session_transaction:
+            explain_dump = _execute_explain(
+                session,
+                database_instance,
+                statement,
+                statement_timeout_ms,
+                lock_timeout_ms,
+                job,
+            )
+            if rollback:
+                session_transaction.rollback()
+    else:
+        with timed_stage("connect"):
+            conn = database_instance.engine.connect()
+        with conn:
+            if discard:
+                discard_session(conn)
+            with conn.begin() as conn_transaction:
+                explain_dump = _execute_explain(
+                    conn,
+                    database_instance,
+                    statement,
+                    statement_timeout_ms,
+                    lock_timeout_ms,
+                    job,
+                )
+                if rollback:
+                    conn_transaction.rollback()
 
-    explain_dump: dict[Any, Any] = explain.scalar_one()[0]
     explain_dump["database"] = database_instance.name + "_" + database_instance.id[:6]
 
     assert isinstance(explain_dump, dict)
@@ -230,12 +507,26 @@ def execute_count_stmt(
     database_instance: DatabaseInstance,
     statement: TextClause,
     query_name: str,
+    statement_timeout_ms: int | None = None,
+    lock_timeout_ms: int | None = None,
+    job: RunJob | None = None,
 ) -> dict[Any, Any]:
     explain_logger.info(
         f"Performing count query in db.id={database_instance.id} with query_name={query_name}"
     )
-    with database_instance.engine.begin() as conn:
-        count = conn.execute(statement)
+    with timed_stage("connect"):
+        conn = database_instance.engine.connect()
+    with conn, conn.begin():
+        apply_timeouts(
+            conn,
+            statement_timeout_ms=statement_timeout_ms,
+            lock_timeout_ms=lock_timeout_ms,
+        )
+        with (
+            track_backend(conn, database_instance, job),
+            timed_stage("execute_count"),
+        ):
+            count = conn.execute(statement)
 
     assert count
 
@@ -244,3 +535,48 @@ def execute_count_stmt(
 
     assert isinstance(count_dump, dict)
     return count_dump
+
+
+# Server version and a hash of the columns, indexes and write and analyze counters
+# of every user table, changes whenever their plans could
+FINGERPRINT_SQL = """
+SELECT concat_ws(
+    '|',
+    current_setting('server_version_num'),
+    (
+        SELECT md5(coalesce(string_agg(
+            concat_ws(
+                ':', relid, n_tup_ins, n_tup_upd, n_tup_del,
+                analyze_count, autoanalyze_count
+            ),
+            ',' ORDER BY relid
+        ), ''))
+        FROM pg_stat_user_tables
+    ),
+    (
+        SELECT md5(coalesce(string_agg(
+            concat_ws(':', a.attrelid, a.attname, a.atttypid),
+            ',' ORDER BY a.attrelid, a.attnum
+        ), ''))
+        FROM pg_attribute a
+        JOIN pg_stat_user_tables t ON t.relid = a.attrelid
+        WHERE a.attnum > 0 AND NOT a.attisdropped
+    ),
+    (
+        SELECT md5(coalesce(string_agg(indexrelid::text, ',' ORDER BY indexrelid), ''))
+        FROM pg_stat_user_indexes
+    )
+)
+"""
+
+
+def database_fingerprint(database_instance: DatabaseInstance) -> str:
+    """Fingerprint of the schema and statistics of `database_instance`.
+
+    It changes with the server version, the columns and indexes of the user tables
+    and when rows are written or tables analyzed, so cached plans are only reused
+    while they would come out the same.
+    """
+    with timed_stage("fingerprint"), database_instance.engine.connect() as conn:
+        fingerprint = conn.execute(text(FINGERPRINT_SQL)).scalar_one()
+    return str(fingerprint)
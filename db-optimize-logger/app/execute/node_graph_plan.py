@@ -1,5 +1,5 @@
-import numpy as np
-import pandas as pd
+from collections.abc import Iterator
+from typing import Any
 
 from app.core.interface import (
     GrafanaEdgeEnum as GEE,
@@ -10,115 +10,106 @@ from app.core.interface import (
 from app.core.interface import (
     NodeEnum,
 )
-
-
-def create_node_metrics_df(node_series: pd.Series) -> pd.DataFrame:
-    node_metrics_df = pd.DataFrame(
-        {
-            NodeEnum.INDEX.value: node_series.str[NodeEnum.INDEX],
-            NodeEnum.NODE_TYPE.value: node_series.str[NodeEnum.NODE_TYPE],
-            NodeEnum.TIMING_MS.value: node_series.str[NodeEnum.TIMING_MS],
-            "timing_pct": node_series.str.get(NodeEnum.TIMING_PROPORTION).astype(float)
-            * 100,
-            NodeEnum.NODE_TYPE_DETAIL.value: node_series.str[NodeEnum.NODE_TYPE_DETAIL],
-            NodeEnum.ACTUAL_ROWS.value: node_series.str[NodeEnum.ACTUAL_ROWS],
-            NodeEnum.TOTAL_COST.value: node_series.str[NodeEnum.TOTAL_COST],
-            NodeEnum.ACTUAL_TOTAL_TIME.value: node_series.str[
-                NodeEnum.ACTUAL_TOTAL_TIME
-            ],
-            NodeEnum.ACTUAL_STARTUP_TIME.value: node_series.str[
-                NodeEnum.ACTUAL_STARTUP_TIME
-            ],
-            NodeEnum.NODE_TYPE_DETAIL.value: node_series.str[NodeEnum.NODE_TYPE_DETAIL],
-            NodeEnum.DESCRIPTION.value: node_series.str[NodeEnum.DESCRIPTION],
+from app.execute.node_process import IO_COLUMNS, IO_TIME_COLUMNS, PlanColumns
+
+# Each generator yields one record per node (or edge), read straight from the plan
+# columns, so no table of the whole plan is built besides the columns themselves.
+
+
+def iter_node_metrics(columns: PlanColumns) -> Iterator[dict[str, Any]]:
+    "With BUFFERS, each node also gets the I/O it did itself and its cache hit ratio"
+    timing_ms = columns.timing_ms.tolist()
+    inclusive_ms = columns.inclusive_ms.tolist()
+    timing_pct = (columns.timing_proportion * 100).tolist()
+    io_exclusive = columns.io_exclusive.tolist()
+    for i in range(len(columns)):
+        node_metrics = {
+            NodeEnum.NODE_ID.value: columns.node_id[i],
+            NodeEnum.INDEX.value: columns.index[i],
+            NodeEnum.NODE_TYPE.value: columns.node_type[i],
+            NodeEnum.TIMING_MS.value: timing_ms[i],
+            "timing_pct": timing_pct[i],
+            NodeEnum.INCLUSIVE_MS.value: inclusive_ms[i],
+            NodeEnum.NODE_TYPE_DETAIL.value: columns.node_type_detail[i],
+            NodeEnum.ACTUAL_ROWS.value: columns.actual_rows[i],
+            NodeEnum.TOTAL_COST.value: columns.total_cost[i],
+            NodeEnum.ACTUAL_TOTAL_TIME.value: columns.actual_total_time[i],
+            NodeEnum.ACTUAL_STARTUP_TIME.value: columns.actual_startup_time[i],
+            NodeEnum.DESCRIPTION.value: columns.description[i],
         }
-    )
-
-    return node_metrics_df
-
-
-def create_graphnode_table(node_series: pd.Series) -> pd.DataFrame:
-    graphnode_df = pd.DataFrame(
-        {
-            GNE.ID.value: node_series.str[NodeEnum.NODE_ID],
-            GNE.TITLE.value: (
-                node_series.str.get(NodeEnum.INDEX).astype(str)
-                + "  "
-                + node_series.str.get(NodeEnum.NODE_TYPE).astype(str)
+        if columns.has_io:
+            for name, value in zip(IO_COLUMNS, io_exclusive[i], strict=True):
+                node_metrics[name] = value if name in IO_TIME_COLUMNS else int(value)
+            node_metrics[NodeEnum.CACHE_HIT_RATIO.value] = columns.cache_hit_ratio[i]
+        yield node_metrics
+
+
+def iter_graph_nodes(columns: PlanColumns) -> Iterator[dict[str, Any]]:
+    for i in range(len(columns)):
+        yield {
+            GNE.ID.value: columns.node_id[i],
+            GNE.TITLE.value: f"{columns.index[i]}  {columns.node_type[i]}",
+            GNE.MAINSTAT.value: columns.timing[i],
+            GNE.SECONDARYSTAT.value: columns.node_type_detail[i],
+            f"{GNE.DETAIL__.value}{NodeEnum.ACTUAL_ROWS.value}": columns.actual_rows[i],
+            f"{GNE.DETAIL__.value}{NodeEnum.ACTUAL_TOTAL_TIME.value}": (
+                f"{float(columns.actual_total_time[i])}ms"
             ),
-            GNE.MAINSTAT.value: node_series.str[NodeEnum.TIMING],
-            GNE.SECONDARYSTAT.value: node_series.str[NodeEnum.NODE_TYPE_DETAIL],
-            f"{GNE.DETAIL__.value}{NodeEnum.ACTUAL_ROWS.value}": node_series.str[
-                NodeEnum.ACTUAL_ROWS
-            ],
-            f"{GNE.DETAIL__.value}{NodeEnum.ACTUAL_TOTAL_TIME.value}": node_series.str.get(
-                NodeEnum.ACTUAL_TOTAL_TIME
-            ).astype(str)
-            + "ms",
-            f"{GNE.DETAIL__.value}{NodeEnum.ACTUAL_STARTUP_TIME.value}": node_series.str.get(
-                NodeEnum.ACTUAL_STARTUP_TIME
-            ).astype(str)
-            + "ms",
-            f"{GNE.DETAIL__.value}{NodeEnum.TOTAL_COST.value}": node_series.str[
-                NodeEnum.TOTAL_COST
-            ],
-            f"{GNE.DETAIL__.value}{NodeEnum.DESCRIPTION.value}": node_series.str[
-                NodeEnum.DESCRIPTION
-            ],
+            f"{GNE.DETAIL__.value}{NodeEnum.ACTUAL_STARTUP_TIME.value}": (
+                f"{float(columns.actual_startup_time[i])}ms"
+            ),
+            f"{GNE.DETAIL__.value}{NodeEnum.TOTAL_COST.value}": columns.total_cost[i],
+            f"{GNE.DETAIL__.value}{NodeEnum.DESCRIPTION.value}": columns.description[i],
             GNE.NODERADIUS.value: 50,
-            GNE.COLOR.value: node_series.str[NodeEnum.TIMING_COLOR],
+            GNE.COLOR.value: columns.timing_color[i],
         }
-    )
-
-    return graphnode_df
 
 
-def create_graphedge_table(node_series: pd.Series) -> pd.DataFrame:
-    graphedge_df = pd.DataFrame(
-        {
-            GEE.ID.value: (
-                node_series.str.get(NodeEnum.NODE_ID).astype(str)
-                + "_"
-                + node_series.str.get(NodeEnum.PARENT_NODE).astype(str)
-            ),
-            GEE.SOURCE.value: node_series.str[NodeEnum.PARENT_NODE],
-            GEE.TARGET.value: node_series.str[NodeEnum.NODE_ID],
+def iter_graph_edges(columns: PlanColumns) -> Iterator[dict[str, Any]]:
+    # The root node is first and the only node without a parent
+    for node_id, parent_id in zip(
+        columns.node_id[1:], columns.parent_node[1:], strict=True
+    ):
+        yield {
+            GEE.ID.value: f"{node_id}_{parent_id}",
+            GEE.SOURCE.value: parent_id,
+            GEE.TARGET.value: node_id,
         }
-    )
-
-    graphedge_df = graphedge_df.dropna()
-
-    return graphedge_df
-
-
-def create_level_divider(node_series: pd.Series) -> pd.DataFrame:
-    indexes = node_series.str[NodeEnum.INDEX].astype(int)
-    is_last_child = node_series.str[NodeEnum.IS_LAST_CHILD].astype(bool)
-    node_types = node_series.str.get(NodeEnum.NODE_TYPE).astype(str)
-
-    base_prefix = np.where(indexes == 0, "", np.where(is_last_child, "└ ", "├ "))
-
-    def build_depth_prefix(depth_val, branches):
-        parts = []
-        for level in range(0, depth_val - 1):
-            if level in branches:
-                parts.append("│   ")
-            else:
-                parts.append("    ")
-        return "".join(parts)
-
-    depth_prefix = node_series.apply(
-        lambda node: build_depth_prefix(node[NodeEnum.DEPTH], node[NodeEnum.BRANCHES])
-    )
-
-    # Combine components
-    full_prefix = depth_prefix + base_prefix
-
-    # **here’s the magic**: swap EVERY normal space for a NBSP
-    #   NBSP is Unicode U+00A0, which browsers will render and not collapse.
-    full_prefix_nbsp = full_prefix.str.replace(" ", "\u00a0")
 
-    # now append your node label/type
-    level_divider_str = full_prefix_nbsp + node_types
 
-    return pd.concat([node_series, level_divider_str], axis=1).reset_index()
+def build_depth_prefix(depth: int, branches: list[int]) -> str:
+    parts = []
+    for level in range(0, depth - 1):
+        if level in branches:
+            parts.append("│   ")
+        else:
+            parts.append("    ")
+    return "".join(parts)
+
+
+def iter_level_lines(columns: PlanColumns) -> Iterator[str]:
+    "Yields the plan as a tree, one line per node prefixed with its aligned index"
+    n = len(columns)
+    max_index_width = 1 + len(str(n - 1)) if n > 0 else 0
+
+    for i, node_type in enumerate(columns.node_type):
+        if i == 0:
+            base_prefix = ""
+        elif columns.is_last_child[i]:
+            base_prefix = "└ "
+        else:
+            base_prefix = "├ "
+        full_prefix = build_depth_prefix(columns.depth[i], columns.branches[i])
+        full_prefix += base_prefix
+
+        prefix_index = "0" if len(str(i)) < 2 else ""
+        padded_index = (prefix_index + str(i)).ljust(max_index_width)
+
+        # **here’s the magic**: swap EVERY normal space for a NBSP
+        #   NBSP is Unicode U+00A0, which browsers will render and not collapse.
+        yield (
+            padded_index.replace(" ", "\u00a0")
+            + " "
+            + full_prefix.replace(" ", "\u00a0")
+            + node_type
+        )
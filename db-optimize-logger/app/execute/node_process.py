@@ -1,114 +1,402 @@
-import uuid
+import hashlib
+from dataclasses import dataclass, field
 from typing import Any
 
-import pandas as pd
+import numpy as np
+import numpy.typing as npt
 
 from app.core.interface import (
     NodeEnum as NE,
 )
-from app.core.interface import (
-    PlanEnum as PE,
-)
+from app.core.utils import sync_timing_tracker
 from app.execute.node_type_handlers import (
     NodeTypeService,
 )
 
+# Counters of `EXPLAIN (BUFFERS, WAL)` flattened to the I/O columns, in column
+# order. They're totals over all loops of a node, including its children. Keys
+# mapped to the same column are summed.
+IO_COUNTERS: dict[str, str] = {
+    NE.SHARED_HIT_BLOCKS: "shared_hit_blocks",
+    NE.SHARED_READ_BLOCKS: "shared_read_blocks",
+    NE.SHARED_DIRTIED_BLOCKS: "shared_dirtied_blocks",
+    NE.SHARED_WRITTEN_BLOCKS: "shared_written_blocks",
+    NE.LOCAL_HIT_BLOCKS: "local_hit_blocks",
+    NE.LOCAL_READ_BLOCKS: "local_read_blocks",
+    NE.TEMP_READ_BLOCKS: "temp_read_blocks",
+    NE.TEMP_WRITTEN_BLOCKS: "temp_written_blocks",
+    NE.IO_READ_TIME: "io_read_time_ms",
+    NE.SHARED_IO_READ_TIME: "io_read_time_ms",
+    NE.LOCAL_IO_READ_TIME: "io_read_time_ms",
+    NE.TEMP_IO_READ_TIME: "io_read_time_ms",
+    NE.IO_WRITE_TIME: "io_write_time_ms",
+    NE.SHARED_IO_WRITE_TIME: "io_write_time_ms",
+    NE.LOCAL_IO_WRITE_TIME: "io_write_time_ms",
+    NE.TEMP_IO_WRITE_TIME: "io_write_time_ms",
+    NE.WAL_RECORDS: "wal_records",
+    NE.WAL_BYTES: "wal_bytes",
+    NE.WAL_FPI: "wal_fpi",
+}
+IO_COLUMNS = list(dict.fromkeys(IO_COUNTERS.values()))
+IO_TIME_COLUMNS = {"io_read_time_ms", "io_write_time_ms"}  # The rest are counts
+
+GATHER_NODE_TYPES = {"Gather", "Gather Merge"}
+_IO_COLUMN_OF = {key: IO_COLUMNS.index(column) for key, column in IO_COUNTERS.items()}
+
+
+def relation_key(node: dict[str, Any]) -> str | None:
+    "Relation (or CTE, function, index) a node reads, with its alias for self joins"
+    relation = (
+        node.get(NE.RELATION_NAME)
+        or node.get("CTE Name")
+        or node.get("Function Name")
+        or node.get(NE.INDEX_NAME)
+    )
+    if relation is None:
+        return None
+    alias = node.get(NE.ALIAS)
+    return f"{relation} {alias}" if alias and alias != relation else relation
+
+
+def stable_node_id(path: str, node_type: str, relation: str | None) -> str:
+    """Id of a node that's the same in every plan with the node at the same place.
+
+    Example:
+        stable_node_id("0.1", "Seq Scan", "users") -> "Seq Scan_5d41402abc4b"
+    """
+    digest = hashlib.blake2b(
+        f"{path}|{node_type}|{relation or ''}".encode(), digest_size=6
+    ).hexdigest()
+    return f"{node_type}_{digest}"
+
+
+# Color of a node by the least proportion of the plan's time it took, the first
+# reached applies, otherwise `FAST_TIMING_COLOR`
+TIMING_COLORS = [(0.5, "#FF0000"), (0.10, "#FFFF00")]
+FAST_TIMING_COLOR = "#008000"
+
 
 def calc_timing_color(timing_proportion: float) -> str:
-    if timing_proportion >= 0.5:
-        return "#FF0000"
-    elif 0.10 <= timing_proportion < 0.5:
-        return "#FFFF00"
+    for least_proportion, color in TIMING_COLORS:
+        if timing_proportion >= least_proportion:
+            return color
+    return FAST_TIMING_COLOR
+
+
+@dataclass
+class PlanColumns:
+    """
+    Plan nodes flattened to one column per property, in the pre-order they're listed
+    in the plan. Row `i` of every column belongs to the same node.
+
+    `plan_nodes` keeps references to the original node dicts (children included) for
+    properties that aren't flattened.
+    """
+
+    node_id: list[str] = field(default_factory=list)
+    # Tree position, the child ordinals from the root, e.g. "0", "0.0", "0.1"
+    path: list[str] = field(default_factory=list)
+    parent_node: list[str | None] = field(default_factory=list)
+    parent_row: list[int] = field(default_factory=list)  # -1 for the root
+    index: list[str] = field(default_factory=list)
+    depth: list[int] = field(default_factory=list)
+    branches: list[list[int]] = field(default_factory=list)
+    is_last_child: list[bool] = field(default_factory=list)
+    node_type: list[str] = field(default_factory=list)
+    node_type_detail: list[str] = field(default_factory=list)
+    description: list[str] = field(default_factory=list)
+    actual_rows: list[Any] = field(default_factory=list)
+    total_cost: list[Any] = field(default_factory=list)
+    actual_startup_time: list[Any] = field(default_factory=list)
+    actual_total_time: list[Any] = field(default_factory=list)
+    actual_loops: list[Any] = field(default_factory=list)
+    # Processes running the node, the launched workers and the leader under a Gather
+    processes: list[int] = field(default_factory=list)
+    plan_nodes: list[dict[str, Any]] = field(default_factory=list)
+    # One row of `IO_COLUMNS` per node, empty if the plan wasn't explained with BUFFERS
+    io_rows: list[list[float]] = field(default_factory=list)
+    # Rows of the CTE plans by the row of the node they're attached to and their
+    # name, CTEs of different subqueries can share a name
+    cte_plan_rows: dict[tuple[int, str], int] = field(default_factory=dict)
+    # Rows of the `CTE Scan`s reading each CTE plan, by the row of the CTE plan
+    cte_scan_rows: dict[int, list[int]] = field(default_factory=dict)
+
+    # Computed after the walk
+    inclusive_ms: npt.NDArray[np.float64] = field(default_factory=lambda: np.empty(0))
+    # Exclusive time, of the node without its children
+    timing_ms: npt.NDArray[np.float64] = field(default_factory=lambda: np.empty(0))
+    timing_proportion: npt.NDArray[np.float64] = field(
+        default_factory=lambda: np.empty(0)
+    )
+    timing: list[str] = field(default_factory=list)
+    timing_color: list[str] = field(default_factory=list)
+    # `IO_COLUMNS` of the node itself, without its children
+    io_exclusive: npt.NDArray[np.float64] = field(
+        default_factory=lambda: np.empty((0, 0))
+    )
+    cache_hit_ratio: list[float | None] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.node_id)
+
+    @property
+    def has_io(self) -> bool:
+        return bool(self.io_rows)
+
+    def io_totals(self) -> dict[str, Any]:
+        """I/O of the whole plan, the counters of its root node.
+
+        Example:
+            {"shared_hit_blocks": 120, "shared_read_blocks": 30, ...,
+             "cache_hit_ratio": 0.8}
+        """
+        if not self.has_io:
+            return {}
+        totals: dict[str, Any] = dict(zip(IO_COLUMNS, self.io_rows[0], strict=True))
+        totals[NE.CACHE_HIT_RATIO.value] = _hit_ratio(
+            totals["shared_hit_blocks"], totals["shared_read_blocks"]
+        )
+        return totals
+
+    def to_node_dicts(self) -> list[dict[str, Any]]:
+        "Returns one dict per node with all plan properties and the computed ones"
+        nodes_list = []
+        for i, plan_node in enumerate(self.plan_nodes):
+            node = {k: v for k, v in plan_node.items() if k != NE.PLANS}
+            if self.is_last_child[i]:
+                node[NE.IS_LAST_CHILD.value] = True
+            node.update(
+                {
+                    NE.NODE_ID.value: self.node_id[i],
+                    NE.PARENT_NODE.value: self.parent_node[i],
+                    NE.INDEX.value: self.index[i],
+                    NE.DEPTH.value: self.depth[i],
+                    NE.BRANCHES.value: self.branches[i],
+                    NE.TIMING.value: self.timing[i],
+                    NE.TIMING_COLOR.value: self.timing_color[i],
+                    NE.TIMING_MS.value: float(self.timing_ms[i]),
+                    NE.INCLUSIVE_MS.value: float(self.inclusive_ms[i]),
+                    NE.NODE_TYPE_DETAIL.value: self.node_type_detail[i],
+                    NE.DESCRIPTION.value: self.description[i],
+                    NE.TIMING_PROPORTION.value: float(self.timing_proportion[i]),
+                }
+            )
+            nodes_list.append(node)
+        return nodes_list
+
+
+def _hit_ratio(hit: float, read: float) -> float | None:
+    return round(hit / (hit + read), 4) if hit + read else None
+
+
+def _io_row(node: dict[str, Any]) -> list[float]:
+    row = [0.0] * len(IO_COLUMNS)
+    for key, column in _IO_COLUMN_OF.items():
+        value = node.get(key)
+        if value:
+            row[column] += value
+    return row
+
+
+def exclusive_of(
+    columns: PlanColumns, inclusive: npt.NDArray[np.float64]
+) -> npt.NDArray[np.float64]:
+    """Subtracts from each node's `inclusive` totals (one row per node) the totals
+    of its children, leaving what the node did itself.
+
+    InitPlans and SubPlans run as part of their parent, so they're subtracted like
+    any child, except CTEs. A CTE runs as its `CTE Scan`s pull rows from it, so
+    its totals are subtracted from those scans instead, the first scans paying
+    for as much as they include. Nodes whose children add up to more than they
+    include (e.g. rounding) are clamped to 0.
+    """
+    children = np.zeros_like(inclusive)
+    child_rows: npt.NDArray[np.intp] = np.arange(1, len(columns))
+    if columns.cte_plan_rows:
+        cte_rows = list(columns.cte_plan_rows.values())
+        child_rows = child_rows[~np.isin(child_rows, cte_rows)]
+    parent_row = np.asarray(columns.parent_row, dtype=np.intp)
+    np.add.at(children, parent_row[child_rows], inclusive[child_rows])
+    exclusive = inclusive - children
+
+    for cte_row, scan_rows in columns.cte_scan_rows.items():
+        cte_left = inclusive[cte_row].copy()
+        for scan_row in scan_rows:
+            paid = np.clip(np.minimum(cte_left, exclusive[scan_row]), 0, None)
+            exclusive[scan_row] -= paid
+            cte_left -= paid
+
+    return np.clip(exclusive, 0, None)
+
+
+def add_node_io(columns: PlanColumns) -> PlanColumns:
+    """Computes the I/O each node did itself, its counters minus its children's.
+
+    The counters are totals over all loops and processes running the node, so
+    they're subtracted as they are.
+    """
+    if not columns.has_io:
+        return columns
+
+    exclusive = np.round(
+        exclusive_of(columns, np.asarray(columns.io_rows, dtype=float)), 3
+    )
+
+    hit = exclusive[:, IO_COLUMNS.index("shared_hit_blocks")]
+    read = exclusive[:, IO_COLUMNS.index("shared_read_blocks")]
+    columns.io_exclusive = exclusive
+    columns.cache_hit_ratio = [
+        _hit_ratio(h, r) for h, r in zip(hit.tolist(), read.tolist(), strict=True)
+    ]
+    return columns
+
+
+def add_node_timing(columns: PlanColumns) -> PlanColumns:
+    """Computes the inclusive and exclusive time of all nodes at once.
+
+    `Actual Total Time` is the average of a loop, so the inclusive time is it
+    times `Actual Loops`. Under a Gather the loops of all processes are summed, so
+    it's divided by the processes to get the time the node took while they ran
+    in parallel. The exclusive time is what's left after subtracting the
+    children, see `exclusive_of`, and the timing proportion and color of each
+    node come from it.
+    """
+    total_time = np.asarray(columns.actual_total_time, dtype=float)
+    loops = np.asarray(columns.actual_loops, dtype=float)
+    processes = np.asarray(columns.processes, dtype=float)
+    inclusive_ms = total_time * loops / processes
+    timing_ms = np.round(exclusive_of(columns, inclusive_ms), 3)
+
+    total_timing = timing_ms.sum()
+    if total_timing:
+        timing_proportion = np.round(timing_ms / total_timing, 2)
     else:
-        return "#008000"
+        timing_proportion = np.zeros_like(timing_ms)
+    timing_pct = timing_proportion * 100
 
+    columns.inclusive_ms = np.round(inclusive_ms, 3)
+    columns.timing_ms = timing_ms
+    columns.timing_proportion = timing_proportion
+    columns.timing = [
+        f"{ms}ms | {pct:.0f}%"
+        for ms, pct in zip(timing_ms.tolist(), timing_pct, strict=True)
+    ]
+    columns.timing_color = np.select(
+        [
+            timing_proportion >= least_proportion
+            for least_proportion, _ in TIMING_COLORS
+        ],
+        [color for _, color in TIMING_COLORS],
+        default=FAST_TIMING_COLOR,
+    ).tolist()
 
-def add_node_timing(nodes_list: list[dict[str, Any]]) -> list[dict[str, Any]]:
-    total_timing = 0
-    for node in nodes_list:
-        total_timing += node[NE.TIMING_MS]
+    return columns
 
-    for node in nodes_list:
-        timing_ms = node[NE.TIMING_MS]
-        timing_proportion = round(timing_ms / total_timing, 2)
-        timing_pct = timing_proportion * 100
-        node[NE.TIMING.value] = f"{timing_ms}ms | {timing_pct:.0f}%"
-        node[NE.TIMING_PROPORTION.value] = timing_proportion
-        node[NE.TIMING_COLOR.value] = calc_timing_color(timing_proportion)
 
-    return nodes_list
+@sync_timing_tracker("flatten_plan")
+def flatten_plan(plan_dict: dict[str, Any]) -> PlanColumns:
+    """
+    Walks the plan once and flattens its nodes to columns, with the I/O columns
+    if the plan was explained with BUFFERS.
 
+    Nodes are listed depth first, with children in plan order. Node ids are
+    derived from the tree position, type and relation of the node, so the same
+    node gets the same id in every run of a plan.
+    """
+    columns = PlanColumns()
+    type_services: dict[str, NodeTypeService] = {}
+    has_io = NE.SHARED_HIT_BLOCKS in plan_dict
 
-def extract_nodes(plan_dict: dict[str, Any]) -> list[dict[str, Any]]:
-    nodes_list = []
-    stack: list[tuple[dict, str | None, int, list[int]]] = [
-        (plan_dict, None, 0, [])
-    ]  # (node, parent_id, depth, branches)
+    stack: list[tuple[dict[str, Any], str, int, int, list[int], bool]] = [
+        (plan_dict, "0", -1, 0, [], False)
+    ]  # (node, path, parent_row, depth, branches, is_last_child)
 
+    cte_scans: list[int] = []
     index = 0
     while stack:
-        node, parent_id, node_depth, branches = stack.pop()
+        node, path, parent_row, node_depth, branches, is_last_child = stack.pop()
         node_type = node.get(NE.NODE_TYPE, "Unknown")
-        node_id = f"{node_type}_{uuid.uuid4().hex[:8]}"
-
-        # Create node data excluding 'Plans'
-        node_data = {k: v for k, v in node.items() if k != NE.PLANS}
-
-        startup_time = node_data[NE.ACTUAL_STARTUP_TIME]
-        total_time = node_data[NE.ACTUAL_TOTAL_TIME]
-        timing = round(total_time - startup_time, 1)
-
-        type_service = NodeTypeService(node_type)
-        type_detail = type_service.create_node_type_detail(node_data)
-        description = type_service.get_description()
-        index_str = str(index) if len(str(index)) >= 2 else "0" + str(index)
-        current_node = {
-            **node_data,
-            NE.NODE_ID.value: node_id,
-            NE.PARENT_NODE.value: parent_id,
-            NE.INDEX.value: index_str,
-            NE.DEPTH.value: node_depth,
-            NE.BRANCHES.value: branches[:-1],
-            NE.TIMING.value: None,
-            NE.TIMING_COLOR.value: None,
-            NE.TIMING_MS.value: timing,
-            NE.NODE_TYPE_DETAIL.value: type_detail,
-            NE.DESCRIPTION.value: description,
-        }
-        nodes_list.append(current_node)
-        if NE.IS_LAST_CHILD in current_node and current_node[NE.IS_LAST_CHILD.value]:
-            branches.remove(node_depth - 1)
+        node_id = stable_node_id(path, node_type, relation_key(node))
+        parent_id = columns.node_id[parent_row] if parent_row >= 0 else None
 
-        children = node.get(NE.PLANS, [])
+        type_service = type_services.get(node_type)
+        if type_service is None:
+            type_service = type_services[node_type] = NodeTypeService(node_type)
 
-        for i, child in reversed(list(enumerate(children))):
-            if i == (len(children) - 1):
-                child[NE.IS_LAST_CHILD.value] = True
-            stack.append((child, node_id, node_depth + 1, branches + [node_depth]))
+        columns.node_id.append(node_id)
+        columns.path.append(path)
+        columns.parent_node.append(parent_id)
+        columns.parent_row.append(parent_row)
+        columns.index.append(str(index) if index >= 10 else "0" + str(index))
+        columns.depth.append(node_depth)
+        columns.branches.append(branches[:-1])
+        columns.is_last_child.append(is_last_child)
+        columns.node_type.append(node_type)
+        columns.node_type_detail.append(type_service.create_node_type_detail(node))
+        columns.description.append(type_service.get_description())
+        columns.actual_rows.append(node.get(NE.ACTUAL_ROWS))
+        columns.total_cost.append(node.get(NE.TOTAL_COST))
+        columns.actual_startup_time.append(node[NE.ACTUAL_STARTUP_TIME])
+        columns.actual_total_time.append(node[NE.ACTUAL_TOTAL_TIME])
+        columns.actual_loops.append(node.get(NE.ACTUAL_LOOPS, 1))
+        columns.plan_nodes.append(node)
 
-        index += 1
+        if parent_row < 0:
+            processes = 1
+        elif columns.node_type[parent_row] in GATHER_NODE_TYPES:
+            processes = columns.plan_nodes[parent_row].get(NE.WORKERS_LAUNCHED, 0) + 1
+        else:
+            processes = columns.processes[parent_row]
+        columns.processes.append(processes)
 
-    nodes_list = add_node_timing(nodes_list)
+        subplan_name = node.get(NE.SUBPLAN_NAME)
+        if subplan_name is not None and subplan_name.startswith("CTE "):
+            cte_key = (parent_row, subplan_name.removeprefix("CTE "))
+            columns.cte_plan_rows[cte_key] = index
+        elif node_type == "CTE Scan":
+            cte_scans.append(index)
+        if has_io:
+            columns.io_rows.append(_io_row(node))
 
-    return nodes_list
+        if is_last_child:
+            branches.remove(node_depth - 1)
 
+        children = node.get(NE.PLANS, [])
+        last_child = len(children) - 1
+        for i in range(last_child, -1, -1):
+            stack.append(
+                (
+                    children[i],
+                    f"{path}.{i}",
+                    index,
+                    node_depth + 1,
+                    branches + [node_depth],
+                    i == last_child,
+                )
+            )
 
-def process_explain_df(
-    df: pd.DataFrame,
-) -> pd.DataFrame:
-    df[PE.NODES.value] = df[PE.PLAN].apply(extract_nodes)
+        index += 1
 
-    df = df.drop(columns=[PE.PLAN])
+    _match_cte_scans(columns, cte_scans)
+    return add_node_io(add_node_timing(columns))
 
-    return df
 
+def _match_cte_scans(columns: PlanColumns, cte_scans: list[int]) -> None:
+    """Matches each `CTE Scan` with the CTE plan it reads, the one of its name
+    attached to itself or its closest ancestor, like the query levels scope CTE
+    names.
+    """
+    for scan_row in cte_scans:
+        cte_name: str = columns.plan_nodes[scan_row].get("CTE Name", "")
+        ancestor = scan_row
+        while ancestor >= 0:
+            cte_row = columns.cte_plan_rows.get((ancestor, cte_name))
+            if cte_row is not None:
+                columns.cte_scan_rows.setdefault(cte_row, []).append(scan_row)
+                break
+            ancestor = columns.parent_row[ancestor]
 
-def extract_node_series(
-    explain_df: pd.DataFrame,
-) -> pd.Series:
-    """Explodes nodes and returns them"""
-    explain_df = explain_df.explode(PE.NODES)
-    nodes = explain_df[PE.NODES]
-    assert isinstance(nodes, pd.Series)
 
-    return nodes
+def extract_nodes(plan_dict: dict[str, Any]) -> list[dict[str, Any]]:
+    "Returns plan nodes as dicts with all plan properties and the computed ones"
+    return flatten_plan(plan_dict).to_node_dicts()
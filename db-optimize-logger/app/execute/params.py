@@ -0,0 +1,179 @@
+import csv
+import datetime as dt
+import io
+import json
+from enum import StrEnum
+from typing import Any, Self
+
+from pydantic import BaseModel, Field, model_validator
+from sqlalchemy import text
+
+from app.core.profiling import timed_stage
+from app.execute.database import DatabaseInstance
+
+
+class ParamSource(StrEnum):
+    LIST = "list"  # JSON list of objects, e.g. `[{"user_id": 1}, {"user_id": 2}]`
+    CSV = "csv"  # CSV text, its header names the parameters
+    RANGE = "range"  # Numbers or ISO dates of `name` from `start` to `stop`
+    SQL = "sql"  # Rows of a query executed in each database, e.g. sampled ids
+
+
+class InvalidParamSetError(Exception):
+    def __init__(self, *args: object) -> None:
+        detail = "Invalid parameter set"
+        super().__init__(detail, args)
+
+
+class ParamSet(BaseModel):
+    "Values of the bind parameters a query is swept over, one run per row"
+
+    source: ParamSource
+    data: str = ""  # The JSON list, CSV text or SQL query of the source
+    # Parameter of a range, stepping from `start` to `stop`, both included. Steps of
+    # dates are in whole days
+    name: str | None = None
+    start: str | None = None
+    stop: str | None = None
+    step: float = 1
+    limit: int = Field(default=100, ge=1)  # Most rows swept over
+
+    @model_validator(mode="after")
+    def check_range(self) -> Self:
+        "The bounds and step of a range must all be dates or numbers"
+        if (
+            self.source == ParamSource.RANGE
+            and self.start is not None
+            and self.stop is not None
+        ):
+            range_values(self.start, self.stop, self.step, limit=1)
+        return self
+
+
+def _number(value: str) -> int | float:
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _iso_date(value: str) -> dt.date | None:
+    try:
+        return dt.date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def range_values(
+    start: str, stop: str, step: float, limit: int
+) -> list[str] | list[int | float]:
+    """Values of a range from `start` to `stop`, both included, at most `limit` of
+    them. Dates are returned as ISO strings.
+
+    Raises `ValueError` unless the bounds are both ISO dates, stepping by whole
+    days, or both numbers.
+    """
+    if step <= 0:
+        raise ValueError(f"Step of the range must be positive: {step}")
+
+    start_date, stop_date = _iso_date(start), _iso_date(stop)
+    if start_date is not None and stop_date is not None:
+        if not float(step).is_integer():
+            raise ValueError(f"Steps of a date range must be whole days: {step}")
+        days = int(step)
+        count = min(limit, max(0, (stop_date - start_date).days // days + 1))
+        return [
+            (start_date + dt.timedelta(days=days * i)).isoformat() for i in range(count)
+        ]
+    if start_date is not None or stop_date is not None:
+        raise ValueError("Range bounds must both be numbers or dates")
+
+    try:
+        start_number, stop_number = _number(start), _number(stop)
+    except ValueError as e:
+        raise ValueError(
+            f"Range bounds must be numbers or ISO dates: {start}, {stop}"
+        ) from e
+    number_step = _number(str(step))
+    values: list[int | float] = []
+    value = start_number
+    while value <= stop_number and len(values) < limit:
+        values.append(value)
+        # From the start each time, so float steps don't drift
+        value = round(start_number + number_step * len(values), 9)
+    return values
+
+
+def _range_rows(param_set: ParamSet) -> list[dict[str, Any]]:
+    if not param_set.name or param_set.start is None or param_set.stop is None:
+        raise InvalidParamSetError("A range needs a name, start and stop")
+    try:
+        values = range_values(
+            param_set.start, param_set.stop, param_set.step, param_set.limit
+        )
+    except ValueError as e:
+        raise InvalidParamSetError(str(e)) from e
+    return [{param_set.name: value} for value in values]
+
+
+def _json_value(value: Any) -> Any:
+    if value is None or isinstance(value, bool | int | float | str):
+        return value
+    return str(value)
+
+
+def resolve_param_rows(
+    param_set: ParamSet, database_instance: DatabaseInstance
+) -> list[dict[str, Any]]:
+    """Rows of parameter values of `param_set`, at most `limit` of them. The rows of
+    a SQL source are read from `database_instance`. Values that aren't JSON, like
+    dates and decimals, are converted to strings, which PostgreSQL casts to the
+    type of their parameter.
+
+    Raises `InvalidParamSetError` if the source can't be read.
+
+    Example:
+        ParamSet(source="range", name="day", start="2024-01-01", stop="2024-01-03")
+        -> [{"day": "2024-01-01"}, {"day": "2024-01-02"}, {"day": "2024-01-03"}]
+    """
+    match param_set.source:
+        case ParamSource.LIST:
+            try:
+                rows = json.loads(param_set.data)
+            except json.JSONDecodeError as e:
+                raise InvalidParamSetError(f"Parameter list isn't JSON: {e}") from e
+            if not isinstance(rows, list) or not all(
+                isinstance(row, dict) for row in rows
+            ):
+                raise InvalidParamSetError("Parameter list must be a list of objects")
+        case ParamSource.CSV:
+            try:
+                rows = list(csv.DictReader(io.StringIO(param_set.data.strip())))
+            except csv.Error as e:
+                raise InvalidParamSetError(f"Parameter CSV can't be read: {e}") from e
+        case ParamSource.RANGE:
+            rows = _range_rows(param_set)
+        case ParamSource.SQL:
+            with (
+                timed_stage("param_rows"),
+                database_instance.engine.connect() as conn,
+                conn.begin(),
+            ):
+                result = conn.execute(text(param_set.data))
+                rows = [dict(row._mapping) for row in result.fetchmany(param_set.limit)]
+
+    return [
+        {str(name): _json_value(value) for name, value in row.items()}
+        for row in rows[: param_set.limit]
+    ]
+
+
+def param_fields(params: dict[str, Any]) -> dict[str, Any]:
+    """Fields a record of a run with `params` is tagged with, the values as JSON and
+    one `param_<name>` field per parameter, to plot results against.
+
+    Example:
+        {"day": "2024-01-01"} -> {"params": '{"day": "2024-01-01"}', "param_day": "2024-01-01"}
+    """
+    fields: dict[str, Any] = {"params": json.dumps(params, default=str)}
+    for name, value in params.items():
+        fields[f"param_{name}"] = value
+    return fields
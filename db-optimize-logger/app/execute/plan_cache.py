@@ -0,0 +1,176 @@
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from dataclasses import asdict, dataclass
+from enum import StrEnum
+from pathlib import Path
+from typing import Any
+
+from app.core.config import settings
+from app.core.profiling import timed_stage
+
+PLAN_CACHE_DB = Path("/app/saves/plan_cache.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plan_cache (
+    key TEXT PRIMARY KEY,
+    sql_hash TEXT NOT NULL,
+    database_id TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plan_cache_pair
+    ON plan_cache (sql_hash, database_id, created_at);
+"""
+
+
+class RunMode(StrEnum):
+    EXECUTE = "execute"  # Executes every query, caching the results
+    CACHE = "cache"  # Reuses cached results while the database fingerprint matches
+    REPLAY = "replay"  # Re-emits the latest cached results, without PostgreSQL
+
+
+@dataclass
+class CachedRun:
+    "Result of one measured run of a (query, database) pair"
+
+    explain_dump: dict[str, Any]
+    count: int | None = None
+    verified_count: int | None = None
+    params: dict[str, Any] | None = None  # Values of the bind parameters
+    param_index: int | None = None
+    # Of prepared statements, see `ExplainRun`
+    plan_cache_mode: str | None = None
+    execution: int | None = None
+    generic_plan: bool | None = None
+    first_planning_time: float | None = None
+    cache_verified: bool = True
+
+
+def normalize_sql(sql: str) -> str:
+    "Collapses whitespace and drops the trailing `;`, which don't change the plan"
+    return " ".join(sql.split()).rstrip(";").rstrip()
+
+
+def sql_hash(sql: str) -> str:
+    return hashlib.sha256(normalize_sql(sql).encode()).hexdigest()
+
+
+class PlanCache:
+    """
+    Local cache of the explain results of (query, database) pairs, keyed by
+    normalized SQL hash, database id and database fingerprint.
+
+    Entries older than `ttl_seconds` are dropped, and the oldest ones once the
+    cache grows past `max_bytes`.
+
+    Usage:
+        cache = get_plan_cache()
+        runs = cache.get(sql, db.id, fingerprint)
+        if runs is None:
+            ...
+            cache.put(sql, db.id, fingerprint, runs)
+    """
+
+    def __init__(
+        self, path: Path = PLAN_CACHE_DB, *, ttl_seconds: float, max_bytes: int
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn:
+            conn.executescript(_SCHEMA)
+            with conn:
+                yield conn
+
+    def _oldest_valid(self) -> float:
+        return time.time() - self.ttl_seconds
+
+    def get(
+        self, sql: str, database_id: str, fingerprint: str
+    ) -> list[CachedRun] | None:
+        "Cached runs of the pair if the database fingerprint still matches"
+        key = f"{sql_hash(sql)}:{database_id}:{fingerprint}"
+        with timed_stage("plan_cache_read"), self._connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM plan_cache WHERE key = ? AND created_at >= ?",
+                (key, self._oldest_valid()),
+            ).fetchone()
+        return _load_runs(row[0]) if row else None
+
+    def latest(self, sql: str, database_id: str) -> list[CachedRun] | None:
+        "Latest cached runs of the pair, whatever the database fingerprint"
+        with timed_stage("plan_cache_read"), self._connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM plan_cache "
+                "WHERE sql_hash = ? AND database_id = ? AND created_at >= ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (sql_hash(sql), database_id, self._oldest_valid()),
+            ).fetchone()
+        return _load_runs(row[0]) if row else None
+
+    def put(
+        self, sql: str, database_id: str, fingerprint: str, runs: list[CachedRun]
+    ) -> None:
+        hashed = sql_hash(sql)
+        data = zlib.compress(
+            json.dumps([asdict(run) for run in runs], default=str).encode()
+        )
+        with timed_stage("plan_cache_write"), self._connection() as conn:
+            conn.execute(
+                "INSERT INTO plan_cache "
+                "(key, sql_hash, database_id, fingerprint, created_at, size, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET created_at = excluded.created_at, "
+                "size = excluded.size, data = excluded.data",
+                (
+                    f"{hashed}:{database_id}:{fingerprint}",
+                    hashed,
+                    database_id,
+                    fingerprint,
+                    time.time(),
+                    len(data),
+                    data,
+                ),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "DELETE FROM plan_cache WHERE created_at < ?", (self._oldest_valid(),)
+        )
+        # Drops the oldest entries past `max_bytes`, keeping the newest that fit
+        conn.execute(
+            "DELETE FROM plan_cache WHERE key IN ("
+            "SELECT key FROM ("
+            "SELECT key, SUM(size) OVER (ORDER BY created_at DESC, key) AS kept "
+            "FROM plan_cache"
+            ") WHERE kept > ?"
+            ")",
+            (self.max_bytes,),
+        )
+
+    def clear(self) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM plan_cache")
+
+
+def _load_runs(data: bytes) -> list[CachedRun]:
+    return [CachedRun(**run) for run in json.loads(zlib.decompress(data))]
+
+
+def get_plan_cache() -> PlanCache:
+    return PlanCache(
+        ttl_seconds=settings.PLAN_CACHE_TTL_HOURS * 3600,
+        max_bytes=settings.PLAN_CACHE_MAX_MB * 1024 * 1024,
+    )
@@ -0,0 +1,197 @@
+from dataclasses import dataclass
+from typing import Any
+
+from app.core.interface import NodeEnum as NE
+from app.core.interface import PlanEnum as PE
+from app.core.utils import sync_timing_tracker
+from app.execute.node_process import PlanColumns, flatten_plan, relation_key
+from app.logs.logger import plan_diff_logger
+from app.logs.sink import Record
+
+# Buffer counters compared between matched nodes, when either plan has them
+BUFFER_KEYS = {
+    NE.SHARED_HIT_BLOCKS: "shared_hit_blocks",
+    NE.SHARED_READ_BLOCKS: "shared_read_blocks",
+    NE.TEMP_READ_BLOCKS: "temp_read_blocks",
+    NE.TEMP_WRITTEN_BLOCKS: "temp_written_blocks",
+}
+
+
+@dataclass
+class PlanDiffPair:
+    "Two explain outputs of the same query to compare, e.g. from two databases"
+
+    query_name: str  # Name of the diff, shared by its records
+    label_a: str
+    label_b: str
+    explain_dump_a: dict[str, Any]
+    explain_dump_b: dict[str, Any]
+
+
+def match_nodes(
+    columns_a: PlanColumns, columns_b: PlanColumns
+) -> list[tuple[int | None, int | None]]:
+    """Pairs the rows of two plans, `None` on the side a node is missing from.
+
+    Nodes reading the same relation are matched first, in the order they appear,
+    so a scan is matched even if the plan around it changed shape. The rest are
+    matched by their position in the tree.
+    """
+    relations_a = [relation_key(node) for node in columns_a.plan_nodes]
+    relations_b = [relation_key(node) for node in columns_b.plan_nodes]
+
+    rows_b_by_relation: dict[str, list[int]] = {}
+    for row_b, relation in enumerate(relations_b):
+        if relation is not None:
+            rows_b_by_relation.setdefault(relation, []).append(row_b)
+
+    match_of_a: dict[int, int] = {}
+    matched_b: set[int] = set()
+    taken: dict[str, int] = {}
+    for row_a, relation in enumerate(relations_a):
+        if relation is None:
+            continue
+        candidates = rows_b_by_relation.get(relation, [])
+        occurrence = taken.get(relation, 0)
+        if occurrence < len(candidates):
+            match_of_a[row_a] = candidates[occurrence]
+            matched_b.add(candidates[occurrence])
+            taken[relation] = occurrence + 1
+
+    row_b_by_path = {path: row_b for row_b, path in enumerate(columns_b.path)}
+    for row_a, path in enumerate(columns_a.path):
+        if row_a in match_of_a:
+            continue
+        path_match = row_b_by_path.get(path)
+        if path_match is not None and path_match not in matched_b:
+            match_of_a[row_a] = path_match
+            matched_b.add(path_match)
+
+    pairs: list[tuple[int | None, int | None]] = [
+        (row_a, match_of_a.get(row_a)) for row_a in range(len(columns_a))
+    ]
+    pairs.extend(
+        (None, row_b) for row_b in range(len(columns_b)) if row_b not in matched_b
+    )
+    return pairs
+
+
+def _rows_error(node: dict[str, Any]) -> float | None:
+    """How many times more rows the node returned than estimated. Both are per
+    loop, so the inner side of a nested loop isn't inflated by its loop count.
+    """
+    plan_rows: float | None = node.get(NE.PLAN_ROWS)
+    actual_rows: float | None = node.get(NE.ACTUAL_ROWS)
+    if not plan_rows or actual_rows is None:
+        return None
+    return round(actual_rows / plan_rows, 3)
+
+
+def _delta(value_a: Any, value_b: Any) -> float | None:
+    if value_a is None or value_b is None:
+        return None
+    return round(float(value_b) - float(value_a), 3)
+
+
+def _side(columns: PlanColumns, row: int | None, suffix: str) -> dict[str, Any]:
+    if row is None:
+        return {
+            f"node_id_{suffix}": None,
+            f"index_{suffix}": None,
+            f"node_type_{suffix}": None,
+            f"timing_ms_{suffix}": None,
+            f"actual_rows_{suffix}": None,
+            f"rows_error_{suffix}": None,
+        }
+    node = columns.plan_nodes[row]
+    side = {
+        f"node_id_{suffix}": columns.node_id[row],
+        f"index_{suffix}": columns.index[row],
+        f"node_type_{suffix}": columns.node_type[row],
+        f"timing_ms_{suffix}": float(columns.timing_ms[row]),
+        f"actual_rows_{suffix}": node.get(NE.ACTUAL_ROWS),
+        f"rows_error_{suffix}": _rows_error(node),
+    }
+    for key, name in BUFFER_KEYS.items():
+        if key in node:
+            side[f"{name}_{suffix}"] = node[key]
+    return side
+
+
+def diff_plans(plan_a: dict[str, Any], plan_b: dict[str, Any]) -> list[dict[str, Any]]:
+    """Compares two plans node by node.
+
+    `change` is `same`, `type_changed` (e.g. Seq Scan to Index Scan), `removed`
+    (only in plan a) or `added` (only in plan b).
+
+    Example:
+        [{"change": "type_changed", "relation": "users", "node_type_a": "Seq Scan",
+          "node_type_b": "Index Scan", "timing_ms_delta": -12.3, ...}, ...]
+    """
+    columns_a = flatten_plan(plan_a)
+    columns_b = flatten_plan(plan_b)
+
+    node_diffs = []
+    for row_a, row_b in match_nodes(columns_a, columns_b):
+        node_diff = {**_side(columns_a, row_a, "a"), **_side(columns_b, row_b, "b")}
+        if row_a is None:
+            change = "added"
+        elif row_b is None:
+            change = "removed"
+        elif node_diff["node_type_a"] != node_diff["node_type_b"]:
+            change = "type_changed"
+        else:
+            change = "same"
+
+        node = columns_a.plan_nodes[row_a] if row_a is not None else None
+        if node is None and row_b is not None:
+            node = columns_b.plan_nodes[row_b]
+        node_diff["change"] = change
+        node_diff["relation"] = relation_key(node) if node is not None else None
+
+        for name in ["timing_ms", "actual_rows", "rows_error", *BUFFER_KEYS.values()]:
+            if f"{name}_a" in node_diff or f"{name}_b" in node_diff:
+                node_diff[f"{name}_delta"] = _delta(
+                    node_diff.get(f"{name}_a"), node_diff.get(f"{name}_b")
+                )
+        node_diffs.append(node_diff)
+
+    return node_diffs
+
+
+@sync_timing_tracker("plan_diff")
+def build_plan_diff_records(pair: PlanDiffPair) -> list[Record]:
+    """One `plan_diff` summary record of the two plans and one `node_diff` record per
+    matched, added or removed node.
+    """
+    node_diffs = diff_plans(pair.explain_dump_a[PE.PLAN], pair.explain_dump_b[PE.PLAN])
+    changes = [node_diff["change"] for node_diff in node_diffs]
+
+    common = {"query_name": pair.query_name, "a": pair.label_a, "b": pair.label_b}
+    summary = {
+        **common,
+        "record_type": "plan_diff",
+        "nodes_a": sum(change != "added" for change in changes),
+        "nodes_b": sum(change != "removed" for change in changes),
+        "type_changed": changes.count("type_changed"),
+        "added": changes.count("added"),
+        "removed": changes.count("removed"),
+    }
+    for time_key, name in [
+        (PE.EXECUTION_TIME, "execution_time"),
+        (PE.PLANNING_TIME, "planning_time"),
+    ]:
+        summary[f"{name}_a"] = pair.explain_dump_a.get(time_key)
+        summary[f"{name}_b"] = pair.explain_dump_b.get(time_key)
+        summary[f"{name}_delta"] = _delta(summary[f"{name}_a"], summary[f"{name}_b"])
+
+    records = [Record(plan_diff_logger, summary, "plan_diff")]
+    for node_diff in node_diffs:
+        records.append(
+            Record(
+                plan_diff_logger,
+                {**common, "record_type": "node_diff", **node_diff},
+                "node_diff",
+            )
+        )
+    return records
@@ -0,0 +1,45 @@
+import multiprocessing
+import threading
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any
+
+from app.core.config import settings
+
+_PROCESSOR: Executor | None = None
+_PROCESSOR_LOCK = threading.Lock()
+
+
+class InlineExecutor(Executor):
+    "Runs each submitted call right away in the calling thread"
+
+    def submit(
+        self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any
+    ) -> Future[Any]:
+        future: Future[Any] = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def get_plan_processor() -> Executor:
+    """Returns the process pool that builds records from plans, created on first use.
+
+    The pool is kept for the lifetime of the app, so runs don't pay for starting
+    the worker processes. Plans are processed in the calling thread if
+    `PLAN_PROCESS_WORKERS` is 0.
+    """
+    global _PROCESSOR
+    with _PROCESSOR_LOCK:
+        if _PROCESSOR is None:
+            if settings.PLAN_PROCESS_WORKERS > 0:
+                # Spawned since forking the threaded app process can deadlock
+                _PROCESSOR = ProcessPoolExecutor(
+                    max_workers=settings.PLAN_PROCESS_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                _PROCESSOR = InlineExecutor()
+        return _PROCESSOR
@@ -0,0 +1,189 @@
+import re
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any
+from uuid import uuid4
+
+from sqlalchemy import Connection, TextClause, text
+
+from app.core.profiling import timed_stage
+from app.execute.database import DatabaseInstance
+
+# `:name` bind parameters, but not the `::type` casts
+BIND_PARAM_PATTERN = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+
+
+class PlanCacheMode(StrEnum):
+    AUTO = "auto"  # Custom plans for the first 5 executions, then generic if cheaper
+    FORCE_CUSTOM = "force_custom_plan"  # Planned for the values of every execution
+    FORCE_GENERIC = "force_generic_plan"  # Planned once, for any values
+
+
+# Plan cache modes a comparison of custom and generic plans runs under
+COMPARED_PLAN_CACHE_MODES = [PlanCacheMode.FORCE_CUSTOM, PlanCacheMode.FORCE_GENERIC]
+
+
+def plan_label(plan_cache_mode: PlanCacheMode) -> str:
+    "Short name of the plans of `plan_cache_mode`, e.g. `generic`"
+    return str(plan_cache_mode).removeprefix("force_").removesuffix("_plan")
+
+
+def bind_param_names(sql: str) -> list[str]:
+    "Names of the `:name` bind parameters of `sql`, in order of first use"
+    return list(dict.fromkeys(BIND_PARAM_PATTERN.findall(sql)))
+
+
+@dataclass
+class PreparedStatement:
+    """A statement prepared server side and explained with `EXECUTE`.
+
+    Example:
+        PreparedStatement.from_sql(
+            "EXPLAIN (ANALYZE, FORMAT JSON)", "SELECT * FROM users WHERE id = :id"
+        )
+        -> PREPARE dol_1a2b3c AS SELECT * FROM users WHERE id = $1
+        -> EXPLAIN (ANALYZE, FORMAT JSON) EXECUTE dol_1a2b3c(:id)
+    """
+
+    name: str
+    explain_options: str  # e.g. "EXPLAIN (ANALYZE, FORMAT JSON)"
+    statement_sql: str  # Statement with `$1`, `$2`, ... parameters
+    param_names: list[str]
+
+    @classmethod
+    def from_sql(cls, explain_options: str, statement_sql: str) -> "PreparedStatement":
+        param_names = bind_param_names(statement_sql)
+        positional_sql = BIND_PARAM_PATTERN.sub(
+            lambda match: f"${param_names.index(match.group(1)) + 1}", statement_sql
+        )
+        return cls(
+            name=f"dol_{uuid4().hex[:12]}",
+            explain_options=explain_options.strip(),
+            statement_sql=positional_sql.strip().rstrip(";"),
+            param_names=param_names,
+        )
+
+    def explain(self, params: dict[str, Any] | None = None) -> TextClause:
+        "`EXPLAIN ... EXECUTE` of the statement with `params` as its arguments"
+        params = params or {}
+        execute = f"EXECUTE {self.name}"
+        if self.param_names:
+            execute += f"({', '.join(f':{name}' for name in self.param_names)})"
+        return text(f"{self.explain_options} {execute}").bindparams(
+            **{name: params.get(name) for name in self.param_names}
+        )
+
+
+@contextmanager
+def prepared_session(
+    database_instance: DatabaseInstance,
+    prepared: PreparedStatement,
+    plan_cache_mode: PlanCacheMode,
+    transaction: Connection | None = None,
+) -> Iterator[Connection]:
+    """Connection with `prepared` prepared and `plan_cache_mode` set, both undone
+    before it goes back to the pool.
+
+    With a `transaction` from `rollback_transaction`, it's prepared on the connection
+    of the transaction instead.
+
+    Usage:
+        with prepared_session(db, prepared, PlanCacheMode.AUTO) as session:
+            execute_explain_stmt(..., statement=prepared.explain(params), session=session)
+    """
+    if transaction is not None:
+        _prepare(transaction, prepared, plan_cache_mode)
+        try:
+            yield transaction
+        finally:
+            _deallocate(transaction, prepared)
+        return
+
+    with timed_stage("connect"):
+        conn = database_instance.engine.connect()
+    with conn:
+        _prepare(conn, prepared, plan_cache_mode)
+        conn.commit()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction():
+                conn.rollback()
+            _deallocate(conn, prepared)
+            conn.commit()
+
+
+def _prepare(
+    conn: Connection, prepared: PreparedStatement, plan_cache_mode: PlanCacheMode
+) -> None:
+    with timed_stage("prepare"):
+        conn.execute(
+            text("SELECT set_config('plan_cache_mode', :mode, false)"),
+            {"mode": str(plan_cache_mode)},
+        )
+        conn.exec_driver_sql(
+            f"PREPARE {prepared.name} AS {prepared.statement_sql}",
+            execution_options={"no_parameters": True},
+        )
+
+
+def _deallocate(conn: Connection, prepared: PreparedStatement) -> None:
+    conn.exec_driver_sql(f"DEALLOCATE {prepared.name}")
+    conn.exec_driver_sql("RESET plan_cache_mode")
+
+
+def read_generic_plans(conn: Connection, prepared: PreparedStatement) -> int | None:
+    """How many times `prepared` was executed with its generic plan in the session
+    of `conn`. `None` before PostgreSQL 14, which doesn't count them.
+    """
+    server_version = conn.dialect.server_version_info or (0,)
+    if server_version < (14,):
+        return None
+
+    statement = text(
+        "SELECT generic_plans FROM pg_prepared_statements WHERE name = :name"
+    )
+    generic_plans: int
+    if conn.in_transaction():
+        generic_plans = conn.execute(statement, {"name": prepared.name}).scalar_one()
+    else:
+        with conn.begin():
+            generic_plans = conn.execute(
+                statement, {"name": prepared.name}
+            ).scalar_one()
+    return generic_plans
+
+
+class PreparedExecutions:
+    """Counts the executions of a prepared statement in its session and whether
+    each used the generic plan.
+
+    Usage:
+        executions = PreparedExecutions(session, prepared)
+        execute_explain_stmt(..., statement=prepared.explain(params), session=session)
+        generic_plan = executions.executed()
+    """
+
+    def __init__(self, session: Connection, prepared: PreparedStatement):
+        self.session = session
+        self.prepared = prepared
+        self.count = 0
+        self._generic_plans = read_generic_plans(session, prepared)
+
+    def executed(self) -> bool | None:
+        "Counts an execution, returns whether it used the generic plan if known"
+        self.count += 1
+        if self._generic_plans is None:
+            return None
+        generic_plans = read_generic_plans(self.session, self.prepared)
+        assert generic_plans is not None
+        generic_plan = generic_plans > self._generic_plans
+        self._generic_plans = generic_plans
+        return generic_plan
+
+    def sync(self) -> None:
+        "Catches up with executions that weren't counted, e.g. a timed out one"
+        if self._generic_plans is not None:
+            self._generic_plans = read_generic_plans(self.session, self.prepared)
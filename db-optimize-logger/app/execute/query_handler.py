@@ -1,32 +1,108 @@
-import os
+import hashlib
+import json
+import queue
 import re
-from collections.abc import Callable
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
+from itertools import zip_longest
 from pathlib import Path
-from uuid import uuid4
+from typing import Any
 
+import numpy as np
 import pandas as pd
 from pydantic import BaseModel, Field, field_validator
-from sqlalchemy import TextClause, text
-
-from app.core.interface import PlanEnum
-from app.core.utils import log_key_value
+from sqlalchemy import Connection, TextClause, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.core.config import settings
+from app.core.interface import NodeEnum, PlanEnum
+from app.core.profiling import (
+    StageTimer,
+    activate,
+    get_active_timer,
+    submit_in_context,
+    timed_stage,
+)
+from app.core.utils import sync_timing_tracker
+from app.execute.benchmark import (
+    summarize_node_timings,
+    summarize_plan_times,
+    summarize_prepared_planning,
+)
+from app.execute.cache_state import CacheControl, CacheMode
 from app.execute.database import (
     DatabaseInstance,
+    RollbackMode,
+    StatementTimeoutError,
+    cancel_running_statements,
+    database_fingerprint,
     execute_count_stmt,
     execute_explain_stmt,
     find_database_instance,
+    rollback_transaction,
 )
 from app.execute.node_graph_plan import (
-    create_graphedge_table,
-    create_graphnode_table,
-    create_level_divider,
-    create_node_metrics_df,
+    iter_graph_edges,
+    iter_graph_nodes,
+    iter_level_lines,
+    iter_node_metrics,
+)
+from app.execute.node_process import flatten_plan
+from app.execute.params import (
+    InvalidParamSetError,
+    ParamSet,
+    param_fields,
+    resolve_param_rows,
+)
+from app.execute.plan_cache import CachedRun, PlanCache, RunMode, get_plan_cache
+from app.execute.plan_diff import PlanDiffPair, build_plan_diff_records
+from app.execute.plan_processor import InlineExecutor, get_plan_processor
+from app.execute.prepared import (
+    COMPARED_PLAN_CACHE_MODES,
+    PlanCacheMode,
+    PreparedExecutions,
+    PreparedStatement,
+    bind_param_names,
+    plan_label,
+    prepared_session,
+)
+from app.execute.run_archive import (
+    ArchivedPlan,
+    RunArchiveWriter,
+    archive_enabled,
+    archive_plan,
+    read_archived_runs,
 )
-from app.execute.node_process import extract_node_series, process_explain_df
-from app.logs.logger import app_logger, explain_logger, graph_node_logger
+from app.execute.run_job import RunJob
+from app.execute.saves import (
+    SavesIndex,
+    delete_all_items,
+    delete_item,
+    load_items,
+    migrate_csv_once,
+    replace_all_items,
+    upsert_item,
+)
+from app.logs.logger import (
+    app_logger,
+    benchmark_logger,
+    explain_logger,
+    graph_node_logger,
+)
+from app.logs.sink import Record, RecordSink
+
+QUERIES_SAVES_CSV = Path("/app/saves/queries.csv")  # Legacy, migrated to SAVES_DB
+QUERIES_TABLE = "queries"
 
-QUERIES_SAVES_CSV = Path("/app/saves/queries.csv")
+EXPLAIN_OPTIONS_PATTERN = re.compile(r"^\s*EXPLAIN\s*\(([^)]*)\)", re.IGNORECASE)
+IO_EXPLAIN_OPTIONS = ["BUFFERS", "WAL", "SETTINGS", "TIMING"]
+# Writes, but not the row locks of `SELECT ... FOR [NO KEY] UPDATE`
+DATA_MODIFYING_PATTERN = re.compile(
+    r"(?<!FOR )(?<!KEY )\b(INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE
+)
 
 
 class Query(BaseModel):
@@ -35,14 +111,37 @@ class Query(BaseModel):
     database_ids: list[str] = Field(min_length=1)
     sql: str = Field(min_length=1)
     repeat: int | None
-    query_count: bool
+    query_count: bool  # Whether to log the rows returned, from the plan
     active: bool = True  # Whether to execute query or not
+    warmup: int | None = None  # Runs executed before the measured ones and discarded
+    benchmark: bool = False  # Whether to log a summary of the measured runs
+    # Whether to check the plan's row count with a `COUNT(*)`, once per database
+    verify_count: bool = False
+    # Whether to add `BUFFERS, WAL, SETTINGS, TIMING` to the EXPLAIN options
+    explain_io: bool = False
+    # Whether to roll back the writes of the statements, see `RollbackMode`
+    rollback: RollbackMode = RollbackMode.OFF
+    # State of the caches the measured runs start from, see `CacheMode`
+    cache_mode: CacheMode = CacheMode.ANY
+    # Values of the `:name` bind parameters of `sql` to sweep over, each row is run
+    # as a prepared statement
+    params: ParamSet | None = None
+    # Whether to `PREPARE` the statement once and explain it with `EXECUTE`
+    prepared: bool = False
+    # `plan_cache_mode` the prepared statements are executed under
+    plan_cache_mode: PlanCacheMode = PlanCacheMode.AUTO
+    # Whether to execute the prepared statements with both custom and generic plans
+    # and diff them, instead of under `plan_cache_mode`
+    compare_plans: bool = False
+    # Overrides `STATEMENT_TIMEOUT_MS` and `LOCK_TIMEOUT_MS` for this query
+    statement_timeout_ms: int | None = None
+    lock_timeout_ms: int | None = None
 
     @property
     def statement(self) -> TextClause:
         return text(self.sql)
 
-    @field_validator("repeat")
+    @field_validator("repeat", "warmup", "statement_timeout_ms", "lock_timeout_ms")
     @classmethod
     def convert_none(cls, v: int) -> int | None:
         if v == 0:
@@ -60,6 +159,12 @@ class QueryList:
         # Found this PR: https://github.com/zauberzeug/nicegui/pull/1951 but not sure if it got merged properly
         if db_query.repeat is not None:
             db_query.repeat = int(db_query.repeat)
+        if db_query.warmup is not None:
+            db_query.warmup = int(db_query.warmup)
+        if db_query.statement_timeout_ms is not None:
+            db_query.statement_timeout_ms = int(db_query.statement_timeout_ms)
+        if db_query.lock_timeout_ms is not None:
+            db_query.lock_timeout_ms = int(db_query.lock_timeout_ms)
         self.items.append(db_query)
         self.on_change()
 
@@ -69,243 +174,1425 @@ class QueryList:
 
 
 class NoQueriesFoundError(Exception):
-    def __init__(self, *args):
+    def __init__(self, *args: object) -> None:
         detail = "Found no saved queries"
         super().__init__(detail, args)
 
 
-def read_queries_saves_df() -> pd.DataFrame:
-    try:
-        saves_df = pd.read_csv(
-            QUERIES_SAVES_CSV,
-            dtype={
-                "id": "string",
-                "database_ids": "string",
-                "name": "string",
-                "sql": "string",
-                "repeat": "Int64",
-                "query_count": "boolean",
-                "active": "boolean",
-            },
+def parse_database_ids(database_ids: str) -> list[str]:
+    "Parses `query.database_ids` field of the legacy csv saves to a list"
+    if database_ids == "[]":
+        return []
+    return database_ids[1:-1].replace("'", "").split(", ")
+
+
+def _read_queries_csv() -> list[tuple[str, str]]:
+    "Reads the legacy csv saves, only used to migrate them to the saves database"
+    saves_df = pd.read_csv(
+        QUERIES_SAVES_CSV,
+        dtype={
+            "id": "string",
+            "database_ids": "string",
+            "name": "string",
+            "sql": "string",
+            "repeat": "Int64",
+            "query_count": "boolean",
+            "active": "boolean",
+        },
+    )
+    saves_df["repeat"] = saves_df["repeat"].fillna(0).astype("int64")
+    saves_df = saves_df.replace({np.nan: None, pd.NA: None, pd.NaT: None})
+
+    items = []
+    for row in saves_df.to_dict(orient="records"):
+        query = Query(
+            id=row["id"],
+            name=row["name"],
+            database_ids=parse_database_ids(row["database_ids"]),
+            sql=row["sql"],
+            repeat=row["repeat"],
+            query_count=bool(row["query_count"]),
+            active=bool(row["active"]),
         )
-        saves_df["repeat"] = saves_df["repeat"].fillna(0).astype("int64")
-    except FileNotFoundError:
-        raise NoQueriesFoundError
+        items.append((query.id, query.model_dump_json()))
+    return items
 
-    if saves_df.empty:
-        raise NoQueriesFoundError
 
-    return saves_df
+def _load_queries() -> dict[str, Query]:
+    migrate_csv_once(
+        name="queries_csv",
+        table=QUERIES_TABLE,
+        csv_path=QUERIES_SAVES_CSV,
+        read_items=_read_queries_csv,
+    )
+    return {
+        id: Query.model_validate_json(data) for id, data in load_items(QUERIES_TABLE)
+    }
 
 
-def parse_database_ids(database_ids: str) -> list[str]:
-    "Parses `query.database_ids` field to a list"
-    if database_ids == "[]":
-        return []
-    return database_ids[1:-1].replace("'", "").split(", ")
+_queries_index = SavesIndex(QUERIES_TABLE, load=_load_queries)
 
 
 def find_query(id: str) -> Query:
-    """Checks and returns if query with id specified exists in saves file.
+    """Checks and returns if query with id specified exists in saves.
 
     Raises exception if the query wasn't found.
     """
-    saves_df = read_queries_saves_df()
-
-    id_existing_index = saves_df.index[saves_df["id"] == id].to_list()
-    if not id_existing_index:
-        raise NoQueriesFoundError("Couldn't find db query id specified in saves file")
-
-    id_existing_index = saves_df.iloc[id_existing_index]
-    database_ids = parse_database_ids(id_existing_index["database_ids"].values[0])
-
-    return Query(
-        id=id_existing_index["id"].values[0],
-        name=id_existing_index["name"].values[0],
-        database_ids=database_ids,
-        sql=id_existing_index["sql"].values[0],
-        repeat=id_existing_index["repeat"].values[0],
-        query_count=id_existing_index["query_count"].values[0],
-        active=id_existing_index["active"].values[0],
-    )
+    query = _queries_index.get(id)
+    if query is None:
+        raise NoQueriesFoundError("Couldn't find db query id specified in saves")
 
+    return query.model_copy(deep=True)
 
-def delete_query(id: str) -> None:
-    find_query(id)  # Check if query exist and handle it
 
-    saves_df = read_queries_saves_df()
+def read_queries() -> list[Query]:
+    "Returns copies of all saved queries, in the order they were saved"
+    return [query.model_copy(deep=True) for query in _queries_index.items().values()]
+
 
-    id_existing_index = saves_df.index[saves_df["id"] == id].to_list()
-    saves_df = saves_df.drop(id_existing_index)
+def delete_query(id: str) -> None:
+    if not delete_item(QUERIES_TABLE, id):
+        raise NoQueriesFoundError("Couldn't find db query id specified in saves")
 
-    saves_df.to_csv(QUERIES_SAVES_CSV, index=False)
+    _queries_index.invalidate()
 
 
 def delete_all_queries() -> None:
-    try:
-        os.remove(QUERIES_SAVES_CSV)
-    except FileNotFoundError:
-        app_logger.info("All queries are already deleted")
+    delete_all_items(QUERIES_TABLE)
+    _queries_index.invalidate()
 
 
 def save_query(query: Query) -> None:
-    "Saves `query` to a row in query saves csv file."
-    try:
-        saves_df = read_queries_saves_df()
-    except NoQueriesFoundError:
-        cols = pd.Index(
-            ["id", "database_ids", "name", "sql", "repeat", "query_count", "active"]
-        )
-        saves_df = pd.DataFrame(columns=cols)
-        saves_df.to_csv(QUERIES_SAVES_CSV, index=False)
-    query_dump = query.model_dump()
-
-    query_df = pd.DataFrame([query_dump])
-    query_df = query_df.reindex(columns=saves_df.columns, fill_value=None)
-
-    id_existing_index = saves_df.index[saves_df["id"] == query.id].to_list()
-    if id_existing_index:
-        saves_df = saves_df.drop(id_existing_index)
+    "Saves `query` to a row in the saves database, replacing the row with the same id"
+    upsert_item(QUERIES_TABLE, query.id, query.model_dump_json())
+    _queries_index.invalidate()
 
-    saves_df = pd.concat([saves_df, query_df], ignore_index=True)
 
-    saves_df.to_csv(QUERIES_SAVES_CSV, index=False)
+def save_all_queries(queries: list[Query]) -> None:
+    "Replaces all saved queries with `queries` in one transaction"
+    replace_all_items(
+        QUERIES_TABLE, [(query.id, query.model_dump_json()) for query in queries]
+    )
+    _queries_index.invalidate()
 
 
-def query_run_times(query_row: pd.Series) -> int:
+def query_run_times(query: Query) -> int:
     "Finds how many times to run a query based on `repeat` property"
-    repeat = query_row.loc["repeat"]
-    if pd.isna(repeat):
-        repeat = 0
-    else:
-        repeat = int(repeat)
+    repeat = query.repeat or 0
     run_times = repeat + 1 if repeat > 0 else 1
     return run_times
 
 
-def define_query_name(query_row: pd.Series, db_name: str) -> str:
-    "Defines an unique name for query with db_instance partial uuid4"
-    run_id = str(uuid4())[:6]
-    query_name = f"{query_row['name']}__{db_name}__{run_id}"
-    return query_name
+def warmup_runs(query: Query) -> int:
+    "Warm-up runs of `query`, at least one if its cache mode is warm"
+    warmup = query.warmup or 0
+    if query.cache_mode == CacheMode.WARM:
+        return max(warmup, 1)
+    return warmup
+
+
+def statement_count(query: Query) -> int:
+    "Number of statements executed for `query` in each of its databases"
+    verify_statements = 1 if query.query_count and query.verify_count else 0
+    return warmup_runs(query) + query_run_times(query) + verify_statements
+
+
+def define_query_name(
+    query: Query,
+    db_name: str,
+    run_id: str,
+    repeat: int | str,
+    param_index: int | None = None,
+    plan_label: str | None = None,
+) -> str:
+    """Defines an unique name for a repeat of query with db_instance in run `run_id`,
+    the row of parameter values `param_index` and the plans compared `plan_label`
+    if the query has them. Warm-ups get `"warmup"` as `repeat`.
+
+    Example:
+        "orders__prod__1a2b3c-p2-generic-0"
+    """
+    query_name = f"{query.name}__{db_name}__{run_id[:6]}"
+    if param_index is not None:
+        query_name += f"-p{param_index}"
+    if plan_label is not None:
+        query_name += f"-{plan_label}"
+    return f"{query_name}-{repeat}"
+
+
+def define_query_key(query_id: str, database_id: str) -> str:
+    """Key of a (query, database) pair, the same in every run and kept when the
+    query or database is renamed.
+    """
+    return hashlib.sha256(f"{query_id}:{database_id}".encode()).hexdigest()[:16]
+
+
+def query_timeouts(query: Query) -> dict[str, int | None]:
+    "Timeouts of the statements of `query`, falling back on the global ones"
+    return {
+        "statement_timeout_ms": query.statement_timeout_ms
+        or settings.STATEMENT_TIMEOUT_MS
+        or None,
+        "lock_timeout_ms": query.lock_timeout_ms or settings.LOCK_TIMEOUT_MS or None,
+    }
+
+
+def plan_row_count(explain_dump: dict[str, Any]) -> int:
+    """Rows returned by the executed statement, from its top plan node.
 
+    `Actual Rows` is the average per loop, so it's multiplied by `Actual Loops`.
+    """
+    top_node = explain_dump[PlanEnum.PLAN]
+    rows: float = top_node.get(NodeEnum.ACTUAL_ROWS, 0)
+    loops: float = top_node.get(NodeEnum.ACTUAL_LOOPS, 1)
+    return round(rows * loops)
+
+
+def explain_sql(query: Query) -> str:
+    """SQL executed for `query`, with `IO_EXPLAIN_OPTIONS` added to the EXPLAIN
+    options if `explain_io`. Options already given are kept as they are.
+
+    Example:
+        "EXPLAIN (ANALYZE, FORMAT JSON) SELECT 1"
+        -> "EXPLAIN (ANALYZE, FORMAT JSON, BUFFERS, WAL, SETTINGS, TIMING) SELECT 1"
+    """
+    if not query.explain_io:
+        return query.sql
+
+    match = EXPLAIN_OPTIONS_PATTERN.match(query.sql)
+    if match is None:
+        return query.sql
+
+    options = [option.strip() for option in match.group(1).split(",")]
+    given = {option.split()[0].upper() for option in options if option}
+    options += [option for option in IO_EXPLAIN_OPTIONS if option not in given]
+    return (
+        f"{query.sql[: match.start(1)]}{', '.join(options)}{query.sql[match.end(1) :]}"
+    )
 
-def get_count(*, sql_str: str, query_name: str, db_instance: DatabaseInstance) -> int:
-    pattern = r"^\s*EXPLAIN\s*\(\s*ANALYZE\s*,\s*FORMAT\s*JSON\s*\)\s*"
-    original_sql = re.sub(pattern, "", sql_str, flags=re.IGNORECASE).strip()
+
+def is_prepared(query: Query) -> bool:
+    "Whether `query` is executed as a prepared statement, always with parameters"
+    return query.prepared or query.compare_plans or query.params is not None
+
+
+def prepared_statement(query: Query, sql_str: str) -> PreparedStatement:
+    "Prepared statement of the EXPLAIN statement `sql_str` of `query`"
+    match = EXPLAIN_OPTIONS_PATTERN.match(sql_str)
+    if match is None:
+        raise ValueError(
+            f"Can't prepare a statement without `EXPLAIN (...)` options: {query.name}"
+        )
+    return PreparedStatement.from_sql(sql_str[: match.end()], sql_str[match.end() :])
+
+
+@sync_timing_tracker("count")
+def get_count(
+    *,
+    sql_str: str,
+    query_name: str,
+    db_instance: DatabaseInstance,
+    statement_timeout_ms: int | None = None,
+    lock_timeout_ms: int | None = None,
+    params: dict[str, Any] | None = None,
+    job: RunJob | None = None,
+) -> int:
+    original_sql = EXPLAIN_OPTIONS_PATTERN.sub("", sql_str).strip()
     if original_sql.endswith(";"):
         original_sql = original_sql[:-1].strip()
     if not original_sql.startswith("SELECT"):
         raise ValueError(f"Can't perform COUNT(*) on non-`SELECT` query: {query_name}")
     count_sql = text(f"SELECT COUNT(*) FROM ({original_sql}) AS count_subquery")
+    if params is not None:
+        count_sql = count_sql.bindparams(
+            **{name: params.get(name) for name in bind_param_names(original_sql)}
+        )
     count_dump = execute_count_stmt(
         database_instance=db_instance,
         statement=count_sql,
         query_name=query_name,
+        statement_timeout_ms=statement_timeout_ms,
+        lock_timeout_ms=lock_timeout_ms,
+        job=job,
     )
-    return count_dump["count"]
+    count: int = count_dump["count"]
+    return count
 
 
-def process_queries(queries: pd.DataFrame) -> None:
-    "This function is crap and needs to be refactored and more tidy"
+@dataclass
+class ExplainRun:
+    "One executed explain statement, ready to be processed and logged"
+
+    query: Query
+    db_instance: DatabaseInstance
+    query_name: str
+    explain_dump: dict[Any, Any] | None  # None if the statement timed out or failed
+    count: int | None = None  # Rows returned, from the plan
+    verified_count: int | None = None  # Rows returned, from `COUNT(*)`
+    timeout_error: str | None = None
+    # Couldn't be executed at all, e.g. its parameter rows couldn't be read, with
+    # the reason in `timeout_error`
+    failed: bool = False
+    run_id: str | None = None  # Run the statement was executed in
+    repeat: int = 0  # Measured run of the pair in its run, from 0
+    archived: bool = False  # Whether the plan is already in the run archive
+    params: dict[str, Any] | None = None  # Values of the bind parameters
+    param_index: int | None = None  # Row of `params` in the query's parameter set
+    # Of prepared statements, `None` otherwise
+    plan_cache_mode: PlanCacheMode | None = None
+    execution: int | None = None  # Execution in the session, warm-ups included
+    generic_plan: bool | None = None  # None before PostgreSQL 14
+    first_planning_time: float | None = None  # Of the first execution in the session
+    # Whether the caches were brought to the query's `cache_mode`, see `CacheControl`
+    cache_verified: bool = True
 
-    for index, (_, query_row) in enumerate(queries.iterrows(), start=1):
-        if not query_row.active:
-            continue
+    @property
+    def query_key(self) -> str:
+        return define_query_key(self.query.id, self.db_instance.id)
 
-        database_ids = parse_database_ids(query_row.database_ids)
-        db_instances: list[DatabaseInstance] = []
-        for db_id in database_ids:
-            db_instances.append(find_database_instance(db_id))
+    def run_fields(self) -> dict[str, Any]:
+        "Fields that join the records of the run with other runs of the pair"
+        return {
+            "run_id": self.run_id,
+            "query_key": self.query_key,
+            "repeat": self.repeat,
+        }
 
-        run_times = query_run_times(query_row)
-        for db_instance in db_instances:
-            for _ in range(run_times):
-                explain_log_obj = {}
+    @property
+    def compared_plan(self) -> str | None:
+        "Plans of the run if its query compares custom and generic plans"
+        if self.plan_cache_mode is None or not self.query.compare_plans:
+            return None
+        return plan_label(self.plan_cache_mode)
+
+    def prepared_fields(self) -> dict[str, Any]:
+        "How the run was executed, if it was a prepared statement"
+        if self.plan_cache_mode is None:
+            return {}
+        fields: dict[str, Any] = {"plan_cache_mode": str(self.plan_cache_mode)}
+        if self.execution is not None:
+            fields["execution"] = self.execution
+        if self.generic_plan is not None:
+            fields["generic_plan"] = self.generic_plan
+        return fields
+
+    def param_fields(self) -> dict[str, Any]:
+        "Parameter values the records of the run are tagged with, if it has them"
+        if self.params is None:
+            return {}
+        return {"param_index": self.param_index, **param_fields(self.params)}
+
+
+class DatabaseLimiter:
+    "Bounds how many statements can be in flight against each database"
+
+    def __init__(self, max_per_database: int):
+        self.max_per_database = max(1, max_per_database)
+        self._semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def slot(self, database_id: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if database_id not in self._semaphores:
+                self._semaphores[database_id] = threading.BoundedSemaphore(
+                    self.max_per_database
+                )
+            return self._semaphores[database_id]
+
+
+def warn_data_modifying(query: Query, db_instance: DatabaseInstance) -> None:
+    "Warns if `query` looks data-modifying and its writes aren't rolled back"
+    statement_sql = EXPLAIN_OPTIONS_PATTERN.sub("", query.sql).strip()
+    if query.rollback == RollbackMode.OFF and DATA_MODIFYING_PATTERN.search(
+        statement_sql
+    ):
+        app_logger.warning(
+            f"{query.name} looks data-modifying and commits its writes in "
+            f"{db_instance.name} on every repeat, set its rollback mode to keep "
+            "the data as it is"
+        )
 
-                sql_str = str(query_row["sql"])
 
-                db_name = db_instance.name
-                query_name = define_query_name(query_row, db_name)
+@dataclass
+class PairStatements:
+    "A (query, database) pair of a run and what its statements are executed with"
+
+    query: Query
+    db_instance: DatabaseInstance
+    job: RunJob
+    on_run: Callable[[ExplainRun], None]
+    sql_str: str  # EXPLAIN statement, see `explain_sql`
+    # Shared by every statement of the pair with `RollbackMode.SAVEPOINT`
+    transaction: Connection | None = None
+    runs: list[ExplainRun] = field(default_factory=list)
 
-                if query_row.query_count:
-                    explain_log_obj["count"] = get_count(
-                        sql_str=sql_str, query_name=query_name, db_instance=db_instance
-                    )
+    @property
+    def statement_sql(self) -> str:
+        "The explained statement, without the EXPLAIN options"
+        return EXPLAIN_OPTIONS_PATTERN.sub("", self.sql_str).strip()
+
+    def query_name(
+        self,
+        repeat: int | str,
+        param_index: int | None,
+        plan_cache_mode: PlanCacheMode | None,
+    ) -> str:
+        label = (
+            plan_label(plan_cache_mode)
+            if plan_cache_mode is not None and self.query.compare_plans
+            else None
+        )
+        return define_query_name(
+            self.query,
+            self.db_instance.name,
+            self.job.run_id,
+            repeat,
+            param_index,
+            label,
+        )
 
-                sql = text(sql_str)
-                explain_dump = execute_explain_stmt(
-                    database_instance=db_instance, statement=sql, query_name=query_name
-                )
+    def passed_on(self, run: ExplainRun) -> None:
+        self.on_run(run)
+        self.runs.append(run)
 
-                explain_log_obj = {
-                    "db_name": db_name,
-                    "query_name": query_name,
-                    "sql": str(query_row["sql"]),
-                    "total_exc_time": explain_dump[PlanEnum.EXECUTION_TIME],
-                    **explain_log_obj,
-                }
-                log_key_value(
-                    explain_logger,
-                    explain_log_obj,
-                )
 
-                explain_dir = Path("/app/file/explain_output")
+@dataclass
+class PlanSession:
+    """Session the statements of one plan cache mode of a pair are executed in.
+
+    Without a `session`, every statement runs on a connection of its own.
+    """
+
+    plan_cache_mode: PlanCacheMode | None = None
+    session: Connection | None = None
+    prepared: PreparedStatement | None = None
+    executions: PreparedExecutions | None = None
+    first_planning_time: float | None = None  # Of the first execution in the session
+
+    def statement(self, sql_str: str, params: dict[str, Any] | None) -> TextClause:
+        "Statement explaining `sql_str`, or `EXECUTE` of the prepared one"
+        if self.session is None or self.prepared is None:
+            return text(sql_str)
+        return self.prepared.explain(params)
+
+    def executed(self, explain_dump: dict[Any, Any]) -> tuple[int | None, bool | None]:
+        """Counts an execution of the prepared statement, returns its number in the
+        session and whether it used the generic plan, `None` if not prepared.
+        """
+        if self.executions is None:
+            return None, None
+        generic_plan = self.executions.executed()
+        if self.first_planning_time is None:
+            self.first_planning_time = explain_dump.get(PlanEnum.PLANNING_TIME)
+        return self.executions.count, generic_plan
+
+
+def _explain_statement(
+    pair: PairStatements,
+    plan_session: PlanSession,
+    statement: TextClause,
+    query_name: str,
+    *,
+    discard: bool = False,
+) -> dict[Any, Any]:
+    "Executes one explain statement of `pair` and counts it as done"
+    pair.job.raise_if_cancelled()
+    timeouts = query_timeouts(pair.query)
+    explain_dump = execute_explain_stmt(
+        database_instance=pair.db_instance,
+        statement=statement,
+        query_name=query_name,
+        statement_timeout_ms=timeouts["statement_timeout_ms"],
+        lock_timeout_ms=timeouts["lock_timeout_ms"],
+        rollback=pair.query.rollback != RollbackMode.OFF,
+        transaction=pair.transaction,
+        session=plan_session.session,
+        discard=discard,
+        job=pair.job,
+    )
+    pair.job.statement_done()
+    return explain_dump
+
+
+def _verify_count(
+    pair: PairStatements, query_name: str, params: dict[str, Any] | None
+) -> int:
+    "Executes the `COUNT(*)` of `pair` and counts it as done"
+    pair.job.raise_if_cancelled()
+    timeouts = query_timeouts(pair.query)
+    count = get_count(
+        sql_str=pair.sql_str,
+        query_name=query_name,
+        db_instance=pair.db_instance,
+        statement_timeout_ms=timeouts["statement_timeout_ms"],
+        lock_timeout_ms=timeouts["lock_timeout_ms"],
+        params=params,
+        job=pair.job,
+    )
+    pair.job.statement_done()
+    return count
+
 
-                explain_df = pd.DataFrame([explain_dump])
+def execute_param_row(
+    pair: PairStatements,
+    plan_session: PlanSession,
+    param_index: int | None,
+    params: dict[str, Any] | None,
+) -> None:
+    """Executes the warm-ups and measured runs of one row of parameter values, or
+    of the query without parameters, in `plan_session`.
 
-                explain_df.to_json(
-                    explain_dir / f"{query_name}.json", orient="records", lines=True
+    If a statement times out, a run with `timeout_error` is passed on instead and
+    the remaining statements of the row are skipped.
+    """
+    query = pair.query
+    plan_cache_mode = plan_session.plan_cache_mode
+    statement = plan_session.statement(pair.sql_str, params)
+    cache_control = CacheControl(
+        query.cache_mode,
+        pair.db_instance,
+        pair.statement_sql,
+        params,
+        job=pair.job,
+        shared_session=(
+            pair.transaction is not None or plan_session.session is not None
+        ),
+    )
+    statements_done = 0
+    repeat = 0
+    query_name = pair.query_name("warmup", param_index, plan_cache_mode)
+    try:
+        cache_control.warm()
+        for _ in range(warmup_runs(query)):
+            warmup_dump = _explain_statement(pair, plan_session, statement, query_name)
+            statements_done += 1
+            plan_session.executed(warmup_dump)
+
+        for repeat in range(query_run_times(query)):
+            query_name = pair.query_name(repeat, param_index, plan_cache_mode)
+            pair.job.raise_if_cancelled()
+            cache_control.cool()
+            explain_dump = _explain_statement(
+                pair,
+                plan_session,
+                statement,
+                query_name,
+                discard=query.cache_mode == CacheMode.COLD,
+            )
+            statements_done += 1
+            execution, generic_plan = plan_session.executed(explain_dump)
+
+            count = verified_count = None
+            if query.query_count:
+                count = plan_row_count(explain_dump)
+                if query.verify_count and repeat == 0:
+                    verified_count = _verify_count(pair, query_name, params)
+                    statements_done += 1
+
+            pair.passed_on(
+                ExplainRun(
+                    query=query,
+                    db_instance=pair.db_instance,
+                    query_name=query_name,
+                    explain_dump=explain_dump,
+                    run_id=pair.job.run_id,
+                    repeat=repeat,
+                    count=count,
+                    verified_count=verified_count,
+                    params=params,
+                    param_index=param_index,
+                    plan_cache_mode=plan_cache_mode,
+                    execution=execution,
+                    generic_plan=generic_plan,
+                    first_planning_time=plan_session.first_planning_time,
+                    cache_verified=cache_control.verified,
                 )
+            )
+    except StatementTimeoutError as e:
+        pair.job.raise_if_cancelled()  # Cancelled since the run was aborted
+        pair.job.statement_done(statement_count(query) - statements_done)
+        if plan_session.executions is not None:
+            # The timed out statement may have been planned, the next executions
+            # of the session compare to it
+            plan_session.executions.sync()
+        pair.passed_on(
+            ExplainRun(
+                query=query,
+                db_instance=pair.db_instance,
+                query_name=query_name,
+                explain_dump=None,
+                timeout_error=e.reason,
+                run_id=pair.job.run_id,
+                repeat=repeat,
+                params=params,
+                param_index=param_index,
+                plan_cache_mode=plan_cache_mode,
+            )
+        )
 
-                explain_df = process_explain_df(explain_df)
 
-                node_series = extract_node_series(explain_df)
+def execute_plan_cache_mode(
+    pair: PairStatements,
+    prepared: PreparedStatement | None,
+    plan_cache_mode: PlanCacheMode | None,
+    param_rows: list[dict[str, Any] | None],
+) -> None:
+    """Executes every row of `param_rows` under `plan_cache_mode`.
 
-                node_metrics_df = create_node_metrics_df(node_series)
+    A `prepared` statement is prepared once, and every row executes it in the
+    same session, so the plan cache sees the statement reused like an application
+    would.
+    """
+    rows = [
+        (row if params is not None else None, params)
+        for row, params in enumerate(param_rows)
+    ]
+    if prepared is None or plan_cache_mode is None:
+        for param_index, params in rows:
+            execute_param_row(pair, PlanSession(), param_index, params)
+        return
+
+    with prepared_session(
+        pair.db_instance, prepared, plan_cache_mode, pair.transaction
+    ) as session:
+        plan_session = PlanSession(
+            plan_cache_mode=plan_cache_mode,
+            session=session,
+            prepared=prepared,
+            executions=PreparedExecutions(session, prepared),
+        )
+        for param_index, params in rows:
+            execute_param_row(pair, plan_session, param_index, params)
 
-                graphnode_df = create_graphnode_table(node_series)
-                graphedge_df = create_graphedge_table(node_series)
 
-                node_metrics_dict = node_metrics_df.to_dict(orient="records")
-                graphnode_dict = graphnode_df.to_dict(orient="records")
-                graphedge_dict = graphedge_df.to_dict(orient="records")
+def execute_query_runs(
+    query: Query,
+    db_instance: DatabaseInstance,
+    limiter: DatabaseLimiter,
+    job: RunJob,
+    on_run: Callable[[ExplainRun], None],
+) -> list[ExplainRun]:
+    """Executes every repeat of `query` in `db_instance`, passing each run to
+    `on_run` as soon as it's executed.
 
-                for node in node_metrics_dict:
-                    graph_node_logger.info(
-                        f"db_name={db_name}&query_name={query_name}&node={node}"
-                    )
-                for node in graphnode_dict:
-                    graph_node_logger.info(
-                        f"db_name={db_name}&query_name={query_name}&node={node}"
-                    )
-                for edge in graphedge_dict:
-                    graph_node_logger.info(
-                        f"db_name={db_name}&query_name={query_name}&edge={edge}"
-                    )
+    Repeats run one after another so they don't compete with each other, the
+    concurrency is between (query, database) pairs. Raises `RunCancelledError`
+    before the next statement once `job` is cancelled.
+
+    If the parameter rows can't be read, a `failed` run is passed on instead and
+    the pair is skipped.
+
+    If a statement times out, a run with `timeout_error` is passed on instead and
+    the remaining repeats are skipped, the other pairs of the run keep going.
 
-                level_divider_df = create_level_divider(node_series)
-                level_divider_dict = level_divider_df.to_dict(orient="records")
-                n = len(level_divider_dict)
-
-                max_index_width = 1 + len(str(n - 1)) if n > 0 else 0
-
-                for index, level in enumerate(level_divider_dict):
-                    prefix_index = "0" if len(str(index)) < 2 else ""
-                    index_str = prefix_index + str(index)
-                    padded_index = index_str.ljust(
-                        max_index_width
-                    )  # Pad to fixed width
-                    padded_index = padded_index.replace(" ", "\u00a0")
-                    full_log_line = (
-                        f"{padded_index} {level['nodes']}"  # Combine with log content
+    With `query_count`, the row count is read from each plan. `verify_count` also
+    executes a `COUNT(*)` after the first measured run to check it.
+
+    With `rollback`, the writes of each statement are rolled back, so the repeats
+    of data-modifying statements all run against the same data.
+
+    With a warm `cache_mode`, the relations of the plan are prewarmed before the
+    warm-ups. With a cold one, they're evicted and the session is reset before
+    each measured run.
+
+    With `params`, the warm-ups and repeats are executed for each row of parameter
+    values. A timeout only skips the remaining repeats of its row.
+
+    Prepared queries are prepared once per plan cache mode, on a connection the
+    warm-ups and repeats of every row share, and executed with `EXECUTE` under the
+    query's `plan_cache_mode`. With `compare_plans`, every row is executed under
+    both forced custom and generic plans, each in its own session.
+    """
+    pair = PairStatements(
+        query=query,
+        db_instance=db_instance,
+        job=job,
+        on_run=on_run,
+        sql_str=explain_sql(query),
+    )
+    warn_data_modifying(query, db_instance)
+
+    with (
+        limiter.slot(db_instance.id),
+        job.running(f"{query.name} @ {db_instance.name}"),
+        rollback_transaction(db_instance, query.rollback) as transaction,
+    ):
+        pair.transaction = transaction
+        param_rows: list[dict[str, Any] | None] = [None]
+        if query.params is not None:
+            try:
+                param_rows = list(resolve_param_rows(query.params, db_instance))
+            except (InvalidParamSetError, SQLAlchemyError) as e:
+                app_logger.error(
+                    f"Couldn't read the parameter rows of {query.name} in "
+                    f"{db_instance.name}, skipping it: {e}"
+                )
+                job.statement_done(statement_count(query))
+                pair.passed_on(
+                    ExplainRun(
+                        query=query,
+                        db_instance=db_instance,
+                        query_name=pair.query_name(0, None, None),
+                        explain_dump=None,
+                        timeout_error=str(e),
+                        failed=True,
+                        run_id=job.run_id,
                     )
+                )
+                return pair.runs
+
+        prepared = None
+        plan_cache_modes: list[PlanCacheMode | None] = [None]
+        if is_prepared(query):
+            prepared = prepared_statement(query, pair.sql_str)
+            plan_cache_modes = (
+                list(COMPARED_PLAN_CACHE_MODES)
+                if query.compare_plans
+                else [query.plan_cache_mode]
+            )
+        # The run counted the statements of one row of one mode of each pair
+        job.add_total(
+            statement_count(query) * (len(plan_cache_modes) * len(param_rows) - 1)
+        )
+
+        for plan_cache_mode in plan_cache_modes:
+            execute_plan_cache_mode(pair, prepared, plan_cache_mode, param_rows)
+
+    return pair.runs
+
 
-                    log_key_value(
-                        explain_logger,
-                        log_dict={
-                            "db_name": db_name,
-                            "query_name": query_name,
-                            "level_divide": full_log_line,  # Use aligned log line
-                        },
+def cache_key_sql(query: Query) -> str:
+    """SQL the results of `query` are cached by. The EXPLAIN options, how many runs
+    are measured, row counting, rollback, cache mode and parameters change the
+    results, so they're part of it.
+    """
+    sql = explain_sql(query)
+    sql += (
+        f"\n-- repeat={query_run_times(query)} warmup={warmup_runs(query)} "
+        f"query_count={query.query_count} verify_count={query.verify_count} "
+        f"rollback={query.rollback}"
+    )
+    if query.cache_mode != CacheMode.ANY:
+        sql += f"\n-- cache_mode={query.cache_mode}"
+    if is_prepared(query):
+        plan_cache = "compare" if query.compare_plans else query.plan_cache_mode
+        sql += f"\n-- prepared plan_cache_mode={plan_cache}"
+    if query.params is not None:
+        sql += f"\n-- params={query.params.model_dump_json()}"
+    return sql
+
+
+def replay_query_runs(
+    query: Query,
+    db_instance: DatabaseInstance,
+    cached_runs: list[CachedRun],
+    job: RunJob,
+    on_run: Callable[[ExplainRun], None],
+) -> list[ExplainRun]:
+    "Passes the cached runs of `query` in `db_instance` to `on_run` as if executed"
+    runs: list[ExplainRun] = []
+    with job.running(f"{query.name} @ {db_instance.name} (cached)"):
+        job.statement_done(statement_count(query))
+        repeats: dict[tuple[int | None, str | None], int] = {}
+        for cached_run in cached_runs:
+            job.raise_if_cancelled()
+            unit = (cached_run.param_index, cached_run.plan_cache_mode)
+            repeat = repeats.get(unit, 0)
+            repeats[unit] = repeat + 1
+            run = ExplainRun(
+                query=query,
+                db_instance=db_instance,
+                query_name="",
+                explain_dump=cached_run.explain_dump,
+                run_id=job.run_id,
+                repeat=repeat,
+                count=cached_run.count,
+                verified_count=cached_run.verified_count,
+                params=cached_run.params,
+                param_index=cached_run.param_index,
+                plan_cache_mode=(
+                    PlanCacheMode(cached_run.plan_cache_mode)
+                    if cached_run.plan_cache_mode is not None
+                    else None
+                ),
+                execution=cached_run.execution,
+                generic_plan=cached_run.generic_plan,
+                first_planning_time=cached_run.first_planning_time,
+                cache_verified=cached_run.cache_verified,
+            )
+            run.query_name = define_query_name(
+                query,
+                db_instance.name,
+                job.run_id,
+                repeat,
+                run.param_index,
+                run.compared_plan,
+            )
+            on_run(run)
+            runs.append(run)
+    return runs
+
+
+class DatabaseFingerprints:
+    """Fingerprint of each database of a run, taken before its first statement.
+
+    A database whose fingerprint can't be read gets `None`, its results are
+    executed and not cached.
+    """
+
+    def __init__(self) -> None:
+        self._fingerprints: dict[str, str | None] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db_instance: DatabaseInstance) -> str | None:
+        with self._lock:
+            if db_instance.id not in self._fingerprints:
+                try:
+                    fingerprint = database_fingerprint(db_instance)
+                except SQLAlchemyError as e:
+                    app_logger.warning(
+                        f"Couldn't fingerprint database {db_instance.name}, its "
+                        f"results won't be cached: {e}"
                     )
+                    fingerprint = None
+                self._fingerprints[db_instance.id] = fingerprint
+            return self._fingerprints[db_instance.id]
+
+
+def build_explain_records(run: ExplainRun) -> Iterator[Record | ArchivedPlan]:
+    """Processes the plan of `run` into all of its records, yielding each record as
+    soon as it's built. Unless the run is archived already, its plan is yielded to
+    be archived too.
+
+    Runs in the plan processing workers, so it must stay importable at module level.
+    """
+    db_name = run.db_instance.name
+    query_name = run.query_name
+    explain_dump = run.explain_dump
+
+    if explain_dump is None:
+        yield Record(
+            explain_logger,
+            {
+                "db_name": db_name,
+                "query_name": query_name,
+                "sql": explain_sql(run.query),
+                "status": "failed" if run.failed else "timeout",
+                "error": run.timeout_error,
+                "cache_mode": str(run.query.cache_mode),
+                **query_timeouts(run.query),
+                **run.prepared_fields(),
+                **run.param_fields(),
+                **run.run_fields(),
+            },
+            "explain",
+        )
+        return
+
+    plan_columns = flatten_plan(explain_dump[PlanEnum.PLAN])
+
+    explain_log_obj: dict[str, Any] = {
+        "db_name": db_name,
+        "query_name": query_name,
+        "sql": explain_sql(run.query),
+        "status": "ok",
+        "total_exc_time": explain_dump[PlanEnum.EXECUTION_TIME],
+        "cache_mode": str(run.query.cache_mode),
+        **plan_columns.io_totals(),
+        **run.param_fields(),
+        **run.run_fields(),
+    }
+    if run.query.cache_mode != CacheMode.ANY:
+        explain_log_obj["cache_verified"] = run.cache_verified
+    if run.query.rollback != RollbackMode.OFF:
+        explain_log_obj["rollback"] = str(run.query.rollback)
+    explain_log_obj.update(run.prepared_fields())
+    if run.count is not None:
+        explain_log_obj["count"] = run.count
+    if run.verified_count is not None:
+        explain_log_obj["verified_count"] = run.verified_count
+        explain_log_obj["count_matches"] = run.verified_count == run.count
+    if PlanEnum.SETTINGS in explain_dump:
+        # Planner settings changed from their defaults
+        explain_log_obj["settings"] = explain_dump[PlanEnum.SETTINGS]
+    yield Record(explain_logger, explain_log_obj, "explain")
+
+    explain_dir = Path("/app/file/explain_output")
+
+    with (
+        timed_stage("write_explain_json"),
+        open(explain_dir / f"{query_name}.json", "w") as explain_file,
+    ):
+        explain_file.write(json.dumps(explain_dump) + "\n")
+
+    if run.run_id is not None and not run.archived and archive_enabled():
+        yield archive_plan(
+            run_id=run.run_id,
+            database_id=run.db_instance.id,
+            query_key=run.query_key,
+            repeat=run.repeat,
+            db_name=db_name,
+            query_id=run.query.id,
+            query=run.query.name,
+            query_name=query_name,
+            sql=explain_sql(run.query),
+            cache_mode=str(run.query.cache_mode),
+            params=run.params,
+            param_index=run.param_index,
+            prepared_fields=run.prepared_fields(),
+            explain_dump=explain_dump,
+            columns=plan_columns,
+            count=run.count,
+            verified_count=run.verified_count,
+        )
+
+    run_fields = run.run_fields()
+    for node in iter_node_metrics(plan_columns):
+        yield Record(
+            graph_node_logger,
+            {"db_name": db_name, "query_name": query_name, "node": node, **run_fields},
+            "node_metrics",
+        )
+    for node in iter_graph_nodes(plan_columns):
+        yield Record(
+            graph_node_logger,
+            {"db_name": db_name, "query_name": query_name, "node": node},
+            "graph_node",
+        )
+    for edge in iter_graph_edges(plan_columns):
+        yield Record(
+            graph_node_logger,
+            {"db_name": db_name, "query_name": query_name, "edge": edge},
+            "graph_edge",
+        )
+    for level_line in iter_level_lines(plan_columns):
+        yield Record(
+            explain_logger,
+            {
+                "db_name": db_name,
+                "query_name": query_name,
+                "level_divide": level_line,  # Use aligned log line
+            },
+            "level_divide",
+        )
+
+
+def compared_plan_diff_pairs(runs: list[ExplainRun]) -> list[PlanDiffPair]:
+    """Pairs the first measured custom plan of each row of parameter values with its
+    first generic plan, for queries comparing them.
+    """
+    first_runs: dict[int | None, dict[str, ExplainRun]] = {}
+    for run in runs:
+        if run.compared_plan is not None and run.explain_dump is not None:
+            first_runs.setdefault(run.param_index, {}).setdefault(
+                run.compared_plan, run
+            )
+
+    custom, generic = (plan_label(mode) for mode in COMPARED_PLAN_CACHE_MODES)
+    diff_pairs = []
+    for param_index, runs_by_plan in first_runs.items():
+        if custom not in runs_by_plan or generic not in runs_by_plan:
+            continue
+        run_a, run_b = runs_by_plan[custom], runs_by_plan[generic]
+        assert run_a.explain_dump is not None and run_b.explain_dump is not None
+        query_name = f"{run_a.query.name}__{run_a.db_instance.name}"
+        if param_index is not None:
+            query_name += f"__p{param_index}"
+        diff_pairs.append(
+            PlanDiffPair(
+                query_name=f"{query_name}__{custom}__vs__{generic}",
+                label_a=custom,
+                label_b=generic,
+                explain_dump_a=run_a.explain_dump,
+                explain_dump_b=run_b.explain_dump,
+            )
+        )
+    return diff_pairs
+
+
+def database_diff_pairs(
+    query: Query, runs_by_database: dict[str, ExplainRun]
+) -> list[PlanDiffPair]:
+    """Pairs the plan of the first database of `query` with the plan of each other
+    database, in the order of `query.database_ids`.
+    """
+    runs = [
+        runs_by_database[db_id]
+        for db_id in query.database_ids
+        if db_id in runs_by_database
+    ]
+    if len(runs) < 2:
+        return []
+
+    reference = runs[0]
+    assert reference.explain_dump is not None
+    diff_pairs = []
+    for run in runs[1:]:
+        assert run.explain_dump is not None
+        diff_pairs.append(
+            PlanDiffPair(
+                query_name=f"{query.name}__{reference.db_instance.name}"
+                f"__vs__{run.db_instance.name}",
+                label_a=reference.db_instance.name,
+                label_b=run.db_instance.name,
+                explain_dump_a=reference.explain_dump,
+                explain_dump_b=run.explain_dump,
+            )
+        )
+    return diff_pairs
+
+
+def diff_archived_runs(run_id_a: str, run_id_b: str, sink: RecordSink) -> int:
+    """Emits the plan diffs of the queries archived by both runs, per database.
+    Returns how many plans were diffed.
+
+    The first archived plan of each (query, database) pair in each run is compared.
+    """
+
+    def first_plans(run_id: str) -> dict[tuple[str, str], dict[str, Any]]:
+        plans: dict[tuple[str, str], dict[str, Any]] = {}
+        archived_runs = sorted(
+            read_archived_runs(run_id), key=lambda archived: archived["archived_at"]
+        )
+        for archived in archived_runs:
+            plans.setdefault((archived["query_id"], archived["database_id"]), archived)
+        return plans
+
+    plans_a = first_plans(run_id_a)
+    plans_b = first_plans(run_id_b)
+    diffed = 0
+    for key, archived_a in plans_a.items():
+        archived_b = plans_b.get(key)
+        if archived_b is None:
+            continue
+        diff_pair = PlanDiffPair(
+            query_name=f"{archived_a['query']}__{archived_a['db_name']}"
+            f"__{run_id_a[:6]}__vs__{run_id_b[:6]}",
+            label_a=run_id_a,
+            label_b=run_id_b,
+            explain_dump_a=archived_a["explain_dump"],
+            explain_dump_b=archived_b["explain_dump"],
+        )
+        with timed_stage("emit_records"):
+            sink.emit_records(build_plan_diff_records(diff_pair))
+        diffed += 1
+    return diffed
+
+
+def emit_archived_run(run_id: str, sink: RecordSink) -> int:
+    """Emits the records of the plans archived by run `run_id` again, without
+    executing its queries. Returns how many plans were emitted.
+    """
+    archived_runs = read_archived_runs(run_id)
+    for archived in archived_runs:
+        run = ExplainRun(
+            query=Query(
+                id=archived["query_id"],
+                name=archived["query"],
+                database_ids=[archived["database_id"]],
+                sql=archived["sql"],
+                repeat=None,
+                query_count=archived["count"] is not None,
+                cache_mode=archived.get("cache_mode") or CacheMode.ANY,
+            ),
+            # The database may not be saved anymore, and isn't connected to
+            db_instance=DatabaseInstance.model_construct(
+                id=archived["database_id"], name=archived["db_name"], url=""
+            ),
+            query_name=archived["query_name"],
+            explain_dump=archived["explain_dump"],
+            count=archived["count"],
+            verified_count=archived["verified_count"],
+            run_id=run_id,
+            repeat=archived.get("repeat") or 0,
+            archived=True,
+            params=json.loads(archived["params"]) if archived.get("params") else None,
+            param_index=archived.get("param_index"),
+            plan_cache_mode=archived.get("plan_cache_mode"),
+            execution=archived.get("execution"),
+            generic_plan=archived.get("generic_plan"),
+        )
+        emit_built_records(build_explain_records(run), sink, archive=None)
+    return len(archived_runs)
+
+
+@sync_timing_tracker("benchmark_summary")
+def build_benchmark_records(runs: list[ExplainRun]) -> list[Record]:
+    """Aggregates the measured `runs` of one (query, database) pair, or of one row of
+    its parameter values, into records.
+
+    One summary record for the pair and one record per plan node, named by
+    `query.name` and database name without the run suffix.
+    """
+    query = runs[0].query
+    db_name = runs[0].db_instance.name
+    query_name = f"{query.name}__{db_name}"
+    if runs[0].param_index is not None:
+        query_name += f"__p{runs[0].param_index}"
+    if runs[0].compared_plan is not None:
+        query_name += f"__{runs[0].compared_plan}"
+    run_fields = {"run_id": runs[0].run_id, "query_key": runs[0].query_key}
+    explain_dumps = [run.explain_dump for run in runs if run.explain_dump is not None]
+    if not explain_dumps:
+        return []
+
+    prepared_summary: dict[str, Any] = {}
+    if runs[0].plan_cache_mode is not None:
+        prepared_summary = {
+            "plan_cache_mode": str(runs[0].plan_cache_mode),
+            **summarize_prepared_planning(
+                runs[0].first_planning_time,
+                [
+                    run.explain_dump[PlanEnum.PLANNING_TIME]
+                    for run in runs
+                    if run.explain_dump is not None
+                    and run.execution is not None
+                    and run.execution > 1
+                    and PlanEnum.PLANNING_TIME in run.explain_dump
+                ],
+            ),
+        }
+        generic_plans = [
+            run.generic_plan for run in runs if run.generic_plan is not None
+        ]
+        if generic_plans:
+            prepared_summary["generic_plans"] = sum(generic_plans)
+
+    cache_summary: dict[str, Any] = {}
+    if query.cache_mode != CacheMode.ANY:
+        cache_summary["cache_verified"] = all(run.cache_verified for run in runs)
+
+    records = [
+        Record(
+            benchmark_logger,
+            {
+                "db_name": db_name,
+                "query_name": query_name,
+                "record_type": "summary",
+                "warmup_runs": warmup_runs(query),
+                "cache_mode": str(query.cache_mode),
+                **cache_summary,
+                **summarize_plan_times(explain_dumps),
+                **prepared_summary,
+                **runs[0].param_fields(),
+                **run_fields,
+            },
+            "summary",
+        )
+    ]
+    for node_summary in summarize_node_timings(explain_dumps):
+        records.append(
+            Record(
+                benchmark_logger,
+                {
+                    "db_name": db_name,
+                    "query_name": query_name,
+                    "record_type": "node_summary",
+                    **node_summary,
+                    **run_fields,
+                },
+                "node_summary",
+            )
+        )
+
+    return records
+
+
+def interleave_by_database(
+    jobs: list[tuple[Query, DatabaseInstance]],
+) -> list[tuple[Query, DatabaseInstance]]:
+    """Orders `jobs` round-robin over databases.
+
+    Keeps workers from piling up on one database while the others sit idle
+    behind its per-database limit.
+    """
+    per_database: dict[str, list[tuple[Query, DatabaseInstance]]] = {}
+    for job in jobs:
+        per_database.setdefault(job[1].id, []).append(job)
+
+    interleaved = zip_longest(*per_database.values())
+    return [job for jobs_round in interleaved for job in jobs_round if job is not None]
+
+
+# (build function, argument)
+PlanJob = tuple[Callable[[Any], Iterable[Record | ArchivedPlan]], Any]
+
+
+def emit_built_records(
+    built: Iterable[Record | ArchivedPlan],
+    sink: RecordSink,
+    archive: RunArchiveWriter | None,
+) -> None:
+    "Emits the built records to `sink` and writes the built plans to `archive`"
+
+    def records() -> Iterator[Record]:
+        for item in built:
+            if not isinstance(item, ArchivedPlan):
+                yield item
+            elif archive is not None:
+                archive.write(item)
+
+    with timed_stage("emit_records"):
+        sink.emit_records(records())
+
+
+def build_timed(
+    build: Callable[[Any], Iterable[Record | ArchivedPlan]], arg: Any
+) -> tuple[list[Record | ArchivedPlan], dict[str, list[float]]]:
+    """Runs a plan job in a worker process and returns its records, collected to be
+    sent back, with the stage timings collected meanwhile.
+    """
+    with activate(StageTimer()) as timer:
+        records = list(build(arg))
+    return records, timer.samples()
+
+
+def _emit_built(
+    future: Future[tuple[list[Record | ArchivedPlan], dict[str, list[float]]]],
+    sink: RecordSink,
+    archive: RunArchiveWriter | None,
+) -> None:
+    built, samples = future.result()
+    run_timer = get_active_timer()
+    if run_timer is not None:
+        run_timer.merge(samples)
+    emit_built_records(built, sink, archive)
+
+
+def _raise_failed(futures: list[Future[Any]]) -> None:
+    for future in futures:
+        if future.done() and future.exception() is not None:
+            future.result()
+
+
+def execute_or_replay(
+    query: Query,
+    db_instance: DatabaseInstance,
+    mode: RunMode,
+    plan_cache: PlanCache,
+    fingerprints: DatabaseFingerprints,
+    limiter: DatabaseLimiter,
+    job: RunJob,
+    on_run: Callable[[ExplainRun], None],
+) -> list[ExplainRun]:
+    """Executes the runs of a (query, database) pair, or replays its cached runs
+    depending on `mode`, and caches the executed ones.
+    """
+    sql = cache_key_sql(query)
+    if mode == RunMode.REPLAY:
+        cached_runs = plan_cache.latest(sql, db_instance.id)
+        if cached_runs is None:
+            app_logger.warning(
+                f"No cached results of {query.name} in {db_instance.name} to replay"
+            )
+            job.statement_done(statement_count(query))
+            return []
+        return replay_query_runs(query, db_instance, cached_runs, job, on_run)
+
+    fingerprint = fingerprints.get(db_instance)
+    if mode == RunMode.CACHE and fingerprint is not None:
+        cached_runs = plan_cache.get(sql, db_instance.id, fingerprint)
+        if cached_runs is not None:
+            return replay_query_runs(query, db_instance, cached_runs, job, on_run)
+
+    runs = execute_query_runs(query, db_instance, limiter, job, on_run)
+    # Timed out runs are executed again next time
+    if (
+        fingerprint is not None
+        and runs
+        and all(run.explain_dump is not None for run in runs)
+    ):
+        plan_cache.put(
+            sql,
+            db_instance.id,
+            fingerprint,
+            [
+                CachedRun(
+                    explain_dump=run.explain_dump,
+                    count=run.count,
+                    verified_count=run.verified_count,
+                    params=run.params,
+                    param_index=run.param_index,
+                    plan_cache_mode=run.plan_cache_mode,
+                    execution=run.execution,
+                    generic_plan=run.generic_plan,
+                    first_planning_time=run.first_planning_time,
+                    cache_verified=run.cache_verified,
+                )
+                for run in runs
+                if run.explain_dump is not None
+            ],
+        )
+    return runs
+
+
+def pair_plan_jobs(query: Query, runs: list[ExplainRun]) -> list[PlanJob]:
+    """Plan jobs of the runs of a (query, database) pair as a whole, its benchmarks
+    and the diffs of its compared plans.
+    """
+    plan_jobs: list[PlanJob] = []
+    if runs and query.benchmark:
+        runs_by_unit: dict[tuple[int | None, str | None], list[ExplainRun]] = {}
+        for run in runs:
+            unit = (run.param_index, run.plan_cache_mode)
+            runs_by_unit.setdefault(unit, []).append(run)
+        for unit_runs in runs_by_unit.values():
+            plan_jobs.append((build_benchmark_records, unit_runs))
+    for diff_pair in compared_plan_diff_pairs(runs):
+        plan_jobs.append((build_plan_diff_records, diff_pair))
+    return plan_jobs
+
+
+class DatabaseDiffs:
+    """First measured run of each database of a query, diffed once all databases of
+    the query ran.
+    """
+
+    def __init__(self, pairs: list[tuple[Query, DatabaseInstance]]):
+        self._first_runs: dict[str, dict[str, ExplainRun]] = {}
+        self._pairs_left: dict[str, int] = {}
+        for query, _ in pairs:
+            self._pairs_left[query.id] = self._pairs_left.get(query.id, 0) + 1
+        self._lock = threading.Lock()
+
+    def pair_done(
+        self, query: Query, db_instance: DatabaseInstance, runs: list[ExplainRun]
+    ) -> list[PlanDiffPair]:
+        "Diff pairs of `query`, once `runs` is the last of its databases to finish"
+        measured = next((run for run in runs if run.explain_dump is not None), None)
+        with self._lock:
+            if measured is not None:
+                self._first_runs.setdefault(query.id, {})[db_instance.id] = measured
+            self._pairs_left[query.id] -= 1
+            if self._pairs_left[query.id]:
+                return []
+            runs_by_database = self._first_runs.pop(query.id, {})
+        return database_diff_pairs(query, runs_by_database)
+
+
+def process_queries(
+    queries: list[Query],
+    sink: RecordSink,
+    job: RunJob,
+    mode: RunMode = RunMode.EXECUTE,
+) -> None:
+    """Executes all active queries for each of their databases and emits the results
+    to `sink`, reporting progress to `job`.
+
+    Results are cached per (query, database) pair, see `RunMode` for when the
+    cached ones are emitted instead of executing the query.
+
+    The database threads put each executed plan in a bounded queue, and the plans
+    are turned into records by the plan processing workers while the next
+    statements execute. (query, database) pairs run concurrently, bounded by
+    `EXECUTE_MAX_WORKERS` in total and `EXECUTE_MAX_WORKERS_PER_DATABASE` for each
+    database. Records are emitted in the calling thread one run at a time, so
+    records of a `query_name` are never interleaved with other runs. Without
+    worker processes, the records are streamed to `sink` while the plan is walked.
+    """
+    pairs: list[tuple[Query, DatabaseInstance]] = []
+    for query in queries:
+        if not query.active:
+            continue
+
+        for db_id in query.database_ids:
+            pairs.append((query, find_database_instance(db_id)))
+            job.add_total(statement_count(query))
+
+    limiter = DatabaseLimiter(settings.EXECUTE_MAX_WORKERS_PER_DATABASE)
+    plan_queue: queue.Queue[PlanJob] = queue.Queue(
+        maxsize=max(1, settings.PLAN_QUEUE_SIZE)
+    )
+    stopped = threading.Event()
+
+    def enqueue(plan_job: PlanJob) -> None:
+        # Waits while the queue is full, unless the run stopped
+        while not stopped.is_set():
+            try:
+                plan_queue.put(plan_job, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    plan_cache = get_plan_cache()
+    fingerprints = DatabaseFingerprints()
+    database_diffs = DatabaseDiffs(pairs)
+
+    def execute(query: Query, db_instance: DatabaseInstance) -> None:
+        def on_run(run: ExplainRun) -> None:
+            enqueue((build_explain_records, run))
+
+        runs = execute_or_replay(
+            query,
+            db_instance,
+            mode,
+            plan_cache,
+            fingerprints,
+            limiter,
+            job,
+            on_run,
+        )
+        for plan_job in pair_plan_jobs(query, runs):
+            enqueue(plan_job)
+        for diff_pair in database_diffs.pair_done(query, db_instance, runs):
+            enqueue((build_plan_diff_records, diff_pair))
+
+    processor = get_plan_processor()
+    max_in_flight = max(1, settings.PLAN_PROCESS_WORKERS) * 2
+    in_flight: deque[
+        Future[tuple[list[Record | ArchivedPlan], dict[str, list[float]]]]
+    ] = deque()
+    # Plans of the run are archived to one file per database
+    archive = RunArchiveWriter() if archive_enabled() else None
+
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, settings.EXECUTE_MAX_WORKERS),
+        thread_name_prefix="explain",
+    )
+    try:
+        futures = [
+            submit_in_context(executor, execute, query, db_instance)
+            for query, db_instance in interleave_by_database(pairs)
+        ]
+        while True:
+            job.raise_if_cancelled()
+            try:
+                plan_job: PlanJob | None = plan_queue.get(timeout=0.1)
+            except queue.Empty:
+                plan_job = None
+
+            if plan_job is None:
+                _raise_failed(futures)
+                if all(future.done() for future in futures) and plan_queue.empty():
+                    break
+                continue
+
+            build, arg = plan_job
+            if isinstance(processor, InlineExecutor):
+                # Streams the records to the sink as they're built
+                emit_built_records(build(arg), sink, archive)
+                continue
+
+            in_flight.append(processor.submit(build_timed, build, arg))
+            while in_flight and (
+                in_flight[0].done() or len(in_flight) >= max_in_flight
+            ):
+                _emit_built(in_flight.popleft(), sink, archive)
+
+        while in_flight:
+            _emit_built(in_flight.popleft(), sink, archive)
+    except BaseException:
+        # Stops the workers before their next statement and cancels the running
+        # ones on the server, which would otherwise hold the shutdown below
+        job.cancel()
+        stopped.set()
+        cancel_running_statements(job)
+        raise
+    finally:
+        # Drops statements not started yet if a run failed or was cancelled
+        stopped.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in in_flight:
+            future.cancel()
+        if archive is not None:
+            archive.close()
@@ -0,0 +1,357 @@
+import datetime as dt
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+from app.core.config import settings
+from app.core.interface import NodeEnum as NE
+from app.core.interface import PlanEnum as PE
+from app.core.profiling import timed_stage
+from app.execute.node_process import IO_COLUMNS, PlanColumns
+from app.logs.logger import app_logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # The `archive` extra isn't installed
+    pa = ds = pq = None
+
+ARCHIVE_DIR = Path("/app/file/archive")
+
+# Archived tables, each partitioned as `run_id=.../database_id=.../part-*.parquet`
+PLANS = "plans"
+NODES = "nodes"
+
+_warned_unavailable = False
+
+
+class RunArchiveUnavailableError(Exception):
+    def __init__(self, *args: object) -> None:
+        detail = "Run archive needs pyarrow, install the `archive` extra"
+        super().__init__(detail, args)
+
+
+class NoArchivedRunsError(Exception):
+    def __init__(self, *args: object) -> None:
+        detail = "Found no archived runs"
+        super().__init__(detail, args)
+
+
+def archive_enabled() -> bool:
+    "Whether runs are archived, warns once per process if pyarrow is missing"
+    global _warned_unavailable
+    if not settings.ARCHIVE_RUNS:
+        return False
+    if pa is None:
+        if not _warned_unavailable:
+            app_logger.warning(f"{RunArchiveUnavailableError()}, runs aren't archived")
+            _warned_unavailable = True
+        return False
+    return True
+
+
+def _partition(table: str, run_id: str, database_id: str) -> Path:
+    return ARCHIVE_DIR / table / f"run_id={run_id}" / f"database_id={database_id}"
+
+
+def _node_schema() -> "pa.Schema":
+    return pa.schema(
+        [
+            ("query_name", pa.string()),
+            ("query_key", pa.string()),
+            (NE.NODE_ID.value, pa.string()),
+            (NE.PARENT_NODE.value, pa.string()),
+            (NE.INDEX.value, pa.string()),
+            (NE.DEPTH.value, pa.int32()),
+            (NE.NODE_TYPE.value, pa.string()),
+            (NE.NODE_TYPE_DETAIL.value, pa.string()),
+            (NE.DESCRIPTION.value, pa.string()),
+            (NE.ACTUAL_ROWS.value, pa.float64()),
+            (NE.TOTAL_COST.value, pa.float64()),
+            (NE.ACTUAL_STARTUP_TIME.value, pa.float64()),
+            (NE.ACTUAL_TOTAL_TIME.value, pa.float64()),
+            (NE.TIMING_MS.value, pa.float64()),
+            (NE.INCLUSIVE_MS.value, pa.float64()),
+            (NE.TIMING_PROPORTION.value, pa.float64()),
+            # I/O of the node itself, null if the plan wasn't explained with BUFFERS
+            *[(name, pa.float64()) for name in IO_COLUMNS],
+            (NE.CACHE_HIT_RATIO.value, pa.float64()),
+        ]
+    )
+
+
+def _node_io(columns: PlanColumns) -> dict[str, Any]:
+    if not columns.has_io:
+        empty = [None] * len(columns)
+        return {name: empty for name in [*IO_COLUMNS, NE.CACHE_HIT_RATIO.value]}
+    node_io: dict[str, Any] = {
+        name: columns.io_exclusive[:, i] for i, name in enumerate(IO_COLUMNS)
+    }
+    node_io[NE.CACHE_HIT_RATIO.value] = columns.cache_hit_ratio
+    return node_io
+
+
+def _plan_schema() -> "pa.Schema":
+    return pa.schema(
+        [
+            ("query_name", pa.string()),
+            ("query_key", pa.string()),
+            ("repeat", pa.int32()),
+            ("query_id", pa.string()),
+            ("query", pa.string()),
+            ("db_name", pa.string()),
+            ("sql", pa.string()),
+            ("cache_mode", pa.string()),
+            # Values of the bind parameters as JSON, null without parameters
+            ("params", pa.string()),
+            ("param_index", pa.int32()),
+            # How prepared statements were executed, null for other statements
+            ("plan_cache_mode", pa.string()),
+            ("execution", pa.int32()),
+            ("generic_plan", pa.bool_()),
+            ("execution_time", pa.float64()),
+            ("planning_time", pa.float64()),
+            ("count", pa.int64()),
+            ("verified_count", pa.int64()),
+            ("archived_at", pa.timestamp("us", tz="UTC")),
+            ("explain_json", pa.string()),
+        ]
+    )
+
+
+def _partition_schema() -> "pa.Schema":
+    # Read as strings, ids that look numeric would be inferred as ints otherwise
+    return pa.schema([("run_id", pa.string()), ("database_id", pa.string())])
+
+
+@dataclass
+class ArchivedPlan:
+    "Raw plan and flattened nodes of one run, written by a `RunArchiveWriter`"
+
+    run_id: str
+    database_id: str
+    plan: "pa.Table"
+    nodes: "pa.Table"
+
+
+def archive_plan(
+    *,
+    run_id: str,
+    database_id: str,
+    query_key: str,
+    repeat: int,
+    db_name: str,
+    query_id: str,
+    query: str,
+    query_name: str,
+    sql: str,
+    cache_mode: str,
+    params: dict[str, Any] | None,
+    param_index: int | None,
+    prepared_fields: dict[str, Any],
+    explain_dump: dict[str, Any],
+    columns: PlanColumns,
+    count: int | None = None,
+    verified_count: int | None = None,
+) -> ArchivedPlan:
+    """Builds the rows of the raw plan of a run and its flattened nodes, to be
+    written to the partition of its run and database.
+
+    Built in the plan processing workers, and written by the `RunArchiveWriter` of
+    the run in the calling thread.
+    """
+    with timed_stage("archive_plan"):
+        plan_table = pa.table(
+            {
+                "query_name": [query_name],
+                "query_key": [query_key],
+                "repeat": [repeat],
+                "query_id": [query_id],
+                "query": [query],
+                "db_name": [db_name],
+                "sql": [sql],
+                "cache_mode": [cache_mode],
+                "params": [json.dumps(params) if params is not None else None],
+                "param_index": [param_index],
+                "plan_cache_mode": [prepared_fields.get("plan_cache_mode")],
+                "execution": [prepared_fields.get("execution")],
+                "generic_plan": [prepared_fields.get("generic_plan")],
+                "execution_time": [explain_dump.get(PE.EXECUTION_TIME)],
+                "planning_time": [explain_dump.get(PE.PLANNING_TIME)],
+                "count": [count],
+                "verified_count": [verified_count],
+                "archived_at": [dt.datetime.now(tz=dt.UTC)],
+                "explain_json": [json.dumps(explain_dump)],
+            },
+            schema=_plan_schema(),
+        )
+        node_table = pa.table(
+            {
+                "query_name": [query_name] * len(columns),
+                "query_key": [query_key] * len(columns),
+                NE.NODE_ID.value: columns.node_id,
+                NE.PARENT_NODE.value: columns.parent_node,
+                NE.INDEX.value: columns.index,
+                NE.DEPTH.value: columns.depth,
+                NE.NODE_TYPE.value: columns.node_type,
+                NE.NODE_TYPE_DETAIL.value: columns.node_type_detail,
+                NE.DESCRIPTION.value: columns.description,
+                NE.ACTUAL_ROWS.value: columns.actual_rows,
+                NE.TOTAL_COST.value: columns.total_cost,
+                NE.ACTUAL_STARTUP_TIME.value: columns.actual_startup_time,
+                NE.ACTUAL_TOTAL_TIME.value: columns.actual_total_time,
+                NE.TIMING_MS.value: columns.timing_ms,
+                NE.INCLUSIVE_MS.value: columns.inclusive_ms,
+                NE.TIMING_PROPORTION.value: columns.timing_proportion,
+                **_node_io(columns),
+            },
+            schema=_node_schema(),
+        )
+    return ArchivedPlan(
+        run_id=run_id, database_id=database_id, plan=plan_table, nodes=node_table
+    )
+
+
+class RunArchiveWriter:
+    """Writes the archived plans of a run as zstd compressed Parquet files per
+    table and (run, database) partition, so sweeps over many parameter rows and
+    repeats don't leave a small file per plan.
+
+    Rows are buffered per partition and written to a new, complete file once they
+    reach `row_group_bytes` or every `flush_seconds`, so a crash or cancel mid-run
+    only loses the rows buffered since.
+
+    Usage:
+        archive = RunArchiveWriter()
+        try:
+            archive.write(archived_plan)
+        finally:
+            archive.close()  # Writes the buffered rows
+    """
+
+    def __init__(self, row_group_bytes: int = 16 * 2**20, flush_seconds: float = 30):
+        self.row_group_bytes = row_group_bytes
+        self.flush_seconds = flush_seconds
+        self.file_prefix = f"part-{uuid4().hex[:12]}"
+        self._pending: dict[tuple[str, str, str], list[pa.Table]] = {}
+        self._pending_bytes: dict[tuple[str, str, str], int] = {}
+        self._parts: dict[tuple[str, str, str], int] = {}
+        self._flushed_at = time.monotonic()
+
+    def write(self, archived_plan: ArchivedPlan) -> None:
+        for table, rows in ((PLANS, archived_plan.plan), (NODES, archived_plan.nodes)):
+            key = (table, archived_plan.run_id, archived_plan.database_id)
+            self._pending.setdefault(key, []).append(rows)
+            self._pending_bytes[key] = self._pending_bytes.get(key, 0) + rows.nbytes
+            if self._pending_bytes[key] >= self.row_group_bytes:
+                self._flush(key)
+        if time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self.flush()
+
+    def _flush(self, key: tuple[str, str, str]) -> None:
+        pending = self._pending.pop(key, [])
+        self._pending_bytes.pop(key, None)
+        if not pending:
+            return
+        with timed_stage("archive_write"):
+            table, run_id, database_id = key
+            partition = _partition(table, run_id, database_id)
+            partition.mkdir(parents=True, exist_ok=True)
+            part = self._parts.get(key, 0)
+            self._parts[key] = part + 1
+            pq.write_table(
+                pa.concat_tables(pending),
+                partition / f"{self.file_prefix}-{part:05d}.parquet",
+                compression="zstd",
+            )
+
+    def flush(self) -> None:
+        "Writes the buffered rows of every partition"
+        for key in list(self._pending):
+            self._flush(key)
+        self._flushed_at = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+
+
+def _read(
+    table: str,
+    *,
+    run_id: str | None,
+    database_id: str | None,
+    columns: list[str] | None,
+) -> "pa.Table":
+    if pa is None:
+        raise RunArchiveUnavailableError
+
+    path = ARCHIVE_DIR / table
+    if not path.exists():
+        raise NoArchivedRunsError
+
+    filters = []
+    if run_id is not None:
+        filters.append(("run_id", "=", run_id))
+    if database_id is not None:
+        filters.append(("database_id", "=", database_id))
+
+    with timed_stage("archive_read"):
+        return pq.read_table(
+            path,
+            columns=columns,
+            filters=filters or None,
+            partitioning=ds.partitioning(_partition_schema(), flavor="hive"),
+            memory_map=True,
+        )
+
+
+def read_archived_plans(
+    *,
+    run_id: str | None = None,
+    database_id: str | None = None,
+    columns: list[str] | None = None,
+) -> "pa.Table":
+    "Archived runs, one row per executed plan, memory mapped from the Parquet files"
+    return _read(PLANS, run_id=run_id, database_id=database_id, columns=columns)
+
+
+def read_archived_nodes(
+    *,
+    run_id: str | None = None,
+    database_id: str | None = None,
+    columns: list[str] | None = None,
+) -> "pa.Table":
+    "Flattened nodes of the archived plans, one row per node"
+    return _read(NODES, run_id=run_id, database_id=database_id, columns=columns)
+
+
+def read_archived_runs(
+    run_id: str, database_id: str | None = None
+) -> list[dict[str, Any]]:
+    """Archived plans of `run_id` with their raw explain output.
+
+    Example:
+        [{"query_name": "q__db__1a2b3c", "database_id": ..., "explain_dump": {...}}]
+    """
+    plans = read_archived_plans(run_id=run_id, database_id=database_id)
+    if plans.num_rows == 0:
+        raise NoArchivedRunsError(f"Run {run_id} isn't archived")
+
+    archived_runs = []
+    for row in plans.to_pylist():
+        row["explain_dump"] = json.loads(row.pop("explain_json"))
+        archived_runs.append(row)
+    return archived_runs
+
+
+def list_archived_runs() -> list[str]:
+    "Ids of the archived runs, most recently archived first"
+    run_dirs = sorted(
+        (ARCHIVE_DIR / PLANS).glob("run_id=*"), key=os.path.getmtime, reverse=True
+    )
+    return [run_dir.name.removeprefix("run_id=") for run_dir in run_dirs]
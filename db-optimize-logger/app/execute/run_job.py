@@ -0,0 +1,142 @@
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import TYPE_CHECKING
+from uuid import uuid4
+
+if TYPE_CHECKING:
+    from app.execute.database import DatabaseInstance
+
+
+class RunCancelledError(Exception):
+    def __init__(self, *args: object) -> None:
+        detail = "Run was cancelled"
+        super().__init__(detail, args)
+
+
+@dataclass
+class RunSnapshot:
+    "Progress of a run at one point in time"
+
+    done: int
+    total: int
+    elapsed_seconds: float
+    eta_seconds: float | None
+    running: list[str] = field(default_factory=list)  # "query @ database" pairs
+    cancelled: bool = False
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 0.0
+
+
+class RunJob:
+    """
+    Progress and cancellation of a run, shared between the thread executing the
+    run and the UI polling it.
+
+    Usage:
+        job = RunJob()
+        job.add_total(3)
+        with job.running("query @ db"):
+            job.raise_if_cancelled()
+            ...
+            job.statement_done()
+    """
+
+    def __init__(self) -> None:
+        self.run_id = str(uuid4())
+        self.started_at = monotonic()
+        self._done = 0
+        self._total = 0
+        self._running: list[str] = []
+        self._cancelled = threading.Event()
+        # Backends executing a statement of the run, keyed by (database id, pid)
+        self._backends: dict[tuple[str, int], DatabaseInstance] = {}
+        self._seen: set[str] = set()
+        self._lock = threading.Lock()
+
+    def add_total(self, statements: int) -> None:
+        with self._lock:
+            self._total += statements
+
+    def statement_done(self, statements: int = 1) -> None:
+        with self._lock:
+            self._done += statements
+
+    @contextmanager
+    def running(self, label: str) -> Iterator[None]:
+        with self._lock:
+            self._running.append(label)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running.remove(label)
+
+    @contextmanager
+    def running_backend(
+        self, database_instance: "DatabaseInstance", pid: int
+    ) -> Iterator[None]:
+        """Registers the backend `pid` while it executes a statement of the run, so
+        `running_backends` lists it to be cancelled.
+
+        Raises `RunCancelledError` if the run was cancelled before it registered,
+        since a cancel listing the backends could have missed it.
+        """
+        key = (database_instance.id, pid)
+        with self._lock:
+            if self._cancelled.is_set():
+                raise RunCancelledError
+            self._backends[key] = database_instance
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._backends.pop(key, None)
+
+    def running_backends(self) -> list[tuple["DatabaseInstance", int]]:
+        with self._lock:
+            return [
+                (database_instance, pid)
+                for (_, pid), database_instance in self._backends.items()
+            ]
+
+    def first_seen(self, key: str) -> bool:
+        "Whether `key` is seen for the first time in the run, e.g. to warn once"
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            return True
+
+    def cancel(self) -> None:
+        # Under the lock, so a backend registers either before the cancel, and is
+        # listed by `running_backends` after it, or sees it
+        with self._lock:
+            self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._cancelled.is_set():
+            raise RunCancelledError
+
+    def snapshot(self) -> RunSnapshot:
+        with self._lock:
+            done, total, running = self._done, self._total, list(self._running)
+
+        elapsed = monotonic() - self.started_at
+        eta = elapsed / done * (total - done) if done else None
+        return RunSnapshot(
+            done=done,
+            total=total,
+            elapsed_seconds=elapsed,
+            eta_seconds=eta,
+            running=running,
+            cancelled=self.cancelled,
+        )
@@ -0,0 +1,249 @@
+import datetime as dt
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Any, Generic, TypeVar
+
+from app.logs.logger import app_logger
+
+SAVES_DB = Path("/app/saves/saves.db")
+
+ItemType = TypeVar("ItemType")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS databases (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    status TEXT NOT NULL,
+    detail TEXT
+);
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    applied_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+""" + "".join(
+    # Bumps the version of the indexed tables on every write, so each `SavesIndex`
+    # only reloads when its own table changed
+    f"""
+CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()} AFTER {event} ON {table}
+BEGIN
+    INSERT INTO table_versions (name, version) VALUES ('{table}', 1)
+    ON CONFLICT(name) DO UPDATE SET version = version + 1;
+END;
+"""
+    for table in ("databases", "queries")
+    for event in ("INSERT", "UPDATE", "DELETE")
+)
+
+# Saves databases whose schema was created by this process
+_schema_ready: set[Path] = set()
+_schema_lock = threading.Lock()
+
+
+def _now() -> str:
+    return dt.datetime.now(tz=dt.UTC).isoformat()
+
+
+@contextmanager
+def saves_connection() -> Iterator[sqlite3.Connection]:
+    """
+    Connection to the saves database, committed as one transaction on exit.
+
+    Rolls back if an exception is raised, so a failing save never leaves the
+    saves half written.
+    """
+    new_file = not SAVES_DB.exists()
+    with closing(sqlite3.connect(SAVES_DB, timeout=10)) as conn:
+        with _schema_lock:
+            if new_file or SAVES_DB not in _schema_ready:
+                conn.executescript(_SCHEMA)
+                _schema_ready.add(SAVES_DB)
+        with conn:
+            yield conn
+
+
+def load_items(table: str) -> list[tuple[str, str]]:
+    "Returns (id, data) of all rows in `table`, in the order they were first saved"
+    with saves_connection() as conn:
+        rows = conn.execute(f"SELECT id, data FROM {table} ORDER BY rowid").fetchall()
+    return rows
+
+
+def upsert_item(table: str, id: str, data: str) -> None:
+    "Inserts the row with `id`, or updates it in place if it exists"
+    with saves_connection() as conn:
+        conn.execute(
+            f"INSERT INTO {table} (id, data) VALUES (?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+            (id, data),
+        )
+
+
+def replace_all_items(table: str, items: list[tuple[str, str]]) -> None:
+    "Replaces all rows of `table` with `items` (id, data) in a single transaction"
+    with saves_connection() as conn:
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(f"INSERT INTO {table} (id, data) VALUES (?, ?)", items)
+
+
+def delete_item(table: str, id: str) -> bool:
+    "Deletes the row with `id`, returns whether it existed"
+    with saves_connection() as conn:
+        cursor = conn.execute(f"DELETE FROM {table} WHERE id = ?", (id,))
+    return cursor.rowcount > 0
+
+
+def delete_all_items(table: str) -> None:
+    with saves_connection() as conn:
+        conn.execute(f"DELETE FROM {table}")
+
+
+def table_version(table: str) -> int:
+    "Number of writes to `table`, 0 if it was never written"
+    with saves_connection() as conn:
+        row = conn.execute(
+            "SELECT version FROM table_versions WHERE name = ?", (table,)
+        ).fetchone()
+    return row[0] if row else 0
+
+
+def migrate_csv_once(
+    *,
+    name: str,
+    table: str,
+    csv_path: Path,
+    read_items: Callable[[], list[tuple[str, str]]],
+) -> None:
+    """
+    Imports the rows of a legacy csv saves file into `table` once.
+
+    The migration is only recorded as applied when the csv file exists, so a csv
+    file added later is still imported. It's renamed with a `.migrated` suffix
+    afterwards and kept as backup.
+    """
+    with saves_connection() as conn:
+        applied = conn.execute(
+            "SELECT 1 FROM migrations WHERE name = ?", (name,)
+        ).fetchone()
+        if applied or not csv_path.exists():
+            return
+
+        items = read_items()
+        conn.executemany(
+            f"INSERT INTO {table} (id, data) VALUES (?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+            items,
+        )
+        conn.execute(
+            "INSERT INTO migrations (name, applied_at) VALUES (?, ?)", (name, _now())
+        )
+
+    os.replace(csv_path, csv_path.with_name(csv_path.name + ".migrated"))
+    app_logger.info(f"Migrated {len(items)} rows from {csv_path} to {SAVES_DB}")
+
+
+def record_run_started(run_id: str) -> None:
+    with saves_connection() as conn:
+        conn.execute(
+            "INSERT INTO runs (id, started_at, status) VALUES (?, ?, ?)",
+            (run_id, _now(), "running"),
+        )
+
+
+def record_run_finished(
+    run_id: str, status: str, detail: dict[str, Any] | None = None
+) -> None:
+    with saves_connection() as conn:
+        conn.execute(
+            "UPDATE runs SET finished_at = ?, status = ?, detail = ? WHERE id = ?",
+            (_now(), status, json.dumps(detail, default=str), run_id),
+        )
+
+
+def read_runs(limit: int = 50) -> list[dict[str, Any]]:
+    "Returns the latest runs, newest first"
+    with saves_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            "SELECT * FROM runs ORDER BY started_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+class SavesIndex(Generic[ItemType]):
+    """
+    In-memory index of the items in a table of the saves, keyed by item id.
+
+    The version of the table is only checked when the modification time or size
+    of the saves file changed, and the table only read again when its version
+    changed, so lookups don't have to query the saves each time and writes to
+    other tables don't reload it.
+
+    Usage:
+        index = SavesIndex(QUERIES_TABLE, load=load_queries)
+        query = index.get(query_id)
+    """
+
+    def __init__(
+        self,
+        table: str,
+        *,
+        load: Callable[[], dict[str, ItemType]],
+    ):
+        self.table = table
+        self._load = load
+        self._items: dict[str, ItemType] = {}
+        self._signature: tuple[int, int, int] | None = None
+        self._version = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _file_signature(self) -> tuple[int, int, int] | None:
+        try:
+            stat = os.stat(SAVES_DB)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def items(self) -> dict[str, ItemType]:
+        "Returns all items by id, in the order they were saved"
+        with self._lock:
+            signature = self._file_signature()
+            if self._loaded and signature == self._signature:
+                return self._items
+            # Read before loading, a write while loading reloads on next lookup
+            version = table_version(self.table)
+            if not self._loaded or version != self._version:
+                self._items = self._load()
+                self._loaded = True
+            self._signature = signature
+            self._version = version
+            return self._items
+
+    def get(self, id: str) -> ItemType | None:
+        return self.items().get(id)
+
+    def ids(self) -> list[str]:
+        return list(self.items())
+
+    def invalidate(self) -> None:
+        "Forces a reload on next lookup, for writes within the file timestamp resolution"
+        with self._lock:
+            self._loaded = False
@@ -1,18 +1,88 @@
 import asyncio
+import cProfile
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any
 
-from app.core.progress import Progress
+from app.core.config import settings
+from app.core.profiling import StageTimer, activate
 from app.execute.database import process_databases, read_database_saves_df
-from app.execute.query_handler import process_queries, read_queries_saves_df
-from app.logs.logger import setup_logging
+from app.execute.plan_cache import RunMode
+from app.execute.query_handler import (
+    NoQueriesFoundError,
+    process_queries,
+    read_queries,
+)
+from app.execute.run_job import RunCancelledError, RunJob
+from app.execute.saves import record_run_finished, record_run_started
+from app.logs.logger import app_logger, setup_logging
+from app.logs.sink import RecordSink, get_record_sink
 
+PROFILES_DIR = Path("/app/file/profiles")
 
-async def start_log(progress: Progress):
+
+def emit_run_profile(
+    run_id: str, stage_summaries: list[dict[str, Any]], sink: RecordSink
+) -> None:
+    for stage_summary in stage_summaries:
+        sink.emit(
+            app_logger,
+            {"run_id": run_id, **stage_summary},
+            record_type="stage_timing",
+        )
+
+
+async def start_log(
+    job: RunJob, mode: RunMode = RunMode.EXECUTE
+) -> list[dict[str, Any]]:
+    """Runs `run_log` in a worker thread, so the event loop keeps serving the UI
+    while the statements execute.
+    """
+    return await asyncio.to_thread(run_log, job, mode)
+
+
+def run_log(job: RunJob, mode: RunMode = RunMode.EXECUTE) -> list[dict[str, Any]]:
+    """Executes the saved queries and logs their results, reporting progress to `job`.
+
+    Returns the time spent per stage of the run, see `StageTimer.summary`.
+    """
     setup_logging()
-    await asyncio.sleep(0.1)  # Just for coroutine to trigger for load spinner
 
-    databases = read_database_saves_df()
-    process_databases(databases)
+    run_id = job.run_id
+    record_run_started(run_id)
+    sink = get_record_sink()
+    timer = StageTimer()
+    profiler = cProfile.Profile() if settings.PROFILE_RUNS else None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        with activate(timer):
+            databases = read_database_saves_df()
+            process_databases(databases, sink)
+
+            queries = read_queries()
+            if not queries:
+                raise NoQueriesFoundError
+            process_queries(queries, sink, job, mode)
+    except RunCancelledError:
+        record_run_finished(run_id, "cancelled", asdict(job.snapshot()))
+        raise
+    except Exception as e:
+        record_run_finished(run_id, "failed", {"error": str(e)})
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(PROFILES_DIR / f"{run_id}.prof")
+
+        stage_summaries = timer.summary()
+        emit_run_profile(run_id, stage_summaries, sink)
+        sink.close()  # Pushes the records still batched
 
-    queries = read_queries_saves_df()
-    process_queries(queries)
-    progress.set_loading(False)
+    record_run_finished(
+        run_id,
+        "finished",
+        {"queries": len(queries), "mode": mode, "stages": stage_summaries},
+    )
+    return stage_summaries
@@ -26,3 +26,11 @@ explain_logger = logging.getLogger(
 db_logger = logging.getLogger("db_logger")  # Log database information
 
 graph_node_logger = logging.getLogger("graph_node_logger")  # Log graph node information
+
+benchmark_logger = logging.getLogger(
+    "benchmark_logger"
+)  # Log summaries of repeated runs
+
+plan_diff_logger = logging.getLogger(
+    "plan_diff_logger"
+)  # Log differences between plans of the same query
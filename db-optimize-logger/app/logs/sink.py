@@ -0,0 +1,211 @@
+import datetime as dt
+import gzip
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from dataclasses import dataclass
+from logging import Logger
+from typing import Any
+
+from app.core.config import settings
+from app.core.profiling import timed_stage
+from app.core.utils import log_key_value
+from app.logs.logger import app_logger
+
+# Labels of the records pushed to Loki, besides `job`. Kept to a few values each,
+# so the streams a dashboard query selects don't grow with the runs
+RECORD_LABELS = ("logger", "record_type", "db_name")
+# Fields of the records attached to their lines as structured metadata, which
+# queries filter on without them being indexed as streams
+RECORD_METADATA = ("query_name", "run_id")
+
+
+@dataclass
+class Record:
+    "Record built away from its sink, e.g. in a plan processing worker"
+
+    logger: Logger
+    fields: dict[str, Any]
+    record_type: str
+
+
+class RecordSink(ABC):
+    """
+    Destination of the structured records of a run (explain results, plan nodes,
+    edges, tree lines and summaries).
+
+    Usage:
+        sink = get_record_sink()
+        try:
+            sink.emit(explain_logger, {"db_name": ..., ...}, record_type="explain")
+        finally:
+            sink.close()
+    """
+
+    @abstractmethod
+    def emit(
+        self, logger: Logger, record: dict[str, Any], *, record_type: str
+    ) -> None: ...
+
+    def emit_records(self, records: Iterable[Record]) -> None:
+        for record in records:
+            self.emit(record.logger, record.fields, record_type=record.record_type)
+
+    def flush(self) -> None:  # noqa: B027, sinks that don't batch have nothing to flush
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class LoggingRecordSink(RecordSink):
+    "Logs the records to stdout as `key=value&key=value`, where Vector picks them up"
+
+    def emit(self, logger: Logger, record: dict[str, Any], *, record_type: str) -> None:
+        log_key_value(logger, record, extra={"record_type": record_type})
+
+
+class LokiPushError(Exception):
+    def __init__(self, *args: object) -> None:
+        detail = "Couldn't push records to Loki"
+        super().__init__(detail, args)
+
+
+def _line_value(value: Any) -> Any:
+    "Nested values are kept as text, same as Vector parses them from the logs"
+    if isinstance(value, dict | list | tuple):
+        return str(value)
+    return value
+
+
+class LokiPushSink(RecordSink):
+    """
+    Batches the records and pushes them straight to the Loki push API, gzip
+    compressed.
+
+    Lines, labels and structured metadata have the same shape as the ones Vector
+    ships from the logs, so the dashboard queries read records from both. A batch that can't be pushed after
+    `max_retries` is logged instead, so the records still reach Loki through Vector.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        batch_size: int = 1000,
+        max_retries: int = 3,
+        timeout: float = 10,
+    ):
+        self.url = url
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max(0, max_retries)
+        self.timeout = timeout
+        self._pending: list[tuple[Logger, dict[str, Any], str, int]] = []
+        self._lock = threading.Lock()
+
+    def emit(self, logger: Logger, record: dict[str, Any], *, record_type: str) -> None:
+        with self._lock:
+            self._pending.append((logger, record, record_type, time.time_ns()))
+            if len(self._pending) < self.batch_size:
+                return
+            batch, self._pending = self._pending, []
+        self._push_or_log(batch)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._push_or_log(batch)
+
+    def _push_or_log(
+        self, batch: list[tuple[Logger, dict[str, Any], str, int]]
+    ) -> None:
+        try:
+            with timed_stage("loki_push"):
+                self._push(self._payload(batch))
+        except LokiPushError as e:
+            app_logger.error(f"{e}, logging {len(batch)} records instead")
+            fallback = LoggingRecordSink()
+            for logger, record, record_type, _ in batch:
+                fallback.emit(logger, record, record_type=record_type)
+
+    def _payload(self, batch: list[tuple[Logger, dict[str, Any], str, int]]) -> bytes:
+        streams: dict[tuple[tuple[str, str], ...], list[list[Any]]] = {}
+        for logger, record, record_type, timestamp_ns in batch:
+            line = {
+                "logger": logger.name,
+                "level": "INFO",
+                "timestamp": dt.datetime.fromtimestamp(
+                    timestamp_ns / 1e9, tz=dt.UTC
+                ).isoformat(),
+                "message": {key: _line_value(value) for key, value in record.items()},
+                "record_type": record_type,
+                "db_name": record.get("db_name"),
+                "query_name": record.get("query_name"),
+                "run_id": record.get("run_id"),
+                "source_type": "loki_push",
+            }
+            labels = {"job": "vector"}  # Dashboard queries select job="vector"
+            for label in RECORD_LABELS:
+                if line[label] is not None:
+                    labels[label] = str(line[label])
+
+            metadata = {
+                key: str(line[key]) for key in RECORD_METADATA if line[key] is not None
+            }
+
+            value: list[Any] = [
+                str(timestamp_ns),
+                json.dumps(line, default=str, separators=(",", ":")),
+            ]
+            if metadata:
+                value.append(metadata)
+            streams.setdefault(tuple(sorted(labels.items())), []).append(value)
+
+        payload = {
+            "streams": [
+                {"stream": dict(labels), "values": values}
+                for labels, values in streams.items()
+            ]
+        }
+        return gzip.compress(json.dumps(payload).encode())
+
+    def _push(self, body: bytes) -> None:
+        request = urllib.request.Request(
+            self.url,
+            data=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+            method="POST",
+        )
+        for attempt in range(self.max_retries + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout):
+                    return
+            except urllib.error.HTTPError as e:
+                # Client errors other than rate limiting won't succeed on retry
+                if e.code != 429 and e.code < 500:
+                    raise LokiPushError(f"HTTP {e.code}: {e.read()[:200]!r}") from e
+                error: Exception = e
+            except (urllib.error.URLError, TimeoutError) as e:
+                error = e
+
+            if attempt < self.max_retries:
+                time.sleep(0.5 * 2**attempt)
+
+        raise LokiPushError(str(error)) from error
+
+
+def get_record_sink() -> RecordSink:
+    "Pushes to Loki directly if `LOKI_PUSH_URL` is set, otherwise logs the records"
+    if settings.LOKI_PUSH_URL:
+        return LokiPushSink(
+            settings.LOKI_PUSH_URL,
+            batch_size=settings.LOKI_PUSH_BATCH_SIZE,
+            max_retries=settings.LOKI_PUSH_MAX_RETRIES,
+            timeout=settings.LOKI_PUSH_TIMEOUT_SECONDS,
+        )
+    return LoggingRecordSink()
@@ -1,3 +1,4 @@
+from collections.abc import Callable
 from typing import Any, Literal
 
 from nicegui import ui
@@ -6,7 +7,9 @@ from nicegui.elements.number import Number
 from app.logs.logger import app_logger
 
 
-def create_field_with_tooltip(tooltip_text, widget_factory):
+def create_field_with_tooltip(
+    tooltip_text: str, widget_factory: Callable[[], Any]
+) -> Any:
     "Helper to create an inline field with tooltip"
 
     with ui.row().classes("items-center items-stretch mx-12"):
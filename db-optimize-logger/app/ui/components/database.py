@@ -1,20 +1,17 @@
 from typing import Any
 from uuid import uuid4
 
-import numpy as np
-import pandas as pd
 from nicegui import ui
 
 from app.execute.database import (
     DatabaseInstance,
     ExplodedURLDBInstance,
     ExplodedURLDBInstanceList,
-    NoDatabasesFoundError,
     create_database_url,
-    delete_all_databases,
     delete_database_instance,
     mapped_database_url,
-    read_database_saves_df,
+    read_database_instances,
+    save_all_database_instances,
     save_database_instance,
 )
 from app.ui.components.common import (
@@ -25,7 +22,7 @@ from app.ui.components.common import (
 
 
 @ui.refreshable
-def _saved_databases_ui(database_instances: ExplodedURLDBInstanceList):
+def _saved_databases_ui(database_instances: ExplodedURLDBInstanceList) -> None:
     if not database_instances.items:
         ui.label("Databases are empty.").classes("mx-auto")
         return
@@ -79,7 +76,7 @@ def _add_database_handler(
     add_host: Any,
     add_port: Any,
     add_db: Any,
-):
+) -> None:
     "Takes add inputs from query UI, saves and adds the values of them to a db query object"
 
     database_id = str(uuid4())
@@ -111,7 +108,7 @@ def _add_database_handler(
             db=add_db.value,
         )
 
-        # Save in csv and add to UI
+        # Save in saves database and add to UI
         save_database_instance(db_instance)
         database_instances.add(ui_db_instance)
 
@@ -133,7 +130,7 @@ def _add_database_handler(
 def _delete_database_handler(
     *, database: ExplodedURLDBInstance, database_instances: ExplodedURLDBInstanceList
 ) -> None:
-    "Deletes `database` from database saves csv and from ui list `databases`"
+    "Deletes `database` from database saves and from ui list `databases`"
     try:
         delete_database_instance(database.id)
         database_instances.remove(database)
@@ -143,14 +140,13 @@ def _delete_database_handler(
         return
 
 
-def _save_all_databases_handler(database_instances: ExplodedURLDBInstanceList):
+def _save_all_databases_handler(database_instances: ExplodedURLDBInstanceList) -> None:
     try:
         for query in database_instances.items:
             # Validate fields
             ExplodedURLDBInstance(**query.model_dump())
 
-        delete_all_databases()
-
+        saved_databases = []
         for database in database_instances.items:
             db_url = str(
                 create_database_url(
@@ -161,13 +157,15 @@ def _save_all_databases_handler(database_instances: ExplodedURLDBInstanceList):
                     db=database.db,
                 )
             )
-            database = DatabaseInstance(
-                id=database.id,
-                name=database.name,
-                description=database.description,
-                url=db_url,
+            saved_databases.append(
+                DatabaseInstance(
+                    id=database.id,
+                    name=database.name,
+                    description=database.description,
+                    url=db_url,
+                )
             )
-            save_database_instance(database)
+        save_all_database_instances(saved_databases)
         notify_popup("Successfully saved all databases", type="positive")
     except Exception as e:
         notify_popup(str(e), type="negative")
@@ -244,32 +242,18 @@ def _add_databases_component(database_instances: ExplodedURLDBInstanceList) -> N
         ).classes("mt-auto")
 
 
-def ui_load_databases(databases: ExplodedURLDBInstanceList):
-    try:
-        saves_df = read_database_saves_df().replace(
-            {np.nan: None, pd.NA: None, pd.NaT: None}
-        )
-
-    except NoDatabasesFoundError:
-        return
-
-    if saves_df.empty:
-        return
-
-    def process_database(database_instance_row):
-        id = database_instance_row.id
-        name = database_instance_row["name"]
-        description = database_instance_row["description"]
-        url_map, db_name = mapped_database_url(database_instance_row.url)
+def ui_load_databases(databases: ExplodedURLDBInstanceList) -> None:
+    def process_database(database_instance: DatabaseInstance) -> None:
+        url_map, db_name = mapped_database_url(database_instance.url)
         if not url_map["host"] or not db_name:
             raise ValueError(
                 f"Error while loading databases, either username `{url_map['username']}` "
                 f"or host `{url_map['host']}` or db name `{db_name}` is None"
             )
         db_instance = ExplodedURLDBInstance(
-            id=id,
-            name=name,
-            description=description,
+            id=database_instance.id,
+            name=database_instance.name,
+            description=database_instance.description,
             username=url_map["username"],
             password=url_map["password"],
             host=url_map["host"],
@@ -278,7 +262,8 @@ def ui_load_databases(databases: ExplodedURLDBInstanceList):
         )
         databases.add(db_instance)
 
-    saves_df = saves_df.apply(process_database, axis=1)
+    for database_instance in read_database_instances():
+        process_database(database_instance)
 
 
 def _saved_databases_component(database_instances: ExplodedURLDBInstanceList) -> None:
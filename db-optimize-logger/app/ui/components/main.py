@@ -1,4 +1,4 @@
-import asyncio
+from typing import Any
 
 from docker import DockerClient, errors
 from nicegui import ui
@@ -9,12 +9,43 @@ from app.docker_app.loki import (
     reset_loki_volume,
     start_loki_container,
 )
+from app.execute.plan_cache import RunMode
+from app.execute.run_job import RunCancelledError, RunJob
 from app.execute.start_log import start_log
 from app.logs.logger import setup_logging
 from app.ui.components.common import notify_and_log
 
+RUN_MODE_OPTIONS = {
+    RunMode.EXECUTE: "Execute",
+    RunMode.CACHE: "Use cache",
+    RunMode.REPLAY: "Replay from cache",
+}
 
-async def start_queries_logger(client: DockerClient, queries_progress: Progress):
+RUN_PROFILE_COLUMNS = [
+    {"name": "stage", "label": "Stage", "field": "stage", "align": "left"},
+    {"name": "count", "label": "Count", "field": "count"},
+    {"name": "total_ms", "label": "Total (ms)", "field": "total_ms"},
+    {"name": "p50_ms", "label": "p50 (ms)", "field": "p50_ms"},
+    {"name": "p95_ms", "label": "p95 (ms)", "field": "p95_ms"},
+]
+
+
+def show_run_profile(
+    container: ui.element, stage_summaries: list[dict[str, Any]]
+) -> None:
+    "Shows the time spent per stage of the last run"
+    container.clear()
+    with container:
+        ui.label("Last run, time per stage")
+        ui.table(columns=RUN_PROFILE_COLUMNS, rows=stage_summaries, row_key="stage")
+
+
+async def start_queries_logger(
+    client: DockerClient,
+    queries_progress: Progress,
+    profile_container: ui.element,
+    mode: RunMode = RunMode.EXECUTE,
+) -> None:
     if not queries_progress.loading:
         try:
             start_loki_container(client)
@@ -36,17 +67,18 @@ async def start_queries_logger(client: DockerClient, queries_progress: Progress)
             return
 
         try:
-            queries_progress.set_loading(True)
-
-            loop = asyncio.get_event_loop()
-            queries_spinner_coro = query_progress(queries_progress)
-            asyncio.run_coroutine_threadsafe(queries_spinner_coro, loop)
+            job = RunJob()
+            queries_progress.set_loading(True, job)
 
-            await start_log(queries_progress)
+            stage_summaries = await start_log(job, mode)
+            show_run_profile(profile_container, stage_summaries)
             notify_and_log(
                 "Successfully ran logs for queries. Check them at http://localhost:3000/a/ivarehaugland-explaindbdashboard-app/home",
                 "positive",
             )
+        except RunCancelledError:
+            notify_and_log("Cancelled running queries", "warning")
+            return
         except Exception as e:
             queries_progress.set_loading(False)
             notify_and_log(f"An error occured while running queries: {e}", "negative")
@@ -87,11 +119,21 @@ def main_component() -> None:
         ui.label("First add databases, then queries.")
         ui.label("Click `START LOG` when you want to execute your queries.")
 
-        queries_progress = Progress(False, on_change=query_progress.refresh)
+        queries_progress = Progress(False)
 
-        ui.button(
-            "START LOG", on_click=lambda: start_queries_logger(client, queries_progress)
-        ).classes("text-xl")
+        run_mode = ui.toggle(RUN_MODE_OPTIONS, value=RunMode.EXECUTE).tooltip(
+            "Use cache: reuses the results of queries whose SQL and database "
+            "schema and statistics haven't changed. Replay from cache: re-emits the "
+            "latest cached results without connecting to the databases"
+        )
+        start_button = ui.button("START LOG").classes("text-xl")
+        query_progress(queries_progress)
         ui.button("CLEAR LOGS", on_click=lambda: reset_logs(client)).classes(
             "bg-orange"
         )
+        profile_container = ui.column().classes("items-center text-base")
+        start_button.on_click(
+            lambda: start_queries_logger(
+                client, queries_progress, profile_container, RunMode(run_mode.value)
+            )
+        )
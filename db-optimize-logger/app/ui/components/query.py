@@ -2,25 +2,26 @@ import warnings
 from typing import Any
 from uuid import uuid4
 
-import numpy as np
 import pandas as pd
 from nicegui import ui
 
 from app.core.interface import WarningEnum
+from app.execute.cache_state import CacheMode
 from app.execute.database import (
     NoDatabasesFoundError,
+    RollbackMode,
     find_database_instance,
     read_database_ids_list,
     read_database_saves_df,
 )
+from app.execute.params import ParamSet, ParamSource
+from app.execute.prepared import PlanCacheMode
 from app.execute.query_handler import (
-    NoQueriesFoundError,
     Query,
     QueryList,
-    delete_all_queries,
     delete_query,
-    parse_database_ids,
-    read_queries_saves_df,
+    read_queries,
+    save_all_queries,
     save_query,
 )
 from app.ui.components.common import (
@@ -29,9 +30,32 @@ from app.ui.components.common import (
     ui_int_input,
 )
 
+ROLLBACK_OPTIONS = {
+    RollbackMode.OFF: "Commit",
+    RollbackMode.TRANSACTION: "Roll back",
+    RollbackMode.SAVEPOINT: "Roll back (savepoints)",
+}
+CACHE_MODE_OPTIONS = {
+    CacheMode.ANY: "Any cache",
+    CacheMode.WARM: "Warm cache",
+    CacheMode.COLD: "Cold cache",
+}
+PARAM_SOURCE_OPTIONS = {
+    None: "No parameters",
+    ParamSource.LIST: "JSON list",
+    ParamSource.CSV: "CSV",
+    ParamSource.RANGE: "Range",
+    ParamSource.SQL: "SQL query",
+}
+PLAN_CACHE_MODE_OPTIONS = {
+    PlanCacheMode.AUTO: "Auto plans",
+    PlanCacheMode.FORCE_CUSTOM: "Custom plans",
+    PlanCacheMode.FORCE_GENERIC: "Generic plans",
+}
+
 
 @ui.refreshable
-def _saved_queries_ui(queries: QueryList, databases: list[str]):
+def _saved_queries_ui(queries: QueryList, databases: list[str]) -> None:
     if not queries.items:
         ui.label("Queries are empty.").classes("mx-auto")
         return
@@ -71,11 +95,77 @@ def _saved_queries_ui(queries: QueryList, databases: list[str]):
                     ui.switch("Query count", value=query.query_count).classes(
                         "flex-grow w-[160px]"
                     ).bind_value(query, "query_count")
+                    ui.switch("Verify count", value=query.verify_count).classes(
+                        "flex-grow w-[160px]"
+                    ).bind_value(query, "verify_count")
+                    ui_int_input(
+                        label="?Warm-up",
+                        value=query.warmup,
+                        attr_name="warmup",
+                        bind_object=query,
+                        width_px=160,
+                    )
+                    ui.switch("Benchmark", value=query.benchmark).classes(
+                        "flex-grow w-[160px]"
+                    ).bind_value(query, "benchmark")
+                    ui.switch("I/O metrics", value=query.explain_io).classes(
+                        "flex-grow w-[160px]"
+                    ).bind_value(query, "explain_io")
+                with ui.row().classes("mx-auto items-stretch"):
+                    ui_int_input(
+                        label="?Statement timeout (ms)",
+                        value=query.statement_timeout_ms,
+                        attr_name="statement_timeout_ms",
+                        bind_object=query,
+                        width_px=200,
+                    )
+                    ui_int_input(
+                        label="?Lock timeout (ms)",
+                        value=query.lock_timeout_ms,
+                        attr_name="lock_timeout_ms",
+                        bind_object=query,
+                        width_px=200,
+                    )
+                    ui.select(
+                        ROLLBACK_OPTIONS, label="Writes", value=query.rollback
+                    ).classes("w-[200px]").bind_value(query, "rollback")
+                    ui.select(
+                        CACHE_MODE_OPTIONS, label="Cache", value=query.cache_mode
+                    ).classes("w-[200px]").bind_value(query, "cache_mode")
+                with ui.row().classes("mx-auto items-stretch"):
+                    ui.switch("Prepared", value=query.prepared).classes(
+                        "flex-grow w-[160px]"
+                    ).bind_value(query, "prepared")
+                    ui.select(
+                        PLAN_CACHE_MODE_OPTIONS,
+                        label="Plan cache",
+                        value=query.plan_cache_mode,
+                    ).classes("w-[200px]").bind_value(query, "plan_cache_mode")
+                    ui.switch("Compare plans", value=query.compare_plans).classes(
+                        "flex-grow w-[160px]"
+                    ).bind_value(query, "compare_plans")
 
             ui.textarea("Sql statement", value=query.sql).classes("w-full")._props(
                 "autogrow rows=3"
             ).style("height: full").bind_value(query, "sql")
 
+            if query.params is not None:
+                with ui.row().classes("w-full items-center gap-2"):
+                    ui.label(
+                        f"Parameters: {PARAM_SOURCE_OPTIONS[query.params.source]}"
+                    ).classes("w-[160px]")
+                    if query.params.source == ParamSource.RANGE:
+                        ui.label(
+                            f"{query.params.name} from {query.params.start} to "
+                            f"{query.params.stop} by {query.params.step}"
+                        )
+                    else:
+                        ui.textarea(
+                            "Parameter values", value=query.params.data
+                        ).classes("flex-grow")._props("autogrow rows=2").bind_value(
+                            query.params, "data"
+                        )
+
             ui.button(
                 on_click=lambda _, query=query: _delete_query_handler(queries, query),
                 icon="delete",
@@ -90,12 +180,41 @@ def _add_query_handler(
     add_sql: Any,
     add_repeat: Any,
     add_query_count: Any,
-):
+    add_verify_count: Any,
+    add_warmup: Any,
+    add_benchmark: Any,
+    add_explain_io: Any,
+    add_rollback: Any,
+    add_cache_mode: Any,
+    add_params_source: Any,
+    add_params_data: Any,
+    add_params_name: Any,
+    add_params_start: Any,
+    add_params_stop: Any,
+    add_params_step: Any,
+    add_params_limit: Any,
+    add_prepared: Any,
+    add_plan_cache_mode: Any,
+    add_compare_plans: Any,
+    add_statement_timeout: Any,
+    add_lock_timeout: Any,
+) -> None:
     "Takes add inputs from query UI, saves and adds the values of them to a db query object"
 
     query_id = str(uuid4())
 
     try:
+        params = None
+        if add_params_source.value is not None:
+            params = ParamSet(
+                source=add_params_source.value,
+                data=add_params_data.value or "",
+                name=add_params_name.value or None,
+                start=add_params_start.value or None,
+                stop=add_params_stop.value or None,
+                step=add_params_step.value or 1,
+                limit=int(add_params_limit.value or 100),
+            )
         db_query = Query(
             id=query_id,
             name=add_name.value,
@@ -103,10 +222,22 @@ def _add_query_handler(
             sql=add_sql.value,
             repeat=add_repeat.value,
             query_count=add_query_count.value,
+            verify_count=add_verify_count.value,
             active=True,
+            warmup=add_warmup.value,
+            benchmark=add_benchmark.value,
+            explain_io=add_explain_io.value,
+            rollback=add_rollback.value,
+            cache_mode=add_cache_mode.value,
+            params=params,
+            prepared=add_prepared.value,
+            plan_cache_mode=add_plan_cache_mode.value,
+            compare_plans=add_compare_plans.value,
+            statement_timeout_ms=add_statement_timeout.value,
+            lock_timeout_ms=add_lock_timeout.value,
         )
 
-        # Save in csv and add to UI
+        # Save in saves database and add to UI
         save_query(db_query)
         queries.add(db_query)
 
@@ -118,6 +249,24 @@ def _add_query_handler(
         add_sql.value = ""
         add_repeat.value = 0
         add_query_count.value = False
+        add_verify_count.value = False
+        add_warmup.value = 0
+        add_benchmark.value = False
+        add_explain_io.value = False
+        add_rollback.value = RollbackMode.OFF
+        add_cache_mode.value = CacheMode.ANY
+        add_params_source.value = None
+        add_params_data.value = ""
+        add_params_name.value = ""
+        add_params_start.value = ""
+        add_params_stop.value = ""
+        add_params_step.value = 1
+        add_params_limit.value = 100
+        add_prepared.value = False
+        add_plan_cache_mode.value = PlanCacheMode.AUTO
+        add_compare_plans.value = False
+        add_statement_timeout.value = 0
+        add_lock_timeout.value = 0
 
     except Exception as e:
         notify_popup(str(e), type="negative")
@@ -133,7 +282,7 @@ def _delete_query_handler(queries: QueryList, query: Query) -> None:
         return
 
 
-def _save_all_queries_handler(queries: QueryList):
+def _save_all_queries_handler(queries: QueryList) -> None:
     try:
         for query in queries.items:
             # Validate fields
@@ -146,10 +295,7 @@ def _save_all_queries_handler(queries: QueryList):
                     notify_popup(str(e), type="negative")
                     return
 
-        delete_all_queries()
-
-        for query in queries.items:
-            save_query(query)
+        save_all_queries(queries.items)
         _saved_queries_ui.refresh()
         notify_popup("Successfully saved all queries", type="positive")
     except Exception as e:
@@ -157,44 +303,22 @@ def _save_all_queries_handler(queries: QueryList):
         return
 
 
-def _ui_load_queries(queries: QueryList):
-    try:
-        saves_df = read_queries_saves_df()
-
-        saves_df = saves_df.replace({np.nan: None, pd.NA: None, pd.NaT: None})
-
-    except NoQueriesFoundError:
-        return
-
-    if saves_df.empty:
-        return
-
-    def process_query(query_row):
-        db_query_dict = {
-            "id": query_row["id"],
-            "name": query_row["name"],
-            "database_ids": (
-                parse_database_ids(query_row["database_ids"])
-            ),  # Parses list format
-            "sql": query_row["sql"],
-            "repeat": query_row["repeat"],
-            "query_count": bool(query_row["query_count"]),
-            "active": bool(query_row["active"]),
-        }
-        db_query = Query(**db_query_dict)
+def _ui_load_queries(queries: QueryList) -> None:
+    def process_query(db_query: Query) -> None:
         queries.add(db_query)
 
         try:
-            for db_id in db_query_dict["database_ids"]:
+            for db_id in db_query.database_ids:
                 find_database_instance(db_id)
         except NoDatabasesFoundError:
             warnings.warn(
-                f"{WarningEnum.WARNING}Didn't find database id for query {db_query_dict['id'][:6]}_{db_query_dict['name'][:50]}{WarningEnum.RESET}",
+                f"{WarningEnum.WARNING}Didn't find database id for query {db_query.id[:6]}_{db_query.name[:50]}{WarningEnum.RESET}",
                 stacklevel=2,
             )
 
     try:
-        saves_df = saves_df.apply(process_query, axis=1)
+        for db_query in read_queries():
+            process_query(db_query)
     except Exception as e:
         ui.label(str(e)).classes("text-red")
 
@@ -232,9 +356,94 @@ def _add_queries_component(queries: QueryList, databases: list[str]) -> None:
                 lambda: ui.number("?Repeat").classes("w-[160Bpx]"),
             )
             add_query_count = create_field_with_tooltip(
-                "(NB! Only for `SELECT` queries): Whether to perform an additional COUNT(*) query to check how many rows the execute returns",
+                "Whether to log how many rows the execute returns, read from the top node of the plan",
                 lambda: ui.switch("Query count").classes("mt-4 w-[160px]"),
             )
+            add_verify_count = create_field_with_tooltip(
+                "(NB! Only for `SELECT` queries): Whether to check the query count with an additional COUNT(*) query, once per database",
+                lambda: ui.switch("Verify count").classes("mt-4 w-[160px]"),
+            )
+            add_warmup = create_field_with_tooltip(
+                "Runs executed before the measured ones and discarded, to measure with warm caches",
+                lambda: ui.number("?Warm-up").classes("w-[160px]"),
+            )
+            add_benchmark = create_field_with_tooltip(
+                "Log a summary (min/median/p95/max/stddev) of execution, planning and node timings over the measured runs",
+                lambda: ui.switch("Benchmark").classes("mt-4 w-[160px]"),
+            )
+            add_explain_io = create_field_with_tooltip(
+                "Adds BUFFERS, WAL, SETTINGS and TIMING to the EXPLAIN options, logging the buffers, I/O timing (needs `track_io_timing`) and WAL of each node",
+                lambda: ui.switch("I/O metrics").classes("mt-4 w-[160px]"),
+            )
+        with ui.row().classes("mx-auto items-stretch"):
+            add_statement_timeout = create_field_with_tooltip(
+                "Cancels a statement running longer than this (ms) and logs it as timed out. Empty uses the STATEMENT_TIMEOUT_MS setting",
+                lambda: ui.number("?Statement timeout (ms)").classes("w-[200px]"),
+            )
+            add_lock_timeout = create_field_with_tooltip(
+                "Cancels a statement waiting longer than this (ms) for a lock. Empty uses the LOCK_TIMEOUT_MS setting",
+                lambda: ui.number("?Lock timeout (ms)").classes("w-[200px]"),
+            )
+            add_rollback = create_field_with_tooltip(
+                "For INSERT/UPDATE/DELETE/MERGE: Roll back undoes the writes of every statement, so repeats run against the same data. With savepoints, the repeats share one transaction and connection, rolled back to a savepoint after each",
+                lambda: ui.select(
+                    ROLLBACK_OPTIONS, label="Writes", value=RollbackMode.OFF
+                ).classes("w-[200px]"),
+            )
+            add_cache_mode = create_field_with_tooltip(
+                "Cache state the measured runs start from. Warm prewarms the tables and indexes of the plan (needs `pg_prewarm`) and runs at least one warm-up. Cold evicts them from shared buffers (needs `pg_buffercache` of PostgreSQL 17+), resets the session with DISCARD ALL and runs the COLD_CACHE_HOOK setting before each run",
+                lambda: ui.select(
+                    CACHE_MODE_OPTIONS, label="Cache", value=CacheMode.ANY
+                ).classes("w-[200px]"),
+            )
+        with ui.row().classes("mx-auto items-stretch"):
+            add_params_source = create_field_with_tooltip(
+                "Runs the query once for each row of values of its `:name` bind parameters, as a prepared statement. A JSON list of objects, CSV text with a header of the parameter names, a range of numbers or ISO dates, or a SQL query executed in each database, e.g. `SELECT id FROM users TABLESAMPLE SYSTEM (1)`",
+                lambda: ui.select(
+                    PARAM_SOURCE_OPTIONS, label="Parameters", value=None
+                ).classes("w-[200px]"),
+            )
+            add_params_name = create_field_with_tooltip(
+                "Parameter the range steps through",
+                lambda: ui.input("Range parameter").classes("w-[160px]"),
+            )
+            add_params_start = create_field_with_tooltip(
+                "First value of the range, a number or an ISO date (2024-01-31)",
+                lambda: ui.input("Start").classes("w-[160px]"),
+            )
+            add_params_stop = create_field_with_tooltip(
+                "Last value of the range, included",
+                lambda: ui.input("Stop").classes("w-[160px]"),
+            )
+            add_params_step = create_field_with_tooltip(
+                "Step of the range, in days for dates",
+                lambda: ui.number("Step", value=1).classes("w-[120px]"),
+            )
+            add_params_limit = create_field_with_tooltip(
+                "Most rows of values to run",
+                lambda: ui.number("Limit", value=100).classes("w-[120px]"),
+            )
+        add_params_data = create_field_with_tooltip(
+            'Values of a JSON list (`[{"id": 1}, {"id": 2}]`), CSV (`id\\n1\\n2`) or SQL query parameter set',
+            lambda: ui.textarea("Parameter values")._props("autogrow rows=2"),
+        )
+        with ui.row().classes("mx-auto items-stretch"):
+            add_prepared = create_field_with_tooltip(
+                "PREPAREs the statement once per database and explains its warm-ups and repeats with EXECUTE, like an application using prepared statements. Logs the planning time of the first and later executions. Always on with parameters",
+                lambda: ui.switch("Prepared").classes("mt-4 w-[160px]"),
+            )
+            add_plan_cache_mode = create_field_with_tooltip(
+                "`plan_cache_mode` of the prepared statements: Auto switches to a generic plan after 5 executions if it's not costlier, custom plans for the values of each execution, generic plans once for any values",
+                lambda: ui.select(
+                    PLAN_CACHE_MODE_OPTIONS,
+                    label="Plan cache",
+                    value=PlanCacheMode.AUTO,
+                ).classes("w-[200px]"),
+            )
+            add_compare_plans = create_field_with_tooltip(
+                "Executes the prepared statement with both custom and generic plans instead of the plan cache mode, and diffs the two plans",
+                lambda: ui.switch("Compare plans").classes("mt-4 w-[160px]"),
+            )
         add_sql = create_field_with_tooltip(
             "SQL statement with `EXPLAIN (ANALYZE, FORMAT JSON)` ",
             lambda: ui.textarea("Sql statement")
@@ -251,6 +460,24 @@ def _add_queries_component(queries: QueryList, databases: list[str]) -> None:
                 add_sql=add_sql,
                 add_repeat=add_repeat,
                 add_query_count=add_query_count,
+                add_verify_count=add_verify_count,
+                add_warmup=add_warmup,
+                add_benchmark=add_benchmark,
+                add_explain_io=add_explain_io,
+                add_rollback=add_rollback,
+                add_cache_mode=add_cache_mode,
+                add_params_source=add_params_source,
+                add_params_data=add_params_data,
+                add_params_name=add_params_name,
+                add_params_start=add_params_start,
+                add_params_stop=add_params_stop,
+                add_params_step=add_params_step,
+                add_params_limit=add_params_limit,
+                add_prepared=add_prepared,
+                add_plan_cache_mode=add_plan_cache_mode,
+                add_compare_plans=add_compare_plans,
+                add_statement_timeout=add_statement_timeout,
+                add_lock_timeout=add_lock_timeout,
             ),
         ).classes("mt-auto")
 
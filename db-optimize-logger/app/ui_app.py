@@ -1,8 +1,11 @@
 from nicegui import ui
 
+from app.execute.run_archive import archive_enabled
 from app.ui.pages import databases_page, main_page, queries_page
 
 if __name__ in {"__main__", "__mp_main__"}:
+    # Warns at startup if runs should be archived but pyarrow is missing
+    archive_enabled()
     main_page()
     queries_page()
     databases_page()
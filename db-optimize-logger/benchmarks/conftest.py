@@ -0,0 +1,7 @@
+import pytest
+
+
+def pytest_generate_tests(metafunc: pytest.Metafunc) -> None:
+    if "size" in metafunc.fixturenames:
+        sizes = metafunc.config.getoption("plan_sizes").split(",")
+        metafunc.parametrize("size", [int(size) for size in sizes])
@@ -0,0 +1,14 @@
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+
+def peak_mib(build: Callable[[], Any]) -> float:
+    "Returns the peak traced memory of `build` in MiB"
+    tracemalloc.start()
+    try:
+        build()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 2**20, 3)
@@ -0,0 +1,257 @@
+"""
+Synthetic `EXPLAIN (ANALYZE, FORMAT JSON)` plans to benchmark plan processing
+without a database.
+
+Each shape takes the number of nodes to generate, the plans come close to it
+without going over.
+"""
+
+from collections.abc import Callable
+from typing import Any
+
+
+def plan_node(
+    node_type: str,
+    plans: list[dict[str, Any]] | None = None,
+    *,
+    time: float = 0.05,
+    rows: int = 100,
+    **properties: Any,
+) -> dict[str, Any]:
+    node: dict[str, Any] = {
+        "Node Type": node_type,
+        "Parallel Aware": False,
+        "Startup Cost": 0.0,
+        "Total Cost": 35.5,
+        "Plan Rows": rows,
+        "Plan Width": 36,
+        "Actual Startup Time": 0.01,
+        "Actual Total Time": time,
+        "Actual Rows": rows,
+        "Actual Loops": 1,
+        **properties,
+    }
+    if plans:
+        node["Plans"] = plans
+    return node
+
+
+def scan_node(relation: str, *, time: float = 0.05, rows: int = 100) -> dict[str, Any]:
+    return plan_node(
+        "Seq Scan",
+        time=time,
+        rows=rows,
+        **{
+            "Parent Relationship": "Member",
+            "Relation Name": relation,
+            "Schema": "public",
+            "Alias": relation,
+            "Filter": "(created_at > now())",
+            "Rows Removed by Filter": 0,
+        },
+    )
+
+
+def explain_dump(plan: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "Plan": plan,
+        "Planning Time": 1.5,
+        "Triggers": [],
+        "Execution Time": plan["Actual Total Time"] + 0.2,
+    }
+
+
+def wide_append_plan(partitions: int) -> dict[str, Any]:
+    "Append over `partitions` partition scans, like a query on a partitioned table"
+    children = [scan_node(f"events_p{i}") for i in range(partitions)]
+    return explain_dump(
+        plan_node(
+            "Append",
+            children,
+            time=0.05 * partitions + 1,
+            rows=100 * partitions,
+            **{"Subplans Removed": 0},
+        )
+    )
+
+
+def wide_append(nodes: int) -> dict[str, Any]:
+    return wide_append_plan(max(1, nodes - 1))
+
+
+def nested_loop_chain(depth: int, chain: int) -> dict[str, Any]:
+    "Nested Loops `depth` deep, each with an Index Scan as inner side"
+    node = scan_node(f"orders_{chain}")
+    for level in range(depth):
+        inner = plan_node(
+            "Index Scan",
+            **{
+                "Parent Relationship": "Inner",
+                "Scan Direction": "Forward",
+                "Index Name": f"items_{level}_pkey",
+                "Relation Name": f"items_{level}",
+                "Alias": f"i{level}",
+                "Index Cond": f"(id = o.item_{level}_id)",
+            },
+        )
+        node = plan_node(
+            "Nested Loop",
+            [node, inner],
+            time=node["Actual Total Time"] + 0.05,
+            **{"Join Type": "Inner", "Inner Unique": True},
+        )
+    return node
+
+
+def deep_nested_loop(nodes: int, *, depth: int = 32) -> dict[str, Any]:
+    """
+    Append over chains of Nested Loops `depth` deep, the tree lines of these get
+    the longest prefixes
+    """
+    chain_nodes = 2 * depth + 1
+    chains = [
+        nested_loop_chain(depth, i) for i in range(max(1, (nodes - 1) // chain_nodes))
+    ]
+    return explain_dump(
+        plan_node("Append", chains, time=sum(c["Actual Total Time"] for c in chains))
+    )
+
+
+def parallel_gather(nodes: int) -> dict[str, Any]:
+    "Parallel aggregate over a Parallel Append, like a parallel partitioned scan"
+    partitions = max(1, nodes - 4)
+    scans = [
+        plan_node(
+            "Seq Scan",
+            time=0.2,
+            **{
+                "Parent Relationship": "Member",
+                "Parallel Aware": True,
+                "Relation Name": f"events_p{i}",
+                "Alias": f"events_p{i}",
+                "Actual Loops": 3,
+            },
+        )
+        for i in range(partitions)
+    ]
+    # Nodes under a Gather run in the leader and each launched worker
+    parallel_append = plan_node(
+        "Append",
+        scans,
+        time=0.2 * partitions,
+        **{"Parallel Aware": True, "Actual Loops": 3},
+    )
+    partial_aggregate = plan_node(
+        "Aggregate",
+        [parallel_append],
+        time=0.2 * partitions + 1,
+        **{
+            "Strategy": "Plain",
+            "Partial Mode": "Partial",
+            "Group Key": [],
+            "Actual Loops": 3,
+        },
+    )
+    gather = plan_node(
+        "Gather",
+        [partial_aggregate],
+        time=0.2 * partitions + 2,
+        **{"Workers Planned": 2, "Workers Launched": 2, "Single Copy": False},
+    )
+    return explain_dump(
+        plan_node(
+            "Aggregate",
+            [gather],
+            time=0.2 * partitions + 3,
+            **{"Strategy": "Plain", "Partial Mode": "Finalize", "Group Key": []},
+        )
+    )
+
+
+def ctes(nodes: int) -> dict[str, Any]:
+    "CTEs of an aggregated scan each, read by CTE Scans under an Append"
+    cte_count = max(1, (nodes - 1) // 3)
+    children = []
+    for i in range(cte_count):
+        children.append(
+            plan_node(
+                "Aggregate",
+                [scan_node(f"events_{i}")],
+                time=0.5,
+                **{
+                    "Parent Relationship": "InitPlan",
+                    "Subplan Name": f"CTE c{i}",
+                    "Strategy": "Hashed",
+                    "Group Key": ["user_id"],
+                },
+            )
+        )
+    for i in range(cte_count):
+        children.append(
+            plan_node(
+                "CTE Scan",
+                time=0.6,
+                **{
+                    "Parent Relationship": "Member",
+                    "CTE Name": f"c{i}",
+                    "Alias": f"c{i}",
+                },
+            )
+        )
+    return explain_dump(
+        plan_node("Append", children, time=0.6 * cte_count + 0.5 * cte_count)
+    )
+
+
+def subquery_ctes(nodes: int) -> dict[str, Any]:
+    """
+    Subqueries under an Append each reading their own CTE, all named `c`, like
+    `UNION ALL` of queries with the same `WITH` clause
+    """
+    subqueries = []
+    for i in range(max(1, (nodes - 1) // 4)):
+        cte = plan_node(
+            "Aggregate",
+            [scan_node(f"events_{i}")],
+            time=0.1 * (i % 10 + 1),
+            **{
+                "Parent Relationship": "InitPlan",
+                "Subplan Name": "CTE c",
+                "Strategy": "Hashed",
+                "Group Key": ["user_id"],
+            },
+        )
+        cte_scan = plan_node(
+            "CTE Scan",
+            time=cte["Actual Total Time"] + 0.1,
+            **{"Parent Relationship": "Outer", "CTE Name": "c", "Alias": "c"},
+        )
+        # The CTE is attached to the top node of its subquery, above the CTE Scan
+        subqueries.append(
+            plan_node(
+                "Aggregate",
+                [cte, cte_scan],
+                time=cte_scan["Actual Total Time"] + 0.1,
+                **{
+                    "Parent Relationship": "Member",
+                    "Strategy": "Plain",
+                    "Group Key": [],
+                },
+            )
+        )
+    return explain_dump(
+        plan_node(
+            "Append",
+            subqueries,
+            time=sum(s["Actual Total Time"] for s in subqueries) + 0.5,
+        )
+    )
+
+
+SHAPES: dict[str, Callable[[int], dict[str, Any]]] = {
+    "deep_nested_loop": deep_nested_loop,
+    "wide_append": wide_append,
+    "parallel_gather": parallel_gather,
+    "ctes": ctes,
+    "subquery_ctes": subquery_ctes,
+}
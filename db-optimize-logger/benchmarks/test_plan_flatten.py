@@ -0,0 +1,80 @@
+"""
+Times building the explain records of a plan (node metrics, graph nodes, graph edges
+and level divider) from node columns, against the previous approach of per-node
+dicts read back with `Series.str` lookups.
+
+Run from `db-optimize-logger`:
+    python -m pytest benchmarks/test_plan_flatten.py --plan-sizes 10000
+"""
+
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+import pandas as pd
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from app.core.interface import NodeEnum as NE
+from app.execute.node_graph_plan import (
+    iter_graph_edges,
+    iter_graph_nodes,
+    iter_level_lines,
+    iter_node_metrics,
+)
+from app.execute.node_process import extract_nodes, flatten_plan
+from benchmarks.measure import peak_mib
+from benchmarks.synthetic_plans import wide_append
+
+
+def build_from_columns(plan: dict[str, Any]) -> None:
+    columns = flatten_plan(plan)
+    for iter_records in [
+        iter_node_metrics,
+        iter_graph_nodes,
+        iter_graph_edges,
+        iter_level_lines,
+    ]:
+        deque(iter_records(columns), maxlen=0)
+
+
+def build_from_node_series(plan: dict[str, Any]) -> None:
+    "Reference of the per-node dict approach, reads every column with `Series.str`"
+    node_series = pd.Series(extract_nodes(plan))
+    keys = [
+        NE.INDEX,
+        NE.NODE_TYPE,
+        NE.TIMING_MS,
+        NE.TIMING_PROPORTION,
+        NE.NODE_TYPE_DETAIL,
+        NE.ACTUAL_ROWS,
+        NE.TOTAL_COST,
+        NE.ACTUAL_TOTAL_TIME,
+        NE.ACTUAL_STARTUP_TIME,
+        NE.DESCRIPTION,
+    ]
+    pd.DataFrame({key.value: node_series.str[key] for key in keys})
+    pd.DataFrame(
+        {
+            key.value: node_series.str.get(key).astype(str)
+            for key in [*keys, NE.NODE_ID, NE.TIMING, NE.TIMING_COLOR]
+        }
+    )
+    pd.DataFrame(
+        {
+            key.value: node_series.str.get(key).astype(str)
+            for key in [NE.NODE_ID, NE.PARENT_NODE]
+        }
+    ).dropna()
+    node_series.apply(lambda node: "    " * node[NE.DEPTH.value])
+
+
+@pytest.mark.parametrize("build", [build_from_node_series, build_from_columns])
+def test_build_records(
+    benchmark: BenchmarkFixture, size: int, build: Callable[[dict[str, Any]], None]
+) -> None:
+    plan = wide_append(size)["Plan"]
+
+    benchmark.group = f"plan_flatten {size}"
+    benchmark.extra_info["peak_mib"] = peak_mib(lambda: build(plan))
+    benchmark(build, plan)
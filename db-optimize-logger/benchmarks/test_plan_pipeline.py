@@ -0,0 +1,83 @@
+"""
+Times each step of processing a plan into records, for synthetic plans of several
+shapes and sizes. The peak traced memory of each step is kept in its `extra_info`.
+
+Run from `db-optimize-logger`:
+    python -m pytest benchmarks/test_plan_pipeline.py --plan-sizes 10,1000,100000
+    python -m pytest benchmarks --benchmark-autosave
+    python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=min:20%
+"""
+
+import logging
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from app.core.utils import log_key_value
+from app.execute.node_graph_plan import (
+    iter_graph_edges,
+    iter_graph_nodes,
+    iter_level_lines,
+    iter_node_metrics,
+)
+from app.execute.node_process import extract_nodes, flatten_plan
+from app.execute.plan_diff import diff_plans
+from app.logs.sink import LokiPushSink, Record
+from benchmarks.measure import peak_mib
+from benchmarks.synthetic_plans import SHAPES
+
+# Logger without handlers, so formatting the log lines is measured without I/O
+null_logger = logging.getLogger("benchmarks.null")
+null_logger.addHandler(logging.NullHandler())
+null_logger.propagate = False
+null_logger.setLevel(logging.INFO)
+
+
+def plan_steps(plan: dict[str, Any]) -> dict[str, Callable[[], Any]]:
+    "Steps of processing `plan`, each taking the output of the ones before as given"
+    columns = flatten_plan(plan)
+    records = [
+        Record(null_logger, {"db_name": "db", "query_name": "q", "node": row}, "node")
+        for iter_records in [iter_node_metrics, iter_graph_nodes, iter_graph_edges]
+        for row in iter_records(columns)
+    ]
+
+    def log_lines() -> None:
+        for record in records:
+            log_key_value(record.logger, record.fields)
+
+    loki_sink = LokiPushSink("http://localhost/loki/api/v1/push")
+    batch = [(r.logger, r.fields, r.record_type, 0) for r in records]
+
+    return {
+        "extract_nodes": lambda: extract_nodes(plan),
+        "flatten_plan": lambda: flatten_plan(plan),
+        # Consumed without keeping the records, as they're streamed to the sink
+        "iter_node_metrics": lambda: deque(iter_node_metrics(columns), maxlen=0),
+        "iter_graph_nodes": lambda: deque(iter_graph_nodes(columns), maxlen=0),
+        "iter_graph_edges": lambda: deque(iter_graph_edges(columns), maxlen=0),
+        "iter_level_lines": lambda: deque(iter_level_lines(columns), maxlen=0),
+        "diff_plans": lambda: diff_plans(plan, plan),
+        "log_lines": log_lines,
+        "loki_payload": lambda: loki_sink._payload(batch),
+    }
+
+
+STEPS = list(plan_steps(SHAPES["wide_append"](10)["Plan"]))
+
+
+@pytest.mark.parametrize("step", STEPS)
+@pytest.mark.parametrize("shape", list(SHAPES))
+def test_plan_step(
+    benchmark: BenchmarkFixture, shape: str, size: int, step: str
+) -> None:
+    plan = SHAPES[shape](size)["Plan"]
+    build = plan_steps(plan)[step]
+
+    benchmark.group = f"{shape} {size}"
+    benchmark.extra_info["nodes"] = len(flatten_plan(plan))
+    benchmark.extra_info["peak_mib"] = peak_mib(build)
+    benchmark(build)
@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+# Settings required at import of `app.core.config`, unused without Docker and Loki
+os.environ.setdefault("NETWORK", "test")
+os.environ.setdefault("LOKI_CONFIG_HOST_PATH", "/tmp/loki")
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--plan-sizes",
+        default="10,1000,10000",
+        help="Comma separated node counts of the plans benchmarked",
+    )
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from app.execute.node_process import (
+    FAST_TIMING_COLOR,
+    TIMING_COLORS,
+    calc_timing_color,
+    flatten_plan,
+)
+from benchmarks.synthetic_plans import SHAPES, plan_node, scan_node
+
+
+def test_nested_loop_inner_side_counts_all_loops() -> None:
+    plan = plan_node(
+        "Nested Loop",
+        [
+            scan_node("users", time=2.0),
+            plan_node(
+                "Index Scan",
+                time=0.05,
+                **{
+                    "Relation Name": "orders",
+                    "Alias": "orders",
+                    "Index Name": "orders_user_id_idx",
+                    "Actual Loops": 100,
+                },
+            ),
+        ],
+        time=10.0,
+    )
+
+    columns = flatten_plan(plan)
+
+    assert columns.inclusive_ms.tolist() == [10.0, 2.0, 5.0]
+    assert columns.timing_ms.tolist() == [3.0, 2.0, 5.0]
+
+
+def test_gather_divides_worker_loops_by_processes() -> None:
+    plan = plan_node(
+        "Gather",
+        [scan_node("orders", time=10.0) | {"Parallel Aware": True, "Actual Loops": 3}],
+        time=12.0,
+        **{"Workers Launched": 2},
+    )
+
+    columns = flatten_plan(plan)
+
+    assert columns.processes == [1, 3]
+    assert columns.timing_ms.tolist() == [2.0, 10.0]
+
+
+def test_cte_is_paid_by_its_scan() -> None:
+    plan = plan_node(
+        "Aggregate",
+        [
+            scan_node("orders", time=5.0) | {"Subplan Name": "CTE c"},
+            plan_node("CTE Scan", time=8.0, **{"CTE Name": "c", "Alias": "c"}),
+        ],
+        time=10.0,
+    )
+
+    columns = flatten_plan(plan)
+
+    # The CTE plan isn't subtracted from the Aggregate, only from its CTE Scan
+    assert columns.cte_scan_rows == {1: [2]}
+    assert columns.timing_ms.tolist() == [2.0, 5.0, 3.0]
+
+
+def test_subplan_is_subtracted_from_its_parent() -> None:
+    plan = plan_node(
+        "Seq Scan",
+        [
+            plan_node(
+                "Index Scan",
+                time=0.1,
+                **{
+                    "Parent Relationship": "SubPlan",
+                    "Subplan Name": "SubPlan 1",
+                    "Relation Name": "orders",
+                    "Alias": "orders",
+                    "Index Name": "orders_pkey",
+                    "Actual Loops": 100,
+                },
+            )
+        ],
+        time=20.0,
+        **{"Relation Name": "users", "Alias": "users"},
+    )
+
+    columns = flatten_plan(plan)
+
+    assert columns.timing_ms.tolist() == [10.0, 10.0]
+    assert columns.timing_proportion.tolist() == [0.5, 0.5]
+
+
+@pytest.mark.parametrize("size", [10, 1000])
+@pytest.mark.parametrize("shape", list(SHAPES))
+def test_exclusive_times_sum_to_root(shape: str, size: int) -> None:
+    columns = flatten_plan(SHAPES[shape](size)["Plan"])
+
+    # Each node's times are rounded to 3 decimals
+    assert np.isclose(
+        columns.timing_ms.sum(), columns.inclusive_ms[0], atol=0.001 * len(columns)
+    )
+
+
+def test_timing_colors_match_per_node_color() -> None:
+    columns = flatten_plan(SHAPES["deep_nested_loop"](100)["Plan"])
+
+    assert columns.timing_color == [
+        calc_timing_color(proportion) for proportion in columns.timing_proportion
+    ]
+
+
+@pytest.mark.parametrize(
+    ("proportion", "color"),
+    [
+        (1.0, TIMING_COLORS[0][1]),
+        (0.5, TIMING_COLORS[0][1]),
+        (0.49, TIMING_COLORS[1][1]),
+        (0.1, TIMING_COLORS[1][1]),
+        (0.09, FAST_TIMING_COLOR),
+        (0.0, FAST_TIMING_COLOR),
+    ],
+)
+def test_calc_timing_color(proportion: float, color: str) -> None:
+    assert calc_timing_color(proportion) == color
@@ -0,0 +1,68 @@
+import pytest
+from pydantic import ValidationError
+
+from app.execute.params import InvalidParamSetError, ParamSet, ParamSource, _range_rows
+
+
+def range_set(start: str, stop: str, step: float = 1, limit: int = 100) -> ParamSet:
+    return ParamSet(
+        source=ParamSource.RANGE,
+        name="value",
+        start=start,
+        stop=stop,
+        step=step,
+        limit=limit,
+    )
+
+
+def values(param_set: ParamSet) -> list[object]:
+    return [row["value"] for row in _range_rows(param_set)]
+
+
+def test_integer_range_includes_stop() -> None:
+    assert values(range_set("1", "5", step=2)) == [1, 3, 5]
+
+
+def test_float_steps_dont_drift() -> None:
+    steps = values(range_set("0", "1", step=0.1))
+
+    assert len(steps) == 11
+    assert steps[3] == 0.3
+    assert steps[-1] == 1
+
+
+def test_date_range_steps_whole_days() -> None:
+    assert values(range_set("2024-02-27", "2024-03-05", step=3)) == [
+        "2024-02-27",
+        "2024-03-01",
+        "2024-03-04",
+    ]
+
+
+def test_range_stops_at_limit() -> None:
+    assert values(range_set("1", "1000000", limit=3)) == [1, 2, 3]
+
+
+def test_range_past_stop_is_empty() -> None:
+    assert values(range_set("10", "1")) == []
+
+
+@pytest.mark.parametrize(
+    ("start", "stop", "step"),
+    [
+        ("1", "2024-01-01", 1),  # Number and date bounds
+        ("2024-01-01", "2024-01-10", 0.5),  # Part of a day
+        ("a", "b", 1),
+        ("1", "10", 0),
+    ],
+)
+def test_invalid_range_is_rejected(start: str, stop: str, step: float) -> None:
+    with pytest.raises(ValidationError):
+        range_set(start, stop, step=step)
+
+
+def test_range_without_name_is_rejected() -> None:
+    param_set = ParamSet(source=ParamSource.RANGE, start="1", stop="2")
+
+    with pytest.raises(InvalidParamSetError):
+        _range_rows(param_set)
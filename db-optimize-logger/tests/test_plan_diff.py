@@ -0,0 +1,62 @@
+from app.execute.plan_diff import diff_plans
+from benchmarks.synthetic_plans import plan_node, scan_node
+
+
+def test_nodes_are_matched_by_relation_then_position() -> None:
+    plan_a = plan_node(
+        "Hash Join",
+        [
+            scan_node("orders", time=4.0),
+            plan_node("Hash", [scan_node("users", time=2.0)], time=2.5),
+        ],
+        time=8.0,
+        **{"Join Type": "Inner", "Hash Cond": "(orders.user_id = users.id)"},
+    )
+    plan_b = plan_node(
+        "Nested Loop",
+        [
+            scan_node("orders", time=4.0),
+            plan_node(
+                "Index Scan",
+                time=0.5,
+                **{
+                    "Relation Name": "users",
+                    "Alias": "users",
+                    "Index Name": "users_pkey",
+                },
+            ),
+        ],
+        time=5.0,
+        **{"Join Type": "Inner"},
+    )
+
+    node_diffs = diff_plans(plan_a, plan_b)
+
+    assert [
+        (diff["change"], diff["node_type_a"], diff["node_type_b"])
+        for diff in node_diffs
+    ] == [
+        ("type_changed", "Hash Join", "Nested Loop"),
+        ("same", "Seq Scan", "Seq Scan"),
+        # The Hash's position is taken by the users scan, matched by relation
+        ("removed", "Hash", None),
+        ("type_changed", "Seq Scan", "Index Scan"),
+    ]
+    assert node_diffs[3]["relation"] == "users"
+    assert node_diffs[3]["timing_ms_delta"] == -1.5
+
+
+def test_added_nodes_are_listed_after_plan_a() -> None:
+    plan_a = plan_node("Limit", [scan_node("users")])
+    plan_b = plan_node(
+        "Limit", [plan_node("Sort", [scan_node("users")], time=0.08)], time=0.1
+    )
+
+    node_diffs = diff_plans(plan_a, plan_b)
+
+    assert [(diff["change"], diff["node_type_b"]) for diff in node_diffs] == [
+        ("same", "Limit"),
+        ("same", "Seq Scan"),
+        ("added", "Sort"),
+    ]
+    assert node_diffs[2]["node_type_a"] is None
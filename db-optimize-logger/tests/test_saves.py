@@ -0,0 +1,75 @@
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from app.execute import saves
+from app.execute.saves import SavesIndex, load_items, migrate_csv_once, upsert_item
+
+
+@pytest.fixture(autouse=True)
+def saves_db(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    path = tmp_path / "saves.db"
+    monkeypatch.setattr(saves, "SAVES_DB", path)
+    return path
+
+
+def migrate(csv_path: Path, items: list[tuple[str, str]]) -> None:
+    migrate_csv_once(
+        name="queries_csv",
+        table="queries",
+        csv_path=csv_path,
+        read_items=lambda: items,
+    )
+
+
+def test_csv_is_imported_once(tmp_path: Path) -> None:
+    csv_path = tmp_path / "queries.csv"
+    csv_path.write_text("id,data\n")
+
+    migrate(csv_path, [("a", "1")])
+    csv_path.write_text("id,data\n")
+    migrate(csv_path, [("b", "2")])
+
+    assert load_items("queries") == [("a", "1")]
+    assert csv_path.exists()
+    assert (tmp_path / "queries.csv.migrated").exists()
+
+
+def test_csv_added_later_is_imported(tmp_path: Path) -> None:
+    csv_path = tmp_path / "queries.csv"
+
+    migrate(csv_path, [("a", "1")])
+    assert load_items("queries") == []
+
+    csv_path.write_text("id,data\n")
+    migrate(csv_path, [("a", "1")])
+
+    assert load_items("queries") == [("a", "1")]
+    assert not csv_path.exists()
+
+
+def test_index_only_reloads_on_writes_to_its_table() -> None:
+    loads = {"queries": 0, "databases": 0}
+
+    def loader(table: str) -> Callable[[], dict[str, str]]:
+        def load() -> dict[str, str]:
+            loads[table] += 1
+            return dict(load_items(table))
+
+        return load
+
+    queries = SavesIndex("queries", load=loader("queries"))
+    databases = SavesIndex("databases", load=loader("databases"))
+    assert queries.items() == {} and databases.items() == {}
+
+    upsert_item("databases", "db", "1")
+
+    assert databases.items() == {"db": "1"}
+    assert queries.items() == {}
+    assert loads == {"queries": 1, "databases": 2}
+
+    upsert_item("queries", "q", "1")
+
+    assert queries.get("q") == "1"
+    assert loads == {"queries": 2, "databases": 2}
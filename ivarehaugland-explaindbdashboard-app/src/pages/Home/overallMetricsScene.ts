@@ -39,7 +39,7 @@ export function overallMetricsScene() {
     queries: [
       {
         ...queryRunner.state.queries[0],
-        expr: `{job="vector"} |= \`explain_logger\` != \`level_divide\` |= \`total_exc_time\` | json | keep message_total_exc_time, message_query_name | line_format \`{{.message_total_exc_time}} {{.message_query_name}}\``,
+        expr: `{job="vector", logger="explain_logger", record_type="explain"} |= \`total_exc_time\` | json | keep message_total_exc_time, message_query_name | line_format \`{{.message_total_exc_time}} {{.message_query_name}}\``,
       },
     ],
   });
@@ -75,7 +75,7 @@ export function overallMetricsScene() {
     queries: [
       {
         ...queryRunner.state.queries[0],
-        expr: `{job="vector"} |= \`explain_logger\` |= \`db_name\` != \`level_divide\``,
+        expr: `{job="vector", logger="explain_logger", record_type="explain"}`,
       },
     ],
   });
@@ -139,7 +139,7 @@ export function overallMetricsScene() {
     queries: [
       {
         ...queryRunner.state.queries[0],
-        expr: `{job="vector"} |= \`db_logger\` |= \`db_name\` != \`level_divide\``,
+        expr: `{job="vector", logger="db_logger", record_type="database"}`,
       },
     ],
   });
@@ -180,6 +180,338 @@ export function overallMetricsScene() {
     ],
   });
 
+  const benchmarkSummaryRunner = new SceneQueryRunner({
+    datasource: DATASOURCE_REF,
+    queries: [
+      {
+        ...queryRunner.state.queries[0],
+        expr: `{job="vector", logger="benchmark_logger", record_type="summary"}`,
+      },
+    ],
+  });
+
+  const benchmarkSummaryData = new SceneDataTransformer({
+    $data: benchmarkSummaryRunner,
+    transformations: [
+      {
+        id: 'extractFields',
+        options: {
+          delimiter: ',',
+          keepTime: false,
+          replace: true,
+          source: 'Line',
+        },
+      },
+      {
+        id: 'extractFields',
+        options: {
+          delimiter: ',',
+          replace: true,
+          source: 'message',
+        },
+      },
+      {
+        id: 'organize',
+        options: {
+          excludeByName: {
+            record_type: true,
+          },
+          includeByName: {},
+          indexByName: {
+            db_name: 0,
+            query_name: 1,
+            runs: 2,
+            warmup_runs: 3,
+          },
+          renameByName: {},
+        },
+      },
+      {
+        id: 'convertFieldType',
+        options: {
+          fields: {},
+          conversions: [
+            {
+              targetField: 'runs',
+              destinationType: 'number',
+            },
+            {
+              targetField: 'warmup_runs',
+              destinationType: 'number',
+            },
+            {
+              targetField: 'planning_time_first',
+              destinationType: 'number',
+            },
+            {
+              targetField: 'generic_plans',
+              destinationType: 'number',
+            },
+            ...['execution_time', 'planning_time', 'planning_time_later'].flatMap((prefix) =>
+              ['min', 'median', 'p95', 'max', 'stddev'].map((stat) => ({
+                targetField: `${prefix}_${stat}`,
+                destinationType: 'number' as const,
+              }))
+            ),
+          ],
+        },
+      },
+    ],
+  });
+
+  const timedOutRunner = new SceneQueryRunner({
+    datasource: DATASOURCE_REF,
+    queries: [
+      {
+        ...queryRunner.state.queries[0],
+        expr: `{job="vector", logger="explain_logger", record_type="explain"} |= \`"status":"timeout"\``,
+      },
+    ],
+  });
+
+  const timedOutData = new SceneDataTransformer({
+    $data: timedOutRunner,
+    transformations: [
+      {
+        id: 'extractFields',
+        options: {
+          delimiter: ',',
+          keepTime: false,
+          replace: true,
+          source: 'Line',
+        },
+      },
+      {
+        id: 'extractFields',
+        options: {
+          delimiter: ',',
+          replace: true,
+          source: 'message',
+        },
+      },
+      {
+        id: 'organize',
+        options: {
+          excludeByName: {
+            status: true,
+          },
+          includeByName: {},
+          indexByName: {
+            db_name: 0,
+            query_name: 1,
+            error: 2,
+            statement_timeout_ms: 3,
+            lock_timeout_ms: 4,
+            sql: 5,
+          },
+          renameByName: {},
+        },
+      },
+    ],
+  });
+
+  const paramSweepRunner = new SceneQueryRunner({
+    datasource: DATASOURCE_REF,
+    queries: [
+      {
+        ...queryRunner.state.queries[0],
+        expr: `{job="vector", logger="explain_logger", record_type="explain"} |= \`"status":"ok"\` |= \`"param_index"\``,
+      },
+    ],
+  });
+
+  const paramSweepData = new SceneDataTransformer({
+    $data: paramSweepRunner,
+    transformations: [
+      {
+        id: 'extractFields',
+        options: {
+          delimiter: ',',
+          keepTime: false,
+          replace: true,
+          source: 'Line',
+        },
+      },
+      {
+        id: 'extractFields',
+        options: {
+          delimiter: ',',
+          replace: true,
+          source: 'message',
+        },
+      },
+      {
+        id: 'organize',
+        options: {
+          excludeByName: {
+            status: true,
+            sql: true,
+          },
+          includeByName: {},
+          indexByName: {
+            db_name: 0,
+            query_name: 1,
+            param_index: 2,
+            params: 3,
+            total_exc_time: 4,
+            plan_cache_mode: 5,
+          },
+          renameByName: {},
+        },
+      },
+      {
+        id: 'convertFieldType',
+        options: {
+          fields: {},
+          conversions: [
+            {
+              targetField: 'param_index',
+              destinationType: 'number',
+            },
+            {
+              targetField: 'total_exc_time',
+              destinationType: 'number',
+            },
+          ],
+        },
+      },
+      {
+        id: 'sortBy',
+        options: {
+          sort: [
+            {
+              field: 'param_index',
+            },
+          ],
+        },
+      },
+    ],
+  });
+
+  const planDiffRunner = new SceneQueryRunner({
+    datasource: DATASOURCE_REF,
+    queries: [
+      {
+        ...queryRunner.state.queries[0],
+        expr: `{job="vector", logger="plan_diff_logger", record_type="plan_diff"}`,
+      },
+    ],
+  });
+
+  const planDiffData = new SceneDataTransformer({
+    $data: planDiffRunner,
+    transformations: [
+      {
+        id: 'extractFields',
+        options: {
+          delimiter: ',',
+          keepTime: false,
+          replace: true,
+          source: 'Line',
+        },
+      },
+      {
+        id: 'extractFields',
+        options: {
+          delimiter: ',',
+          replace: true,
+          source: 'message',
+        },
+      },
+      {
+        id: 'organize',
+        options: {
+          excludeByName: {
+            record_type: true,
+          },
+          includeByName: {},
+          indexByName: {
+            query_name: 0,
+            a: 1,
+            b: 2,
+            execution_time_delta: 3,
+            type_changed: 4,
+            added: 5,
+            removed: 6,
+          },
+          renameByName: {},
+        },
+      },
+      {
+        id: 'convertFieldType',
+        options: {
+          fields: {},
+          conversions: [
+            'nodes_a',
+            'nodes_b',
+            'type_changed',
+            'added',
+            'removed',
+            ...['execution_time', 'planning_time'].flatMap((prefix) =>
+              ['a', 'b', 'delta'].map((side) => `${prefix}_${side}`)
+            ),
+          ].map((targetField) => ({
+            targetField,
+            destinationType: 'number' as const,
+          })),
+        },
+      },
+    ],
+  });
+
+  const nodeDiffRunner = new SceneQueryRunner({
+    datasource: DATASOURCE_REF,
+    queries: [
+      {
+        ...queryRunner.state.queries[0],
+        expr: `{job="vector", logger="plan_diff_logger", record_type="node_diff"} != \`"change":"same"\``,
+      },
+    ],
+  });
+
+  const nodeDiffData = new SceneDataTransformer({
+    $data: nodeDiffRunner,
+    transformations: [
+      {
+        id: 'extractFields',
+        options: {
+          delimiter: ',',
+          keepTime: false,
+          replace: true,
+          source: 'Line',
+        },
+      },
+      {
+        id: 'extractFields',
+        options: {
+          delimiter: ',',
+          replace: true,
+          source: 'message',
+        },
+      },
+      {
+        id: 'organize',
+        options: {
+          excludeByName: {
+            record_type: true,
+          },
+          includeByName: {},
+          indexByName: {
+            query_name: 0,
+            change: 1,
+            relation: 2,
+            node_type_a: 3,
+            node_type_b: 4,
+            timing_ms_delta: 5,
+            rows_error_a: 6,
+            rows_error_b: 7,
+          },
+          renameByName: {},
+        },
+      },
+    ],
+  });
+
   return new EmbeddedScene({
     $timeRange: timeRange,
     body: new SceneFlexLayout({
@@ -283,7 +615,7 @@ export function overallMetricsScene() {
                 links: [
                   {
                     title: '',
-                    url: 'http://localhost:3000/a/ivarehaugland-explaindbdashboard-app/home/per-query-metrics?from=now-72h&to=now&timezone=browser&var-query_name=${__data.fields.query_name}',
+                    url: 'http://localhost:3000/a/ivarehaugland-explaindbdashboard-app/home/per-query-metrics?from=now-72h&to=now&timezone=browser&var-query_name=${__data.fields.query_name}&var-db_name=${__data.fields.db_name}',
                   },
                 ],
               },
@@ -459,6 +791,249 @@ export function overallMetricsScene() {
             },
           }),
         }),
+        new SceneFlexItem({
+          width: 1700,
+          minWidth: 400,
+          minHeight: 500,
+          body: new VizPanel({
+            $data: benchmarkSummaryData,
+            pluginId: 'table',
+            title: 'Benchmark Summaries',
+            fieldConfig: {
+              defaults: {
+                custom: {
+                  align: 'auto',
+                  cellOptions: {
+                    type: 'auto',
+                    wrapText: false,
+                  },
+                  inspect: true,
+                },
+                mappings: [],
+                links: [],
+              },
+              overrides: [
+                {
+                  matcher: {
+                    id: 'byRegexp',
+                    options: '(execution|planning)_time_.*',
+                  },
+                  properties: [
+                    {
+                      id: 'unit',
+                      value: 'ms',
+                    },
+                  ],
+                },
+              ],
+            },
+            options: {
+              showHeader: true,
+              cellHeight: 'sm',
+              sortBy: [
+                {
+                  desc: true,
+                  displayName: 'execution_time_median',
+                },
+              ],
+            },
+          }),
+        }),
+        new SceneFlexItem({
+          width: 1700,
+          minWidth: 400,
+          minHeight: 300,
+          body: new VizPanel({
+            $data: timedOutData,
+            pluginId: 'table',
+            title: 'Timed Out Statements',
+            fieldConfig: {
+              defaults: {
+                custom: {
+                  align: 'auto',
+                  cellOptions: {
+                    type: 'auto',
+                    wrapText: false,
+                  },
+                  inspect: true,
+                },
+                mappings: [],
+                links: [],
+              },
+              overrides: [],
+            },
+            options: {
+              showHeader: true,
+              cellHeight: 'sm',
+            },
+          }),
+        }),
+        new SceneFlexItem({
+          width: 850,
+          minWidth: 400,
+          minHeight: 400,
+          body: new VizPanel({
+            $data: paramSweepData,
+            pluginId: 'trend',
+            title: 'Execution Time by Parameter Row',
+            fieldConfig: {
+              defaults: {
+                unit: 'ms',
+                custom: {
+                  drawStyle: 'points',
+                  pointSize: 6,
+                },
+              },
+              overrides: [],
+            },
+            options: {
+              xField: 'param_index',
+              legend: {
+                showLegend: true,
+                displayMode: 'list',
+                placement: 'bottom',
+              },
+            },
+          }),
+        }),
+        new SceneFlexItem({
+          width: 850,
+          minWidth: 400,
+          minHeight: 400,
+          body: new VizPanel({
+            $data: paramSweepData,
+            pluginId: 'table',
+            title: 'Parameter Sweeps',
+            fieldConfig: {
+              defaults: {
+                custom: {
+                  align: 'auto',
+                  cellOptions: {
+                    type: 'auto',
+                    wrapText: false,
+                  },
+                  inspect: true,
+                },
+                mappings: [],
+                links: [],
+              },
+              overrides: [
+                {
+                  matcher: {
+                    id: 'byName',
+                    options: 'total_exc_time',
+                  },
+                  properties: [
+                    {
+                      id: 'unit',
+                      value: 'ms',
+                    },
+                  ],
+                },
+              ],
+            },
+            options: {
+              showHeader: true,
+              cellHeight: 'sm',
+            },
+          }),
+        }),
+        new SceneFlexItem({
+          width: 1700,
+          minWidth: 400,
+          minHeight: 400,
+          body: new VizPanel({
+            $data: planDiffData,
+            pluginId: 'table',
+            title: 'Plan Diffs',
+            fieldConfig: {
+              defaults: {
+                custom: {
+                  align: 'auto',
+                  cellOptions: {
+                    type: 'auto',
+                    wrapText: false,
+                  },
+                  inspect: true,
+                },
+                mappings: [],
+                links: [],
+              },
+              overrides: [
+                {
+                  matcher: {
+                    id: 'byRegexp',
+                    options: '(timing_ms|execution_time|planning_time)_.*',
+                  },
+                  properties: [
+                    {
+                      id: 'unit',
+                      value: 'ms',
+                    },
+                  ],
+                },
+              ],
+            },
+            options: {
+              showHeader: true,
+              cellHeight: 'sm',
+              sortBy: [
+                {
+                  desc: true,
+                  displayName: 'execution_time_delta',
+                },
+              ],
+            },
+          }),
+        }),
+        new SceneFlexItem({
+          width: 1700,
+          minWidth: 400,
+          minHeight: 400,
+          body: new VizPanel({
+            $data: nodeDiffData,
+            pluginId: 'table',
+            title: 'Changed Plan Nodes',
+            fieldConfig: {
+              defaults: {
+                custom: {
+                  align: 'auto',
+                  cellOptions: {
+                    type: 'auto',
+                    wrapText: false,
+                  },
+                  inspect: true,
+                },
+                mappings: [],
+                links: [],
+              },
+              overrides: [
+                {
+                  matcher: {
+                    id: 'byRegexp',
+                    options: '(timing_ms|execution_time|planning_time)_.*',
+                  },
+                  properties: [
+                    {
+                      id: 'unit',
+                      value: 'ms',
+                    },
+                  ],
+                },
+              ],
+            },
+            options: {
+              showHeader: true,
+              cellHeight: 'sm',
+              sortBy: [
+                {
+                  desc: true,
+                  displayName: 'timing_ms_delta',
+                },
+              ],
+            },
+          }),
+        }),
       ],
     }),
     controls: [
@@ -23,14 +23,33 @@ export function perQueryMetricScene() {
     to: 'now',
   });
 
+  // The query name of a record is structured metadata rather than a label, so the
+  // panels match it as a regex, which the links of the overall metrics set to a
+  // single query and All to every query
   const queryNameVariable = new QueryVariable({
     datasource: DATASOURCE_REF,
     name: 'query_name',
     label: 'query_name',
-    value: 'query_name',
+    includeAll: true,
+    defaultToAll: true,
+    allValue: '.*',
     query: {
       refId: 'A',
       label: 'query_name',
+      stream: '{job="vector", logger="explain_logger", record_type="explain"}',
+    },
+  });
+
+  const dbNameVariable = new QueryVariable({
+    datasource: DATASOURCE_REF,
+    name: 'db_name',
+    label: 'db_name',
+    includeAll: true,
+    defaultToAll: true,
+    allValue: '.+',
+    query: {
+      refId: 'A',
+      label: 'db_name',
     },
   });
 
@@ -54,12 +73,12 @@ export function perQueryMetricScene() {
       {
         ...queryRunner.state.queries[0],
         refId: 'Nodes',
-        expr: '{job="vector"} |= `graph_node_logger` |= `$query_name` |= `mainstat`',
+        expr: '{job="vector", logger="graph_node_logger", record_type="graph_node", db_name=~"$db_name"} | query_name=~`${query_name:regex}`',
       },
       {
         ...queryRunner.state.queries[0],
         refId: 'Edges',
-        expr: '{job="vector"} |= `graph_node_logger` |= `$query_name` |= `source`',
+        expr: '{job="vector", logger="graph_node_logger", record_type="graph_edge", db_name=~"$db_name"} | query_name=~`${query_name:regex}`',
       },
     ],
   });
@@ -160,7 +179,7 @@ export function perQueryMetricScene() {
     queries: [
       {
         ...queryRunner.state.queries[0],
-        expr: `{job="vector"} |= \`explain_logger\`|= \`$query_name\` |= \`level_divide\``,
+        expr: `{job="vector", logger="explain_logger", record_type="level_divide", db_name=~"$db_name"} | query_name=~\`${query_name:regex}\``,
       },
     ],
   });
@@ -206,7 +225,7 @@ export function perQueryMetricScene() {
     queries: [
       {
         ...queryRunner.state.queries[0],
-        expr: `{job="vector"} |= \`graph_node_logger\` != \`source\` or \`target\` or \`mainstat\` |= \`$query_name\``,
+        expr: `{job="vector", logger="graph_node_logger", record_type="node_metrics", db_name=~"$db_name"} | query_name=~\`${query_name:regex}\``,
       },
     ],
   });
@@ -243,7 +262,7 @@ export function perQueryMetricScene() {
         id: 'filterFieldsByName',
         options: {
           include: {
-            pattern: '^(?!(edge|description)).*',
+            pattern: '^(?!(edge|description|node_id|run_id|query_key|repeat)).*',
           },
         },
       },
@@ -267,6 +286,10 @@ export function perQueryMetricScene() {
               destinationType: 'number',
               targetField: 'timing_pct',
             },
+            {
+              destinationType: 'number',
+              targetField: 'inclusive_ms',
+            },
             {
               destinationType: 'number',
               targetField: 'Actual Rows',
@@ -283,6 +306,46 @@ export function perQueryMetricScene() {
               destinationType: 'number',
               targetField: 'Actual Startup Time',
             },
+            {
+              destinationType: 'number',
+              targetField: 'shared_hit_blocks',
+            },
+            {
+              destinationType: 'number',
+              targetField: 'shared_read_blocks',
+            },
+            {
+              destinationType: 'number',
+              targetField: 'shared_dirtied_blocks',
+            },
+            {
+              destinationType: 'number',
+              targetField: 'shared_written_blocks',
+            },
+            {
+              destinationType: 'number',
+              targetField: 'temp_read_blocks',
+            },
+            {
+              destinationType: 'number',
+              targetField: 'temp_written_blocks',
+            },
+            {
+              destinationType: 'number',
+              targetField: 'io_read_time_ms',
+            },
+            {
+              destinationType: 'number',
+              targetField: 'io_write_time_ms',
+            },
+            {
+              destinationType: 'number',
+              targetField: 'wal_bytes',
+            },
+            {
+              destinationType: 'number',
+              targetField: 'cache_hit_ratio',
+            },
           ],
           fields: {},
         },
@@ -295,7 +358,7 @@ export function perQueryMetricScene() {
     queries: [
       {
         ...queryRunner.state.queries[0],
-        expr: `{job="vector"} |= \`explain_logger\` |= \`$query_name\` |= \`db_name\` != \`level_divide\` | json | line_format \`{{.message_sql}}\``,
+        expr: `{job="vector", logger="explain_logger", record_type="explain", db_name=~"$db_name"} | query_name=~\`${query_name:regex}\` | json | line_format \`{{.message_sql}}\``,
       },
     ],
   });
@@ -305,7 +368,7 @@ export function perQueryMetricScene() {
     queries: [
       {
         ...queryRunner.state.queries[0],
-        expr: `{job="vector"} |= \`explain_logger\` != \`level_divide\` | json | keep message_count, message_total_exc_time, message_query_name | line_format \`{{.message_total_exc_time}} {{.message_query_name}}\``,
+        expr: `{job="vector", logger="explain_logger", record_type="explain", db_name=~"$db_name"} | json | keep message_count, message_total_exc_time, message_query_name | line_format \`{{.message_total_exc_time}} {{.message_query_name}}\``,
       },
     ],
   });
@@ -390,7 +453,7 @@ export function perQueryMetricScene() {
     queries: [
       {
         ...queryRunner.state.queries[0],
-        expr: `{ job="vector" } |= \`"source_type":"explain_file_json"\` |= \`$query_name\` | json`,
+        expr: `{job="vector", logger="explain_file", record_type="explain_json"} | query_name=~\`${query_name:regex}\` | json`,
       },
     ],
   });
@@ -462,7 +525,7 @@ export function perQueryMetricScene() {
 
   return new EmbeddedScene({
     $timeRange: timeRange,
-    $variables: new SceneVariableSet({ variables: [queryNameVariable] }),
+    $variables: new SceneVariableSet({ variables: [queryNameVariable, dbNameVariable] }),
     body: new SceneFlexLayout({
       wrap: 'wrap',
       direction: 'row',
@@ -582,7 +645,7 @@ export function perQueryMetricScene() {
                 {
                   matcher: {
                     id: 'byRegexp',
-                    options: '(.*)(timing_ms|Time)(.*)',
+                    options: '(.*)(timing_ms|inclusive_ms|Time)(.*)',
                   },
                   properties: [
                     {
@@ -675,6 +738,46 @@ export function perQueryMetricScene() {
                     },
                   ],
                 },
+                {
+                  matcher: {
+                    id: 'byRegexp',
+                    options: '^io_(read|write)_time_ms$',
+                  },
+                  properties: [
+                    {
+                      id: 'unit',
+                      value: 'ms',
+                    },
+                  ],
+                },
+                {
+                  matcher: {
+                    id: 'byName',
+                    options: 'wal_bytes',
+                  },
+                  properties: [
+                    {
+                      id: 'unit',
+                      value: 'bytes',
+                    },
+                  ],
+                },
+                {
+                  matcher: {
+                    id: 'byName',
+                    options: 'cache_hit_ratio',
+                  },
+                  properties: [
+                    {
+                      id: 'unit',
+                      value: 'percentunit',
+                    },
+                    {
+                      id: 'custom.width',
+                      value: 110,
+                    },
+                  ],
+                },
                 {
                   matcher: {
                     id: 'byName',